@@ -0,0 +1,362 @@
+# accounts.py
+"""
+Sync many mailboxes from one process.
+
+accounts.json (ACCOUNTS_PATH) lists the accounts:
+    [
+      {"id": "alice"},
+      {"id": "bob", "application_id": "...", "client_secret_env": "BOB_CLIENT_SECRET", "interval_seconds": 600}
+    ]
+application_id / the secret default to APPLICATION_ID / CLIENT_SECRET. Everything an
+account keeps on disk lives under ACCOUNTS_DIR/<id>/: emails.db (emails, tasks, delta
+cursor), token_cache.json, refresh_token.txt and sync.lock.
+
+    python accounts.py login alice    # first sign-in (authorization code prompt)
+    python accounts.py sync [ids...]  # one pass over the accounts, then exit
+    python accounts.py run            # keep syncing every account on its interval
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from analysis_pool import AnalysisPool, ANALYSIS_WORKERS
+from coordinator import ProcessLock
+from email_processor import sync_emails
+from graph_client import GraphClient, GRAPH_MAX_CONCURRENCY
+from metrics import get_logger, log_event
+from ms_graph import TokenProvider, get_token_provider
+from scheduler import SYNC_INTERVAL_SECONDS, SYNC_JITTER_SECONDS
+from store import EmailStore, use_store
+
+# ==========================
+# Config
+# ==========================
+
+ACCOUNTS_PATH = Path(os.getenv("ACCOUNTS_PATH", "accounts.json"))
+ACCOUNTS_DIR = Path(os.getenv("ACCOUNTS_DIR", "accounts"))
+# Accounts synced at the same time; each holds one chunk of bodies + its store while it runs
+ACCOUNT_SYNC_CONCURRENCY = int(os.getenv("ACCOUNT_SYNC_CONCURRENCY", "4"))
+# Failing accounts retry after 60s, 120s, ... up to this
+ACCOUNT_RETRY_MAX_SECONDS = float(os.getenv("ACCOUNT_RETRY_MAX_SECONDS", "3600"))
+ACCOUNT_RETRY_BASE_SECONDS = 60.0
+
+SCOPE = ["User.Read", "Mail.ReadWrite"]
+# Account ids become directory names
+ACCOUNT_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._@-]*$")
+
+log = get_logger("accounts")
+
+
+class Account:
+    """
+    One mailbox: its credentials, its files under ACCOUNTS_DIR/<id>/, and its sync state.
+    Nothing heavy is kept between syncs; the store is opened only while syncing.
+    """
+
+    def __init__(
+        self,
+        account_id: str,
+        application_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        interval: float = SYNC_INTERVAL_SECONDS,
+        root: Path = ACCOUNTS_DIR,
+    ):
+        if not ACCOUNT_ID_RE.match(account_id):
+            raise ValueError(f"Invalid account id {account_id!r}")
+        self.id = account_id
+        self.application_id = application_id or os.getenv("APPLICATION_ID")
+        self.client_secret = client_secret or os.getenv("CLIENT_SECRET")
+        self.interval = interval
+        self.dir = Path(root) / account_id
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.next_due = 0.0
+        self.last_success_at: Optional[float] = None
+        self.last_duration_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_result: Any = None
+
+    @property
+    def db_path(self) -> Path:
+        return self.dir / "emails.db"
+
+    @property
+    def lock_path(self) -> Path:
+        return self.dir / "sync.lock"
+
+    def token_provider(self, interactive: bool = False) -> TokenProvider:
+        if not self.application_id or not self.client_secret:
+            raise RuntimeError(f"Account {self.id}: application id or client secret missing")
+        return get_token_provider(
+            self.application_id,
+            self.client_secret,
+            SCOPE,
+            cache_path=str(self.dir / "token_cache.json"),
+            refresh_token_path=str(self.dir / "refresh_token.txt"),
+            interactive=interactive,
+        )
+
+    def get_token(self) -> str:
+        return self.token_provider().get_token()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": "running" if self.running else "idle",
+            "runs": self.runs,
+            "failures": self.failures,
+            "next_sync_in_seconds": None if self.running else round(max(0.0, self.next_due - time.time()), 1),
+            "last_success_at": self.last_success_at,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_error": self.last_error,
+            "last_result": self.last_result,
+        }
+
+
+def load_accounts(path: Path = ACCOUNTS_PATH, root: Path = ACCOUNTS_DIR) -> List[Account]:
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    accounts: List[Account] = []
+    seen = set()
+    for entry in entries:
+        account_id = str(entry["id"])
+        if account_id in seen:
+            raise ValueError(f"Account {account_id!r} is listed twice in {path}")
+        seen.add(account_id)
+        secret_env = entry.get("client_secret_env")
+        accounts.append(Account(
+            account_id,
+            application_id=entry.get("application_id"),
+            client_secret=os.getenv(secret_env) if secret_env else None,
+            interval=float(entry.get("interval_seconds", SYNC_INTERVAL_SECONDS)),
+            root=root,
+        ))
+    return accounts
+
+
+# ==========================
+# Scheduler
+# ==========================
+
+class AccountScheduler:
+    """
+    Syncs many accounts concurrently from one process.
+    - One Graph connection pool and one AnalysisPool (one spaCy copy per worker) serve
+      every account; each account's Graph client has its own in-flight cap
+      (GRAPH_ACCOUNT_MAX_CONCURRENCY) and its analysis takes turns with the others
+    - At most `concurrency` syncs run at once, earliest due first, never two of the same
+      account; a mailbox doing a huge backfill holds one slot, the rest keep turning
+    - Per-account isolation: own token cache, delta cursor, store and lock file; the
+      store is opened for a sync and closed after it, so memory follows the syncs in
+      flight, not the number of accounts
+    - Failing accounts back off exponentially instead of retrying every tick
+    """
+
+    def __init__(
+        self,
+        accounts: List[Account],
+        graph: GraphClient,
+        pool: Optional[AnalysisPool] = None,
+        concurrency: int = ACCOUNT_SYNC_CONCURRENCY,
+        jitter: float = SYNC_JITTER_SECONDS,
+    ):
+        self.accounts: Dict[str, Account] = {a.id: a for a in accounts}
+        self.graph = graph
+        self.pool = pool
+        self.concurrency = max(1, concurrency)
+        self.jitter = jitter
+
+        # (next_due, seq, account id); entries whose due time no longer matches the account are stale
+        self._due: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+        now = time.time()
+        for account in self.accounts.values():
+            self._schedule(account, now)
+
+    def _schedule(self, account: Account, when: float) -> None:
+        account.next_due = when
+        heapq.heappush(self._due, (when, next(self._seq), account.id))
+        self._changed.set()
+
+    def trigger(self, account_id: str) -> None:
+        """Sync this account as soon as a slot is free."""
+        account = self.accounts[account_id]
+        if not account.running:
+            self._schedule(account, time.time())
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work(), name=f"account-sync-{i}") for i in range(self.concurrency)
+            ]
+
+    async def serve(self) -> None:
+        """start() and run until cancelled."""
+        self.start()
+        await asyncio.gather(*self._workers)
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _next_account(self) -> Account:
+        while True:
+            self._changed.clear()
+            while self._due:
+                when, _, account_id = self._due[0]
+                account = self.accounts[account_id]
+                if account.running or when != account.next_due:
+                    heapq.heappop(self._due)  # stale
+                    continue
+                wait = when - time.time()
+                if wait <= 0:
+                    heapq.heappop(self._due)
+                    return account
+                break
+            else:
+                wait = None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            account = await self._next_account()
+            try:
+                await self.run_account(account)
+            except Exception:
+                pass  # recorded on the account; the next run is already scheduled
+
+    async def run_account(self, account: Account) -> Any:
+        """Sync one account now and schedule its next run."""
+        account.running = True
+        started = time.time()
+        delay = account.interval
+        try:
+            result = await self.sync_account(account)
+        except Exception as e:
+            account.failures += 1
+            account.consecutive_failures += 1
+            account.last_error = str(e)
+            delay = min(ACCOUNT_RETRY_MAX_SECONDS, ACCOUNT_RETRY_BASE_SECONDS * 2 ** (account.consecutive_failures - 1))
+            log_event(log, logging.WARNING, "account_sync_failed", account=account.id, error=str(e), retry_in=delay)
+            raise
+        else:
+            account.consecutive_failures = 0
+            account.last_success_at = time.time()
+            account.last_error = None
+            account.last_result = result
+            delay = account.interval + random.uniform(0, self.jitter)
+            log_event(
+                log, logging.INFO, "account_sync_done",
+                account=account.id, seconds=round(time.time() - started, 3), **result,
+            )
+            return result
+        finally:
+            account.runs += 1
+            account.running = False
+            account.last_duration_seconds = round(time.time() - started, 3)
+            self._schedule(account, time.time() + delay)
+
+    async def sync_account(self, account: Account) -> Dict[str, int]:
+        account.dir.mkdir(parents=True, exist_ok=True)
+        # another process (or an older daemon) may be syncing the same account
+        lock = ProcessLock(str(account.lock_path))
+        await lock.acquire()
+        try:
+            store = EmailStore(account.db_path, namespace=account.id)
+            try:
+                with use_store(store):
+                    return await sync_emails(self.graph.for_account(account.get_token), self.pool)
+            finally:
+                store.close()
+        finally:
+            lock.release()
+
+    async def run_all_once(self, account_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """One sync of each account (all of them by default), `concurrency` at a time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(account: Account) -> Any:
+            async with semaphore:
+                try:
+                    return await self.run_account(account)
+                except Exception as e:
+                    return {"error": str(e)}
+
+        selected = [self.accounts[a] for a in account_ids] if account_ids else list(self.accounts.values())
+        results = await asyncio.gather(*(one(a) for a in selected))
+        return {a.id: r for a, r in zip(selected, results)}
+
+    def status(self) -> Dict[str, Any]:
+        accounts = [a.status() for a in self.accounts.values()]
+        return {
+            "accounts": len(accounts),
+            "running": sum(1 for a in accounts if a["state"] == "running"),
+            "concurrency": self.concurrency,
+            "failing": sorted(a["id"] for a in self.accounts.values() if a.consecutive_failures),
+            "per_account": accounts,
+        }
+
+
+# ==========================
+# CLI entrypoint
+# ==========================
+
+async def run(command: str, account_ids: List[str]) -> None:
+    accounts = load_accounts()
+    pool = AnalysisPool() if ANALYSIS_WORKERS > 0 else None
+    # the pool owner never sends requests itself; accounts go through for_account()
+    async with GraphClient(lambda: "", max_concurrency=GRAPH_MAX_CONCURRENCY) as graph:
+        if pool is not None:
+            await pool.start()
+        scheduler = AccountScheduler(accounts, graph, pool)
+        try:
+            if command == "sync":
+                print(json.dumps(await scheduler.run_all_once(account_ids or None), indent=2, default=str))
+                return
+            await scheduler.serve()
+        finally:
+            await scheduler.stop()
+            if pool is not None:
+                await pool.stop()
+
+
+def main() -> None:
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "login" and len(sys.argv) == 3:
+        account = next(a for a in load_accounts() if a.id == sys.argv[2])
+        account.dir.mkdir(parents=True, exist_ok=True)
+        account.token_provider(interactive=True).get_token()
+        print(f"Signed in {account.id}; tokens cached in {account.dir}")
+    elif command in ("sync", "run"):
+        asyncio.run(run(command, sys.argv[2:]))
+    else:
+        print("usage: python accounts.py [login <id> | sync [ids...] | run]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# analysis_cache.py
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from metrics import ANALYSIS_CACHE_LOOKUPS
+
+# ==========================
+# Config
+# ==========================
+
+ANALYSIS_CACHE_PATH = Path(os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db"))
+# Persistent entries kept (LRU); 0 disables the cache
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+# Hot entries also kept in memory so repeats within a process skip SQLite
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MEMORY_ENTRIES", "2048"))
+# Hits are recorded in memory and their last_used written this many at a time (one transaction)
+ANALYSIS_CACHE_TOUCH_BATCH = int(os.getenv("ANALYSIS_CACHE_TOUCH_BATCH", "512"))
+# Eviction frees this fraction of max_entries at once, so it runs every so many inserts, not every put
+ANALYSIS_CACHE_EVICT_FRACTION = float(os.getenv("ANALYSIS_CACHE_EVICT_FRACTION", "0.05"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    last_used   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+"""
+
+
+def make_fingerprint(*parts: Any) -> str:
+    """Stable hash of everything that can change an analysis result (model, patterns, regexes...)."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent memo of analyze_email results, keyed by sha256(fingerprint + cleaned text).
+    - The fingerprint is part of the key, so a model or pattern change never hits the old
+      results; those are left to LRU eviction, not deleted on open, because processes on
+      different pattern versions (hot reload) share the file and would wipe each other's
+    - Bounded: least recently used entries are evicted past max_entries. The entry count
+      is kept as a running total (recounted only when it says the cache is full), and an
+      eviction frees ANALYSIS_CACHE_EVICT_FRACTION of the cache so the next one is a while off
+    - last_used is written in batches of ANALYSIS_CACHE_TOUCH_BATCH hits (and with every put),
+      not per lookup; recency is approximate by at most one batch
+    - Values are stored as JSON and decoded per lookup, so callers get their own copy
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        path: Path = ANALYSIS_CACHE_PATH,
+        max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+        memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+    ):
+        self.fingerprint = fingerprint
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._touched: Dict[str, int] = {}  # key -> last_used not written yet
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._size = self._count()
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        keys = [self.key(t) for t in texts]
+        found: Dict[str, str] = {}
+
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            unique_missing = list(dict.fromkeys(missing))
+            for i in range(0, len(unique_missing), 500):
+                chunk = unique_missing[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = value
+                    self._remember(key, value)
+
+            if found:
+                now = time.time_ns()
+                self._touched.update(dict.fromkeys(found, now))
+                if len(self._touched) >= ANALYSIS_CACHE_TOUCH_BATCH:
+                    cur = self._conn.cursor()
+                    cur.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._flush_touched(cur)
+                        cur.execute("COMMIT")
+                    except BaseException:
+                        cur.execute("ROLLBACK")
+                        raise
+
+            results = [json.loads(found[k]) if k in found else None for k in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        ANALYSIS_CACHE_LOOKUPS.inc(hits, result="hit")
+        ANALYSIS_CACHE_LOOKUPS.inc(len(results) - hits, result="miss")
+        return results
+
+    def _flush_touched(self, cur: sqlite3.Cursor) -> None:
+        """Write the last_used of recent hits (inside the caller's transaction)."""
+        if self._touched:
+            cur.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def put_many(self, texts: List[str], results: List[Dict[str, Any]]) -> None:
+        if not texts:
+            return
+        now = time.time_ns()
+        rows: Dict[str, tuple] = {}
+        with self._lock:
+            for text, result in zip(texts, results):
+                key = self.key(text)
+                value = json.dumps(result, ensure_ascii=False)
+                self._remember(key, value)
+                rows[key] = (key, self.fingerprint, value, now)
+
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touched(cur)
+                # new keys insert, known ones only refresh: the inserts are what the running count adds
+                before = self._conn.total_changes
+                cur.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)", rows.values())
+                inserted = self._conn.total_changes - before
+                if inserted < len(rows):
+                    cur.executemany(
+                        # last_used != now: not the rows just inserted
+                        "UPDATE entries SET value = ?, last_used = ? WHERE key = ? AND last_used != ?",
+                        [(value, used, key, used) for key, _, value, used in rows.values()],
+                    )
+                self._size += inserted
+                if self._size > self.max_entries:
+                    self._evict(cur)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                self._size = self._count()
+                raise
+
+    def _evict(self, cur: sqlite3.Cursor) -> None:
+        """Drop the least recently used entries, down to max_entries less the eviction headroom."""
+        # other processes share the file: the running count only covers this one's inserts
+        self._size = cur.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if self._size <= self.max_entries:
+            return
+        target = self.max_entries - int(self.max_entries * ANALYSIS_CACHE_EVICT_FRACTION)
+        overflow = self._size - target
+        cur.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+            (overflow,),
+        )
+        self._size -= overflow
+        self.evictions += overflow
+
+    def size(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "entries": self.size(),
+            "max_entries": self.max_entries,
+            "fingerprint": self.fingerprint[:12],
+        }
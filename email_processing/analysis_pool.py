@@ -0,0 +1,253 @@
+# analysis_pool.py
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from metrics import get_logger, log_event
+
+log = get_logger("analysis_pool")
+
+# ==========================
+# Config
+# ==========================
+
+# Worker processes for analysis; 0 = analyze inline in a thread (no pool)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+# Max messages waiting for a worker; submit() blocks once it's full (backpressure)
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "1024"))
+# Messages handed to a worker per job (one nlp.pipe call)
+ANALYSIS_POOL_BATCH_SIZE = int(os.getenv("ANALYSIS_POOL_BATCH_SIZE", "16"))
+
+Priority = Tuple[Any, ...]
+
+
+# ==========================
+# Worker process side
+# ==========================
+
+def _init_worker() -> None:
+    # Runs once per process: load spaCy (or build the rule matcher) and open the analysis cache
+    from email_processor import warmup
+
+    warmup()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _analyze_batch(labels: List[Optional[str]], texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    from email_processor import analyze_new_messages
+
+    return analyze_new_messages(labels, texts)
+
+
+# ==========================
+# Pool
+# ==========================
+
+class AnalysisPool:
+    """
+    Process pool for analyze_emails, fed from a bounded priority queue.
+    - Each worker loads the NER pipeline once (initializer) and then analyzes batches of
+      cleaned texts; the analysis cache is shared through its SQLite file
+    - Lowest priority tuple first: sync_emails passes (read?, -received) so unread and
+      newest mail is analyzed first
+    - The queue is bounded: submit() waits while it's full instead of buffering a whole backfill
+    - analyze() yields results batch by batch, so callers can store them as they finish
+    - A batch the worker fails on (or a crashed worker) resolves to None summaries, like
+      per-message failures, so the sync keeps those messages for retry
+    - Several mailboxes (accounts.py) share the pool fairly: texts submitted with a tenant
+      take turns with other tenants' texts a batch at a time, so one backfill can't
+      push everyone else's new mail to the back of the queue
+    """
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_WORKERS,
+        queue_size: int = ANALYSIS_QUEUE_SIZE,
+        batch_size: int = ANALYSIS_POOL_BATCH_SIZE,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._seq = itertools.count()  # FIFO among equal priorities
+        # Fair queueing between tenants: each tenant's texts get consecutive rounds of
+        # batch_size, a round never earlier than the one being dispatched now
+        self._rounds: Dict[str, int] = {}
+        self._current_round = 0
+
+        self.ready = False
+        self.submitted = 0
+        self.completed = 0
+        self.batches = 0
+        self.in_flight = 0
+
+    async def start(self) -> None:
+        """Spawn the workers and wait until they answer (i.e. the model is loaded)."""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # spawn, not fork: the API process has threads (and maybe a loaded model) already
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        # Two batches per worker in flight, so a worker never idles while results travel back
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch(), name=f"analysis-dispatch-{i}")
+            for i in range(self.workers * 2)
+        ]
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+        self.ready = True
+
+    async def stop(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+
+        # Anything still queued will never run
+        while self._queue is not None and not self._queue.empty():
+            future = self._queue.get_nowait()[-1]
+            if not future.done():
+                future.cancel()
+
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        self.ready = False
+
+    def _round(self, tenant: Optional[str]) -> int:
+        if tenant is None:
+            return 0
+        position = max(self._rounds.get(tenant, 0), self._current_round * self.batch_size)
+        self._rounds[tenant] = position + 1
+        return position // self.batch_size
+
+    async def submit(
+        self,
+        text: str,
+        priority: Priority = (),
+        label: Optional[str] = None,
+        tenant: Optional[str] = None,
+    ) -> asyncio.Future:
+        """
+        Queue one cleaned text; waits while the queue is full.
+        The returned future resolves to its summary dict (None if analysis failed).
+        tenant: the mailbox this text belongs to, when several share the pool
+        """
+        if self._queue is None:
+            raise RuntimeError("AnalysisPool.start() has not been called")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((self._round(tenant), priority), next(self._seq), label, text, future))
+        self.submitted += 1
+        return future
+
+    async def analyze(
+        self,
+        texts: Sequence[str],
+        priorities: Optional[Sequence[Priority]] = None,
+        labels: Optional[Sequence[Optional[str]]] = None,
+        tenant: Optional[str] = None,
+    ) -> AsyncIterator[List[Tuple[int, Optional[Dict[str, Any]]]]]:
+        """
+        Analyze texts through the pool, yielding [(index into texts, summary or None)]
+        as batches finish. Texts are submitted in priority order, so priority holds
+        even when there are more texts than the queue can take.
+        """
+        finished: asyncio.Queue = asyncio.Queue()
+        order = sorted(range(len(texts)), key=lambda i: priorities[i]) if priorities else range(len(texts))
+
+        async def produce() -> None:
+            try:
+                for i in order:
+                    future = await self.submit(
+                        texts[i],
+                        priorities[i] if priorities else (),
+                        labels[i] if labels else None,
+                        tenant,
+                    )
+                    future.add_done_callback(lambda f, i=i: finished.put_nowait((i, f)))
+            except Exception as e:
+                finished.put_nowait((None, e))
+
+        producer = asyncio.create_task(produce())
+        try:
+            remaining = len(texts)
+            while remaining:
+                done = [await finished.get()]
+                while not finished.empty():
+                    done.append(finished.get_nowait())
+
+                results: List[Tuple[int, Optional[Dict[str, Any]]]] = []
+                for i, outcome in done:
+                    if i is None:
+                        raise outcome
+                    # failures are None already; only a cancelled job (pool stopping) raises here
+                    results.append((i, outcome.result()))
+                remaining -= len(results)
+                yield results
+        finally:
+            producer.cancel()
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self._queue.get()]
+            while len(jobs) < self.batch_size and not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+            jobs = [job for job in jobs if not job[-1].done()]
+            if not jobs:
+                continue
+            self._current_round = max(self._current_round, jobs[-1][0][0])
+
+            self.in_flight += len(jobs)
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    _analyze_batch,
+                    [job[2] for job in jobs],
+                    [job[3] for job in jobs],
+                )
+            except asyncio.CancelledError:
+                for job in jobs:
+                    job[-1].cancel()
+                raise
+            except Exception as e:
+                log_event(log, logging.ERROR, "analysis_batch_failed", messages=len(jobs), error=str(e))
+                for job in jobs:
+                    if not job[-1].done():
+                        job[-1].set_result(None)
+            else:
+                for job, result in zip(jobs, results):
+                    if not job[-1].done():
+                        job[-1].set_result(result)
+                self.completed += len(jobs)
+                self.batches += 1
+            finally:
+                self.in_flight -= len(jobs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "ready": self.ready,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+        }
@@ -1,11 +1,107 @@
 # api.py
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+
+from email_processor import (
+    sync_emails,
+    sync_message_ids,
+    make_graph_client,
+    get_analysis_cache,
+    warmup,
+    is_model_ready,
+)
+from graph_client import GraphError
+from analysis_pool import AnalysisPool, ANALYSIS_WORKERS
+from attachments import ContentStore
+from pattern_set import active_pattern_set
+from scheduler import SyncScheduler, SYNC_INTERVAL_SECONDS
+from store import get_store
+from search import SearchQueryError, search_emails
+from subscriptions import (
+    SubscriptionManager,
+    NotificationProcessor,
+    handle_notifications,
+    GRAPH_NOTIFICATION_URL,
+    PUSH_SYNC_INTERVAL_SECONDS,
+)
+from indexes import MailboxIndex, FLAG_FIELDS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, project
+from events import EventBus, EVENT_TYPES
+from metrics import get_logger, log_event, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from wire import VIEWS, compact_email, etag_matches, json_response, make_etag, not_modified
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load spaCy in the background: the worker answers /health (liveness) right away
+    # and reports ready once the model is warm. With ANALYSIS_WORKERS, the model lives
+    # in the analysis pool's processes instead of this one.
+    app.state.analysis_pool = AnalysisPool() if ANALYSIS_WORKERS > 0 else None
+    if app.state.analysis_pool is not None:
+        app.state.warmup = asyncio.create_task(app.state.analysis_pool.start())
+    else:
+        app.state.warmup = asyncio.create_task(asyncio.to_thread(warmup))
+    # One pooled Graph client per worker, reused across requests
+    app.state.graph = make_graph_client()
+    # Index changes fan out to GET /events streams; the index's current version is the baseline
+    app.state.events = EventBus()
+    app.state.events.start(get_index)
+    (await asyncio.to_thread(get_index)).add_listener(app.state.events.publish)
+    # Background sync; requests only ever read the store
+    app.state.scheduler = SyncScheduler(lambda: sync_and_index(app))
+    app.state.scheduler.start()
+    # Push mode: Graph notifies POST /notifications and only those messages are fetched;
+    # the scheduler keeps polling (less often while the subscription is up) as a fallback
+    app.state.subscriptions = None
+    app.state.notifications = None
+    if GRAPH_NOTIFICATION_URL:
+        app.state.notifications = NotificationProcessor(lambda ids, removed: sync_ids_and_index(app, ids, removed))
+        app.state.notifications.start()
+        app.state.subscriptions = SubscriptionManager(
+            app.state.graph, on_active=lambda active: set_push_active(app, active)
+        )
+        app.state.subscriptions.start()
+    try:
+        yield
+    finally:
+        if app.state.subscriptions is not None:
+            await app.state.subscriptions.stop()
+            await app.state.notifications.stop()
+        await app.state.scheduler.stop()
+        await app.state.events.stop()
+        await app.state.graph.aclose()
+        if app.state.analysis_pool is not None:
+            await app.state.analysis_pool.stop()
+
+
+async def sync_and_index(app: FastAPI):
+    result = await sync_emails(app.state.graph, app.state.analysis_pool)
+    # Apply the sync's delta to this worker's indexes now rather than on the next request
+    await asyncio.to_thread(get_index)
+    return result
+
+
+async def sync_ids_and_index(app: FastAPI, graph_ids: List[str], removed_ids: List[str]):
+    result = await sync_message_ids(app.state.graph, graph_ids, removed_ids, app.state.analysis_pool)
+    await asyncio.to_thread(get_index)
+    return result
 
-from email_processor import sync_emails
 
-app = FastAPI(title="Email NER + Sync API")
+def set_push_active(app: FastAPI, active: bool) -> None:
+    app.state.scheduler.interval = PUSH_SYNC_INTERVAL_SECONDS if active else SYNC_INTERVAL_SECONDS
+    log_event(log, logging.INFO, "push_active" if active else "push_inactive", poll_seconds=app.state.scheduler.interval)
+
+
+log = get_logger("api")
+
+app = FastAPI(title="Email NER + Sync API", lifespan=lifespan)
 
 # CORS so your TS frontend can call this from another origin
 app.add_middleware(
@@ -14,24 +110,378 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Last-Sync-Age", "X-Sync-State", "ETag"],
 )
 
 
+# ==========================
+# Secondary indexes
+# ==========================
+
+_index: Optional[MailboxIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> MailboxIndex:
+    """Process-wide MailboxIndex, caught up with the store (only the delta is applied)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MailboxIndex(get_store())
+    _index.refresh()
+    return _index
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor!r}")
+
+
+def parse_list(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def analysis_ready(app: FastAPI) -> bool:
+    pool = getattr(app.state, "analysis_pool", None)
+    return pool.ready if pool is not None else is_model_ready()
+
+
+def add_sync_headers(response: Response, scheduler: SyncScheduler) -> None:
+    age = scheduler.last_sync_age_seconds()
+    response.headers["X-Last-Sync-Age"] = "" if age is None else str(age)
+    response.headers["X-Sync-State"] = scheduler.status()["state"]
+
+
+# ==========================
+# Routes
+# ==========================
+
 @app.get("/health")
-def health():
-    return {"status": "ok"}
+def health(request: Request):
+    """Liveness: the process is up. Readiness is reported separately."""
+    return {"status": "ok", "ready": analysis_ready(request.app)}
+
+
+@app.get("/health/ready")
+def health_ready(request: Request, response: Response):
+    """Readiness: 200 once the NER model is loaded and warmed up, 503 before that."""
+    warmup_task = getattr(request.app.state, "warmup", None)
+    error = None
+    if warmup_task is not None and warmup_task.done() and not warmup_task.cancelled() and warmup_task.exception():
+        error = str(warmup_task.exception())
+
+    ready = analysis_ready(request.app) and error is None
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "error": error}
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics for this worker: per-stage sync timings (woomail_stage_seconds),
+    messages processed, analysis cache hits, Graph requests by status / retries and
+    bytes written to the store.
+    """
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/graph/metrics")
+def graph_metrics(request: Request):
+    """Latency / status / retry counters for Graph calls made by this worker."""
+    return request.app.state.graph.metrics.snapshot()
+
+
+@app.get("/analysis/cache")
+def analysis_cache_stats(request: Request):
+    """Hit/miss counters for the analysis cache (NER results keyed by body text)."""
+    if request.app.state.analysis_pool is not None:
+        # each pool worker keeps its own counters; don't load the model here just to report
+        return {"enabled": True, "per_worker": True}
+    cache = get_analysis_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+
+@app.get("/analysis/pool")
+def analysis_pool_stats(request: Request):
+    """Queue depth / throughput of the analysis worker pool (ANALYSIS_WORKERS > 0)."""
+    pool = request.app.state.analysis_pool
+    return pool.stats() if pool else {"enabled": False}
+
+
+@app.get("/analysis/patterns")
+def analysis_patterns(request: Request):
+    """
+    The entity pattern set (patterns.jsonl) this process analyzes with: version, digest,
+    size. Changes to the file are picked up by the next analysis batch.
+    """
+    if request.app.state.analysis_pool is not None:
+        # each pool worker reloads it on its own
+        return {"per_worker": True}
+    pattern_set = active_pattern_set()
+    return pattern_set.stats() if pattern_set else {"loaded": False}
+
+
+@app.get("/stats")
+def get_stats(request: Request):
+    """
+    Dashboard counters: CategoryCount rows (category, count, unread), totals, flag counts
+    and amounts due by org, from the columnar copy of the analyses (see columns.py).
+    """
+    index = get_index()
+    etag = make_etag(index.seq, request)
+    if etag_matches(request, etag):
+        response = not_modified(etag)
+    else:
+        response = json_response(request, index.stats(), etag=etag)
+    add_sync_headers(response, request.app.state.scheduler)
+    return response
 
 
 @app.get("/emails")
-def get_emails():
+def get_emails(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    is_read: Optional[bool] = Query(None, alias="isRead"),
+    org: Optional[str] = None,
+    flags: Optional[str] = None,
+    due_from: Optional[str] = Query(None, alias="dueFrom"),
+    due_to: Optional[str] = Query(None, alias="dueTo"),
+    fields: Optional[str] = None,
+    view: str = Query("compact", pattern=f"^({'|'.join(VIEWS)})$"),
+):
     """
     When your TypeScript page calls this:
-    - We sync new emails from Graph
-    - Update emails.json
-    - Return the full list of processed emails as JSON
+    - We return one page of the last synced emails from the in-memory indexes (see indexes.py)
+      as {"items": [...], "nextCursor": ...}; pass nextCursor back as ?cursor= for the next page
+    - Filters: category, isRead, org, flags=has_billing,has_renewal (any analysis flags),
+      dueFrom / dueTo (ISO dates, on the email's task due date)
+    - Items are compact by default: analysis leaves out raw_entities and its copies of
+      subject / senderEmail / receivedAt; view=full returns the stored record as is
+    - fields=id,subject,analysis.category keeps list payloads small (skips raw_entities, preview...)
+    - Syncing with Graph happens in the background (see POST /sync, GET /sync)
+    - X-Last-Sync-Age tells you how stale the data is, in seconds
+    - Responses carry an ETag (store version + query): send it back as If-None-Match and
+      an unchanged mailbox answers 304 with no body
+    """
+    flag_list = parse_list(flags)
+    unknown = [f for f in flag_list if f not in FLAG_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown flags {unknown}; expected some of {list(FLAG_FIELDS)}")
+
+    index = get_index()
+    etag = make_etag(index.seq, request)
+    if etag_matches(request, etag):
+        response = not_modified(etag)
+        add_sync_headers(response, request.app.state.scheduler)
+        return response
+
+    items, next_cursor = index.query_emails(
+        category=category,
+        is_read=is_read,
+        org=org,
+        flags=flag_list,
+        due_from=due_from,
+        due_to=due_to,
+        after=parse_cursor(cursor),
+        limit=limit,
+    )
+    field_list = parse_list(fields)
+    if field_list:
+        items = [project(item, field_list) for item in items]
+    elif view == "compact":
+        items = [compact_email(item) for item in items]
+    response = json_response(
+        request,
+        {"items": items, "nextCursor": None if next_cursor is None else str(next_cursor)},
+        etag=etag,
+    )
+    add_sync_headers(response, request.app.state.scheduler)
+    return response
+
+
+@app.get("/tasks")
+def get_tasks(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    status: Optional[str] = None,
+    due_from: Optional[str] = Query(None, alias="dueFrom"),
+    due_to: Optional[str] = Query(None, alias="dueTo"),
+    fields: Optional[str] = None,
+):
+    """Tasks derived from the emails, paginated and filtered like /emails (ETag / 304 too)."""
+    index = get_index()
+    etag = make_etag(index.seq, request)
+    if etag_matches(request, etag):
+        response = not_modified(etag)
+        add_sync_headers(response, request.app.state.scheduler)
+        return response
+
+    items, next_cursor = index.query_tasks(
+        category=category,
+        priority=priority,
+        status=status,
+        due_from=due_from,
+        due_to=due_to,
+        after=parse_cursor(cursor),
+        limit=limit,
+    )
+    field_list = parse_list(fields)
+    response = json_response(
+        request,
+        {
+            "items": [project(item, field_list) for item in items],
+            "nextCursor": None if next_cursor is None else str(next_cursor),
+        },
+        etag=etag,
+    )
+    add_sync_headers(response, request.app.state.scheduler)
+    return response
+
+
+@app.get("/search")
+def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    view: str = Query("compact", pattern=f"^({'|'.join(VIEWS)})$"),
+):
+    """
+    Full-text search over subject, body and extracted entities, best match first.
+    q: words (the last one also matches as a prefix), "phrases", word*, -word,
+       and filters such as label:BILLING org:UOB
+    Items are compact (see /emails) unless view=full or fields is given.
+    """
+    field_list = parse_list(fields)
+    try:
+        result = search_emails(get_store(), q, limit=limit, offset=parse_cursor(cursor) or 0, fields=field_list)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not field_list and view == "compact":
+        result["items"] = [compact_email(item) for item in result["items"]]
+    return json_response(request, result)
+
+
+@app.get("/attachments/{attachment_id}/content")
+def get_attachment_content(attachment_id: str):
+    """The file behind an Attachment row, streamed from the content-addressed store."""
+    store = get_store()
+    attachment = store.get_attachment(attachment_id)
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Unknown attachment")
+    if not attachment.get("sha256"):
+        raise HTTPException(status_code=404, detail="Attachment content was not downloaded")
+    path = ContentStore.for_store(store).path_for(attachment["sha256"])
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Attachment file is missing")
+    return FileResponse(
+        path,
+        media_type=attachment.get("contentType") or "application/octet-stream",
+        filename=attachment.get("fileName"),
+    )
+
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    types: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    since: Optional[str] = None,
+):
+    """
+    Server-Sent Events stream of changes, for new EventSource("/events").
+    - email.added (analysis included), email.read_state, email.analyzed, email.updated,
+      email.removed, task.created, task.updated, task.removed; data is the full record
+      (or {"id"} for removals)
+    - types=email.added,task narrows the stream ("task" = every task.* event)
+    - event ids are store versions: reconnects resume from Last-Event-ID automatically;
+      ?since=<version> does the same for a first connect after GET /emails
+    - "reset" means the requested version is too old to replay: reload /emails and /tasks
+    """
+    type_list = parse_list(types)
+    unknown = [t for t in type_list if t not in EVENT_TYPES and t not in ("email", "task")]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types {unknown}; expected some of {list(EVENT_TYPES)}")
+
+    return StreamingResponse(
+        request.app.state.events.stream(last_event_id or since, type_list),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/events/stats")
+def events_stats(request: Request):
+    """Connected SSE clients and the resumable event window of this worker."""
+    return request.app.state.events.stats()
+
+
+@app.get("/sync")
+def get_sync_status(request: Request):
+    return request.app.state.scheduler.status()
+
+
+@app.post("/notifications")
+async def graph_notifications(request: Request, validation_token: Optional[str] = Query(None, alias="validationToken")):
+    """
+    Microsoft Graph change-notification webhook (GRAPH_NOTIFICATION_URL points here).
+    - Subscription validation: echo validationToken back as text/plain
+    - Notifications: check clientState, queue the message ids for a targeted sync and
+      answer 202 straight away (Graph retries slow or failed deliveries)
     """
+    if validation_token is not None:
+        return PlainTextResponse(validation_token)
+
+    subscriptions = request.app.state.subscriptions
+    if subscriptions is None:
+        raise HTTPException(status_code=404, detail="Push notifications are not enabled (GRAPH_NOTIFICATION_URL)")
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON notification payload")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON notification payload")
+
+    handle_notifications(payload, subscriptions, request.app.state.notifications, request.app.state.scheduler.trigger)
+    return Response(status_code=202)
+
+
+@app.get("/notifications")
+def notifications_status(request: Request):
+    """Subscription state and targeted-sync counters for push mode."""
+    subscriptions = request.app.state.subscriptions
+    if subscriptions is None:
+        return {"enabled": False}
+    return {**subscriptions.status(), "notifications": request.app.state.notifications.stats()}
+
+
+@app.post("/sync")
+async def trigger_sync(request: Request, wait: bool = False):
+    """
+    Ask for a sync now.
+    - wait=false (default): kick the background loop and return its status
+    - wait=true: run the sync in this request and return what it changed
+    """
+    scheduler: SyncScheduler = request.app.state.scheduler
+    if not wait:
+        scheduler.trigger()
+        return scheduler.status()
+
     try:
-        emails = sync_emails()
-        return emails
+        result = await scheduler.run_once()
+    except GraphError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"result": result, "status": scheduler.status()}
@@ -0,0 +1,437 @@
+# attachments.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from graph_client import GraphClient, GraphError
+from metrics import ATTACHMENT_BYTES, get_logger, log_event, stage
+from store import EmailStore, current_account, get_store
+
+# ==========================
+# Config
+# ==========================
+
+# Fetch real attachment files during sync; 0 = emails keep hasAttachments but no files / records
+ATTACHMENTS_ENABLED = os.getenv("ATTACHMENTS_ENABLED", "1") == "1"
+# Where files are kept; empty = an "attachments" directory next to the store's database,
+# so every account (accounts.py) has its own
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "")
+# Files downloading at once (each also takes a GraphClient slot while its body streams)
+ATTACHMENT_DOWNLOADS = int(os.getenv("ATTACHMENT_DOWNLOADS", "4"))
+# Bytes per ranged GET; a lost connection only costs the range in flight
+ATTACHMENT_RANGE_BYTES = int(os.getenv("ATTACHMENT_RANGE_BYTES", str(4 * 1024 * 1024)))
+# Bytes read from the socket / written to disk at a time (the only part of a file held in memory)
+ATTACHMENT_CHUNK_BYTES = 64 * 1024
+# Files larger than this (by Graph's size) are listed but not downloaded
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(150 * 1024 * 1024)))
+# Emails whose attachments are fetched per sync; the rest wait for the next one
+ATTACHMENT_EMAILS_PER_SYNC = int(os.getenv("ATTACHMENT_EMAILS_PER_SYNC", "200"))
+# Times a download resumes after its connection drops before the file is given up on
+ATTACHMENT_RESUMES = 3
+# A file (or a message's attachment listing) that keeps failing is retried after
+# ATTACHMENT_RETRY_SECONDS, doubling per failure up to ATTACHMENT_RETRY_MAX_SECONDS, and
+# given up after ATTACHMENT_MAX_FAILURES: it's then recorded without content
+ATTACHMENT_MAX_FAILURES = int(os.getenv("ATTACHMENT_MAX_FAILURES", "5"))
+ATTACHMENT_RETRY_SECONDS = float(os.getenv("ATTACHMENT_RETRY_SECONDS", "300"))
+ATTACHMENT_RETRY_MAX_SECONDS = float(os.getenv("ATTACHMENT_RETRY_MAX_SECONDS", str(24 * 3600)))
+# Unfinished downloads nobody resumed for this long are removed by gc
+PARTIAL_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+FILE_ATTACHMENT = "#microsoft.graph.fileAttachment"
+# Metadata only: never ask the listing for contentBytes (whole files, base64, in the JSON)
+LISTING_SELECT = "id,name,contentType,size,isInline,lastModifiedDateTime"
+
+CONTENT_RANGE_RE = re.compile(r"bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+log = get_logger("attachments")
+
+
+# ==========================
+# Content-addressed files
+# ==========================
+
+class ContentStore:
+    """
+    Attachment files on disk, named by the SHA-256 of their bytes.
+    - objects/ab/cdef...: one file per distinct content, so the same statement PDF
+      attached to a hundred emails is stored once
+    - partial/<key>.part: downloads in progress, one per (message, attachment); a
+      download picks up from the bytes already there
+    - a finished download is renamed into objects/ (or dropped if that content exists)
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.partial = self.root / "partial"
+
+    @classmethod
+    def for_store(cls, store: EmailStore) -> "ContentStore":
+        return cls(Path(ATTACHMENTS_DIR) if ATTACHMENTS_DIR else store.path.parent / "attachments")
+
+    def path_for(self, sha256: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{64}", sha256 or ""):
+            raise ValueError(f"Not a SHA-256 digest: {sha256!r}")
+        return self.objects / sha256[:2] / sha256[2:]
+
+    def has(self, sha256: str) -> bool:
+        return self.path_for(sha256).exists()
+
+    def partial_path(self, graph_id: str, attachment_id: str) -> Path:
+        key = hashlib.sha256(f"{graph_id}\0{attachment_id}".encode("utf-8")).hexdigest()[:32]
+        self.partial.mkdir(parents=True, exist_ok=True)
+        return self.partial / f"{key}.part"
+
+    def commit(self, part: Path, sha256: str) -> bool:
+        """Move a finished download into place. Returns False if the content was already stored."""
+        target = self.path_for(sha256)
+        if target.exists():
+            part.unlink()
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(part, target)
+        return True
+
+    def collect_garbage(self, referenced: Set[str], before: Optional[float] = None) -> Dict[str, int]:
+        """
+        Delete stored files no attachment refers to, and long-abandoned partial downloads.
+        before: only files stored before this time (when referenced was gathered), so a
+        download finishing meanwhile isn't taken for garbage
+        """
+        removed = {"objects": 0, "partial": 0, "bytes": 0}
+        if self.objects.exists():
+            for path in self.objects.glob("*/*"):
+                if path.parent.name + path.name not in referenced and (
+                    before is None or path.stat().st_mtime < before
+                ):
+                    removed["bytes"] += path.stat().st_size
+                    path.unlink()
+                    removed["objects"] += 1
+        if self.partial.exists():
+            cutoff = time.time() - PARTIAL_MAX_AGE_SECONDS
+            for path in self.partial.glob("*.part"):
+                if path.stat().st_mtime < cutoff:
+                    removed["bytes"] += path.stat().st_size
+                    path.unlink()
+                    removed["partial"] += 1
+        return removed
+
+
+# ==========================
+# Graph: listing + streamed download
+# ==========================
+
+async def list_attachments(
+    client: GraphClient, graph_ids: List[str]
+) -> Tuple[Dict[str, Optional[List[Dict[str, Any]]]], Dict[str, str]]:
+    """
+    Attachment metadata (no content) for each message, via $batch.
+    Returns ({graph id: [attachment]}, {graph id: error}): None for messages that no
+    longer exist; messages whose listing failed for another reason are in the errors.
+    """
+    responses = await client.batch([
+        {"id": str(i), "method": "GET", "url": f"/me/messages/{graph_id}/attachments?$select={LISTING_SELECT}"}
+        for i, graph_id in enumerate(graph_ids)
+    ])
+    listed: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+    errors: Dict[str, str] = {}
+    for i, graph_id in enumerate(graph_ids):
+        sub = responses.get(str(i)) or {}
+        status = sub.get("status")
+        if status == 200:
+            listed[graph_id] = (sub.get("body") or {}).get("value", [])
+        elif status == 404:
+            listed[graph_id] = None
+        else:
+            errors[graph_id] = f"attachment listing failed with status {status}"
+    return listed, errors
+
+
+def parse_content_range(value: Optional[str]) -> Optional[int]:
+    """Total length from a Content-Range header ("bytes 0-99/1234" or "bytes */1234")."""
+    match = CONTENT_RANGE_RE.match(value or "")
+    if not match or match.group(3) == "*":
+        return None
+    return int(match.group(3))
+
+
+def _hash_file(path: Path) -> Tuple[Any, int]:
+    """SHA-256 state and size of a partial download, to carry on hashing where it stopped."""
+    hasher = hashlib.sha256()
+    size = 0
+    with path.open("rb") as f:
+        while chunk := f.read(ATTACHMENT_CHUNK_BYTES):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher, size
+
+
+async def download_attachment(
+    client: GraphClient,
+    content: ContentStore,
+    graph_id: str,
+    attachment_id: str,
+) -> Dict[str, Any]:
+    """
+    Stream one file attachment to disk and file it under its SHA-256.
+    - Ranged GETs of ATTACHMENT_RANGE_BYTES on /attachments/{id}/$value, each streamed to the
+      .part file a chunk at a time while it's hashed; nothing bigger than a chunk is in memory
+    - A dropped connection resumes from the bytes already on disk (also across syncs /
+      restarts, the .part file stays), up to ATTACHMENT_RESUMES times
+    - If Graph ignores Range (200), the whole body is streamed in one go instead
+    Returns {"sha256", "size", "stored": False if the content was already there, "resumed"}.
+    """
+    url = f"me/messages/{graph_id}/attachments/{attachment_id}/$value"
+    part = content.partial_path(graph_id, attachment_id)
+    if part.exists():
+        hasher, offset = await asyncio.to_thread(_hash_file, part)
+    else:
+        hasher, offset = hashlib.sha256(), 0
+    resumed = offset > 0
+    total: Optional[int] = None
+    drops = 0
+
+    while total is None or offset < total:
+        try:
+            async with client.stream(
+                "GET", url, headers={"Range": f"bytes={offset}-{offset + ATTACHMENT_RANGE_BYTES - 1}"}
+            ) as response:
+                if response.status_code == 416:
+                    # nothing left at this offset: either we already have every byte, or the file changed
+                    total = parse_content_range(response.headers.get("Content-Range"))
+                    if total == offset:
+                        break
+                    part.unlink(missing_ok=True)
+                    hasher, offset, total = hashlib.sha256(), 0, None
+                    continue
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise GraphError(response.status_code, response.text)
+
+                whole = response.status_code != 206
+                if whole:
+                    # Range not honoured: this body is the entire file
+                    hasher, offset = hashlib.sha256(), 0
+                else:
+                    total = parse_content_range(response.headers.get("Content-Range"))
+                with part.open("wb" if whole else "ab") as f:
+                    async for chunk in response.aiter_bytes(ATTACHMENT_CHUNK_BYTES):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                        ATTACHMENT_BYTES.inc(len(chunk), result="downloaded")
+                if whole or total is None:
+                    total = offset
+        except httpx.TransportError as e:
+            drops += 1
+            if drops > ATTACHMENT_RESUMES:
+                raise
+            log_event(
+                log, logging.WARNING, "attachment_download_resumed", account=current_account(),
+                graph_id=graph_id, attachment_id=attachment_id, offset=offset, error=repr(e),
+            )
+            resumed = True
+
+    sha256 = hasher.hexdigest()
+    stored = content.commit(part, sha256)
+    if not stored:
+        ATTACHMENT_BYTES.inc(offset, result="deduplicated")
+    return {"sha256": sha256, "size": offset, "stored": stored, "resumed": resumed}
+
+
+# ==========================
+# Sync step
+# ==========================
+
+async def ingest_attachments(
+    client: GraphClient,
+    limit: int = ATTACHMENT_EMAILS_PER_SYNC,
+) -> Dict[str, int]:
+    """
+    Fetch the attachments of stored emails that have some but haven't had them fetched
+    (the store keeps those in a partial index), newest first, up to limit emails.
+    - Metadata for all of them through $batch, then up to ATTACHMENT_DOWNLOADS files at once
+    - Inline parts (signature logos etc.) are skipped; item / reference attachments and
+      files over ATTACHMENT_MAX_BYTES are recorded without content
+    - Each email gets an "attachments" list (name, contentType, size, sha256, ...), which
+      rewrites it, so generate_tasks_and_attachments re-derives its Attachment rows
+    - If a file of an email fails, the email is left pending and skipped until its retry
+      time (backoff per file, in the store's attachment_failures); after
+      ATTACHMENT_MAX_FAILURES the file is given up and recorded with its "error" instead
+    """
+    if not ATTACHMENTS_ENABLED or limit <= 0:
+        return {"emails": 0}
+    store = get_store()
+    now = time.time()
+    emails = store.load_emails_pending_attachments(limit, now=now)
+    if not emails:
+        return {"emails": 0}
+
+    content = ContentStore.for_store(store)
+    failures = store.load_attachment_failures(e["graph_id"] for e in emails)
+    counts = {
+        "emails": len(emails), "files": 0, "stored": 0, "deduplicated": 0, "resumed": 0,
+        "failed": 0, "given_up": 0, "bytes": 0,
+    }
+    downloads = asyncio.Semaphore(ATTACHMENT_DOWNLOADS)
+
+    def failed(event: str, graph_id: str, attachment_id: str, error: str, **fields: Any) -> bool:
+        """Record one more failure and when to retry; True if that was the last try."""
+        n = failures.get((graph_id, attachment_id), 0) + 1
+        given_up = n >= ATTACHMENT_MAX_FAILURES
+        retry_in = min(ATTACHMENT_RETRY_SECONDS * 2 ** (n - 1), ATTACHMENT_RETRY_MAX_SECONDS)
+        store.record_attachment_failure(graph_id, attachment_id, n, now + retry_in, error)
+        counts["failed"] += 1
+        counts["given_up"] += given_up
+        log_event(
+            log, logging.ERROR, event, account=store.namespace, graph_id=graph_id, attachment_id=attachment_id,
+            error=error, failures=n, given_up=given_up, retry_in=None if given_up else retry_in, **fields,
+        )
+        return given_up
+
+    async def fetch_file(graph_id: str, meta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The downloaded file, {"error"} if it was given up, or None to try again later."""
+        async with downloads:
+            try:
+                return await download_attachment(client, content, graph_id, meta["id"])
+            except (GraphError, httpx.TransportError, OSError) as e:
+                if failed("attachment_download_failed", graph_id, meta["id"], str(e), name=meta.get("name")):
+                    return {"error": str(e)}
+                return None
+
+    async def fetch_email(email: Dict[str, Any], listing: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        graph_id = email["graph_id"]
+        wanted = [meta for meta in listing if not meta.get("isInline")]
+        downloadable = [
+            meta for meta in wanted
+            if meta.get("@odata.type", FILE_ATTACHMENT) == FILE_ATTACHMENT
+            and (meta.get("size") or 0) <= ATTACHMENT_MAX_BYTES
+        ]
+        files = await asyncio.gather(*(fetch_file(graph_id, meta) for meta in downloadable))
+        if any(f is None for f in files):
+            return None
+        by_id = {meta["id"]: f for meta, f in zip(downloadable, files)}
+
+        records = []
+        for meta in wanted:
+            fetched = by_id.get(meta["id"])
+            error = fetched.get("error") if fetched else None
+            downloaded = fetched if error is None else None
+            record = {
+                "id": meta["id"],
+                "name": meta.get("name") or "attachment",
+                "contentType": meta.get("contentType"),
+                # exact bytes on disk when we have the file; Graph's size otherwise
+                "size": downloaded["size"] if downloaded else meta.get("size") or 0,
+                "sha256": downloaded["sha256"] if downloaded else None,
+                "lastModifiedDateTime": meta.get("lastModifiedDateTime"),
+            }
+            if error is not None:
+                record["error"] = error  # given up after ATTACHMENT_MAX_FAILURES
+            records.append(record)
+            if downloaded:
+                counts["files"] += 1
+                counts["bytes"] += downloaded["size"]
+                counts["stored" if downloaded["stored"] else "deduplicated"] += 1
+                counts["resumed"] += downloaded["resumed"]
+        return {**email, "attachments": records}
+
+    with stage("attachments"):
+        try:
+            listings, listing_errors = await list_attachments(client, [e["graph_id"] for e in emails])
+        except (GraphError, httpx.TransportError) as e:
+            # the mail itself is synced; attachments wait for the next sync
+            log_event(
+                log, logging.WARNING, "attachment_listing_failed", account=store.namespace,
+                emails=len(emails), error=str(e),
+            )
+            return {"emails": 0, "pending": len(emails)}
+        listed = [e for e in emails if e["graph_id"] in listings]
+        updated = await asyncio.gather(*(
+            # gone from Graph since it was stored: nothing to fetch; the delta will delete it
+            fetch_email(e, listings[e["graph_id"]] or []) for e in listed
+        ))
+        done = [record for record in updated if record is not None]
+        for email in emails:
+            # listing failed for just this message: backs off like a file, then gives up with no files
+            error = listing_errors.get(email["graph_id"])
+            if error and failed("attachment_listing_failed", email["graph_id"], "", error):
+                done.append({**email, "attachments": [], "attachmentsError": error})
+        store.upsert_emails(done)
+        store.clear_attachment_failures(record["graph_id"] for record in done)
+
+    counts["pending"] = len(emails) - len(done)
+    log_event(log, logging.INFO, "attachments_done", **counts)
+    return counts
+
+
+def referenced_hashes(store: EmailStore) -> Set[str]:
+    return {
+        attachment["sha256"]
+        for email in store.load_emails()
+        for attachment in email.get("attachments") or []
+        if attachment.get("sha256")
+    }
+
+
+def local_stores() -> List[EmailStore]:
+    """
+    Every email store here whose attachments can share a content store: the
+    single-mailbox one and each account's under ACCOUNTS_DIR, including accounts since
+    removed from accounts.json whose data is still on disk.
+    """
+    from accounts import ACCOUNTS_DIR
+    from store import DB_PATH
+
+    stores = [EmailStore(DB_PATH)] if DB_PATH.exists() else []
+    stores.extend(EmailStore(path, namespace=path.parent.name) for path in sorted(ACCOUNTS_DIR.glob("*/emails.db")))
+    return stores
+
+
+def collect_garbage(stores: List[EmailStore]) -> Dict[str, Dict[str, int]]:
+    """
+    Garbage-collect the content store of each of stores. A content store several of them
+    use (one ATTACHMENTS_DIR for every account) keeps each file any of them refers to.
+    Returns {content store root: what was removed}.
+    """
+    started = time.time()
+    referenced: Dict[Path, Set[str]] = {}
+    for store in stores:
+        root = ContentStore.for_store(store).root.resolve()
+        referenced.setdefault(root, set()).update(referenced_hashes(store))
+    return {
+        str(root): ContentStore(root).collect_garbage(hashes, before=started)
+        for root, hashes in referenced.items()
+    }
+
+
+# ==========================
+# CLI entrypoint
+# ==========================
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "gc":
+        print(json.dumps(collect_garbage(local_stores()), indent=2))
+    elif command == "fetch":
+        from email_processor import generate_tasks_and_attachments, make_graph_client
+
+        async def main() -> None:
+            async with make_graph_client() as client:
+                print(await ingest_attachments(client))
+            print(generate_tasks_and_attachments())
+
+        asyncio.run(main())
+    else:
+        print("usage: python attachments.py [fetch|gc]")
@@ -0,0 +1,100 @@
+# benchmarks/analysis_pool.py
+"""
+Analysis throughput vs. number of AnalysisPool workers.
+
+Runs the same corpus (cleaned bodies of fake_graph.make_message, made distinct so
+nothing is deduplicated) through analyze_emails inline, then through pools of
+1, 2, 4, ... workers up to --max-workers, and reports messages/sec, speedup over
+one worker and scaling efficiency. Also reports how long until the first batch of
+results is available (partial results) for each run.
+
+The analysis cache is disabled so every run does the full work.
+
+Run from email_processing/:
+    python -m benchmarks.analysis_pool --messages 5000 --max-workers 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+# before email_processor is imported here and in the spawned workers
+os.environ["ANALYSIS_CACHE_MAX_ENTRIES"] = "0"
+
+from analysis_pool import AnalysisPool, ANALYSIS_POOL_BATCH_SIZE  # noqa: E402
+from benchmarks.fake_graph import make_message  # noqa: E402
+from email_processor import analyze_emails, clean_html  # noqa: E402
+
+
+def make_corpus(messages: int) -> List[str]:
+    return [
+        f"{clean_html(make_message(i)['body']['content'])}\n#{i}"
+        for i in range(messages)
+    ]
+
+
+def run_inline(texts: List[str]) -> Dict[str, Any]:
+    analyze_emails(texts[:8], use_cache=False)  # model load
+    start = time.perf_counter()
+    analyze_emails(texts, use_cache=False)
+    elapsed = time.perf_counter() - start
+    return {"messages_per_sec": round(len(texts) / elapsed, 1)}
+
+
+async def run_pool(texts: List[str], workers: int, batch_size: int) -> Dict[str, Any]:
+    pool = AnalysisPool(workers=workers, batch_size=batch_size)
+    started = time.perf_counter()
+    await pool.start()
+    startup = time.perf_counter() - started
+    try:
+        first_result = None
+        done = 0
+        start = time.perf_counter()
+        async for batch in pool.analyze(texts):
+            if first_result is None:
+                first_result = time.perf_counter() - start
+            done += len(batch)
+        elapsed = time.perf_counter() - start
+    finally:
+        await pool.stop()
+    return {
+        "workers": workers,
+        "startup_seconds": round(startup, 2),
+        "first_results_seconds": round(first_result or 0.0, 3),
+        "messages_per_sec": round(done / elapsed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=ANALYSIS_POOL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    texts = make_corpus(args.messages)
+    report: Dict[str, Any] = {
+        "messages": args.messages,
+        "cpus": os.cpu_count(),
+        "inline": run_inline(texts),
+        "pool": [],
+    }
+
+    workers = 1
+    while workers <= args.max_workers:
+        report["pool"].append(asyncio.run(run_pool(texts, workers, args.batch_size)))
+        workers *= 2
+
+    base = report["pool"][0]["messages_per_sec"]
+    for run in report["pool"]:
+        run["speedup"] = round(run["messages_per_sec"] / base, 2)
+        run["efficiency"] = round(run["speedup"] / run["workers"], 2)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
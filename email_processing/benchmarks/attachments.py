@@ -0,0 +1,101 @@
+# benchmarks/attachments.py
+"""
+Attachment ingestion (attachments.py) against FakeGraph.
+
+Syncs a synthetic mailbox whose messages with hasAttachments carry a statement PDF
+(identical bytes for identical subjects, like a bank's monthly template) plus inline
+logos, then reports:
+  - files downloaded vs. distinct files stored (content-addressed dedupe)
+  - bytes over the wire vs. bytes on disk
+  - peak Python heap during the downloads (tracemalloc): stays around a few chunks
+    per concurrent download, whatever --file-kb is
+  - with --drop N, N downloads lose their connection part-way and must resume
+  - with --no-range, FakeGraph ignores Range and every file is one streamed GET
+
+Run from email_processing/:
+    python -m benchmarks.attachments --messages 2000 --file-kb 2048
+    python -m benchmarks.attachments --messages 500 --file-kb 8192 --drop 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+async def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    from attachments import ingest_attachments
+    from benchmarks.fake_graph import FakeGraph
+    from benchmarks.mailbox import make_mailbox
+    from email_processor import apply_fetched_messages
+    from graph_client import GraphClient
+
+    graph = FakeGraph(make_mailbox(args.messages, seed=args.seed), attachment_bytes=args.file_kb * 1024)
+    graph.supports_range = not args.no_range
+    graph.drop_downloads = args.drop
+    graph.drop_after_bytes = args.file_kb * 1024 // 3
+
+    async with GraphClient(lambda: "bench-token", transport=graph.transport()) as client:
+        # store the mail first, so only the attachment step is measured
+        await apply_fetched_messages(client, list(graph.messages.values()), [])
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        totals: Dict[str, int] = {}
+        while True:
+            counts = await ingest_attachments(client)
+            if not counts.get("emails"):
+                break
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stored = directory_bytes(os.path.join(workdir, "attachments", "objects"))
+    return {
+        "messages": args.messages,
+        "file_kb": args.file_kb,
+        "range_requests": not args.no_range,
+        "emails_with_attachments": totals.get("emails", 0),
+        "files": totals.get("files", 0),
+        "distinct_files": totals.get("stored", 0),
+        "resumed": totals.get("resumed", 0),
+        "failed": totals.get("failed", 0),
+        "wire_mb": round(graph.download_bytes / 1e6, 1),
+        "disk_mb": round(stored / 1e6, 1),
+        "download_requests": graph.downloads,
+        "seconds": round(elapsed, 2),
+        "mb_per_second": round(graph.download_bytes / 1e6 / elapsed, 1) if elapsed else None,
+        "peak_heap_mb": round(peak / 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file-kb", type=int, default=1024, help="typical attachment size")
+    parser.add_argument("--drop", type=int, default=0, help="downloads that lose their connection once")
+    parser.add_argument("--no-range", action="store_true", help="FakeGraph answers 200 to Range requests")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="woomail-attachments-") as workdir:
+        # store and files go to the scratch directory; set before importing the modules that read them
+        os.chdir(workdir)
+        os.environ["EMAIL_DB_PATH"] = os.path.join(workdir, "emails.db")
+        os.environ["ANALYSIS_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["ATTACHMENT_EMAILS_PER_SYNC"] = str(max(args.messages, 1))
+        print(json.dumps(asyncio.run(run(args, workdir)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
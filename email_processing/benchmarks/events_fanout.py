@@ -0,0 +1,93 @@
+# benchmarks/events_fanout.py
+"""
+SSE fan-out: how long until every connected client has an event group.
+
+Connects --clients in-process consumers to one EventBus (each is the same
+bus.stream() generator GET /events returns), then publishes --groups groups of
+--events-per-group email.added events, like index refreshes after syncs. For
+each group it times publish -> last client received it, and it reports p50/p99
+delivery latency, events delivered per second, and RSS growth per client.
+
+Run from email_processing/:
+    python -m benchmarks.events_fanout --clients 5000 --groups 50 --events-per-group 20
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_graph import make_message
+from events import EventBus
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def client(bus: EventBus, groups: int, received: List[int], index: int, arrived: asyncio.Event) -> None:
+    seen = 0
+    async for chunk in bus.stream():
+        seen += chunk.count(b"\nid: ") + chunk.startswith(b"id: ")
+        received[index] = seen
+        arrived.set()
+        if seen > groups:  # the first id frame (baseline) + one per group
+            return
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    bus = EventBus(capacity=args.groups * args.events_per_group)
+    bus.start(lambda: None, poll_seconds=3600, heartbeat=3600)
+    bus.publish(0, [])
+
+    rss_before = rss_mb()
+    received = [0] * args.clients
+    arrived = asyncio.Event()
+    tasks = [asyncio.create_task(client(bus, args.groups, received, i, arrived)) for i in range(args.clients)]
+    while min(received) < 1:  # everyone connected and got the baseline id
+        await asyncio.sleep(0.01)
+    rss_connected = rss_mb()
+
+    records = [{**make_message(i), "analysis": {"category": "Billing"}} for i in range(args.events_per_group)]
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for group in range(1, args.groups + 1):
+        t0 = time.perf_counter()
+        bus.publish(group, [("email", i, None, record) for i, record in enumerate(records)])
+        while min(received) < group + 1:
+            arrived.clear()
+            await arrived.wait()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    await asyncio.gather(*tasks)
+    await bus.stop()
+    latencies.sort()
+    return {
+        "clients": args.clients,
+        "groups": args.groups,
+        "events_per_group": args.events_per_group,
+        "delivery_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 2),
+            "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+        },
+        "events_delivered_per_sec": round(args.clients * args.groups * args.events_per_group / elapsed),
+        "rss_per_client_kb": round((rss_connected - rss_before) * 1024 / args.clients, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--events-per-group", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
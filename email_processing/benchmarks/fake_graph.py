@@ -0,0 +1,409 @@
+# benchmarks/fake_graph.py
+
+import asyncio
+import hashlib
+import itertools
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+
+GRAPH_PREFIX = "/v1.0"
+DELTA_PATH = f"{GRAPH_PREFIX}/me/mailFolders/inbox/messages/delta"
+MESSAGES_PATH = f"{GRAPH_PREFIX}/me/messages"
+BATCH_PATH = f"{GRAPH_PREFIX}/$batch"
+SUBSCRIPTIONS_PATH = f"{GRAPH_PREFIX}/subscriptions"
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def make_attachments(message: Dict[str, Any], file_bytes: int = 200_000) -> List[Dict[str, Any]]:
+    """
+    Attachments for a message with hasAttachments: a statement PDF whose bytes depend only
+    on the subject (so the same statement mailed again is the same file), around file_bytes
+    long, plus an inline logo every other message.
+    Contents are a header and a repeating unit ("_head", "_unit"), generated as they are
+    served, so a big fake mailbox doesn't hold its files in memory.
+    """
+    subject = message.get("subject") or "attachment"
+    seed = hashlib.sha256(subject.encode("utf-8")).digest()
+    attachments = [{
+        "@odata.type": "#microsoft.graph.fileAttachment",
+        "id": f"{message['id']}-att-0",
+        "name": subject.replace(" ", "_") + ".pdf",
+        "contentType": "application/pdf",
+        "size": file_bytes // 2 + int.from_bytes(seed[:4], "big") % max(1, file_bytes),
+        "isInline": False,
+        "lastModifiedDateTime": message.get("receivedDateTime"),
+        "_head": b"%PDF-1.4\n",
+        "_unit": seed,
+    }]
+    if int(hashlib.sha256(message["id"].encode()).hexdigest(), 16) % 2:
+        attachments.append({
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "id": f"{message['id']}-att-logo",
+            "name": "logo.png",
+            "contentType": "image/png",
+            "size": 2048,
+            "isInline": True,
+            "lastModifiedDateTime": message.get("receivedDateTime"),
+            "_head": b"\x89PNG",
+            "_unit": b"\0",
+        })
+    return attachments
+
+
+def attachment_content(attachment: Dict[str, Any], start: int, end: int) -> bytes:
+    """Bytes [start, end) of a make_attachments file."""
+    head, unit = attachment["_head"], attachment["_unit"]
+    end = min(end, attachment["size"])
+    content = head[start:end]
+    offset, stop = max(start, len(head)) - len(head), end - len(head)
+    if stop > offset:
+        repeated = unit * ((stop - offset) // len(unit) + 2)
+        content += repeated[offset % len(unit):offset % len(unit) + stop - offset]
+    return content
+
+
+def make_message(i: int) -> Dict[str, Any]:
+    """A small UOB-style billing notice; benchmarks/mailbox.py has richer templates."""
+    return {
+        "id": f"msg-{i:07d}",
+        "changeKey": "ck-0",
+        "subject": "UOB Billing Statement Ready",
+        "from": {"emailAddress": {"address": "statements@uob.com.sg"}},
+        "receivedDateTime": f"2025-12-{1 + i % 28:02d}T{i % 24:02d}:00:00Z",
+        "bodyPreview": "Your UOB billing statement is now available.",
+        "isRead": i % 4 == 0,
+        "hasAttachments": i % 3 == 0,
+        "body": {
+            "contentType": "html",
+            "content": (
+                "<html><body><p>Dear Customer,</p>"
+                "<p>Your UOB billing statement is now available.<br>"
+                f"Total amount payable: ${100 + i % 900}.{i % 100:02d}.<br>"
+                "Payment due on 20 Jan 2025.</p>"
+                f"<p>Ref: UOB-{i:07d}</p>"
+                "<p>Click here to view statement.</p></body></html>"
+            ),
+        },
+    }
+
+
+class FakeGraph:
+    """
+    In-process stand-in for the parts of Microsoft Graph the sync uses,
+    served through httpx.MockTransport (no sockets).
+    - /me/mailFolders/inbox/messages/delta with paging and deltaLinks
+    - /me/messages (first page only, like the legacy fetch) and /me/messages/{id}
+    - /me/messages/{id}/attachments (metadata, from make_attachments unless set in
+      attachments) and /attachments/{id}/$value, honouring Range (206) unless
+      supports_range is False; drop_downloads makes that many downloads lose their
+      connection after drop_after_bytes, to exercise resuming
+    - $select on all of the above (kept in delta links, like Graph does)
+    - /$batch (JSON batching, max 20 sub-requests); throttle_batch_items makes that many
+      sub-requests answer 429 first, to exercise the retry path
+    - /subscriptions: create (with the validationToken handshake), renew (PATCH), delete;
+      webhook is the transport notifications are POSTed through, e.g.
+      httpx.ASGITransport(app=api.app)
+    Every mutation is appended to a change log; a deltaLink is just a position in it.
+    Mutations bump the message's changeKey and queue a change notification, sent by
+    emit_notifications(); emit_lifecycle() sends lifecycle events.
+    """
+
+    def __init__(
+        self,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        page_size: int = 50,
+        latency_seconds: float = 0.0,
+        throttle_batch_items: int = 0,
+        webhook: Optional[httpx.AsyncBaseTransport] = None,
+        attachment_bytes: int = 200_000,
+    ):
+        self.page_size = page_size
+        self.latency_seconds = latency_seconds
+        self.throttle_batch_items = throttle_batch_items
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.changes: List[Tuple[str, str]] = []  # (graph id, "upsert" | "removed")
+        self.webhook = webhook
+        self.subscriptions: Dict[str, Dict[str, Any]] = {}
+        self.outbox: List[Tuple[str, str]] = []  # (changeType, graph id) not yet notified
+        self._subscription_ids = itertools.count(1)
+        self.attachments: Dict[str, List[Dict[str, Any]]] = {}
+        self.attachment_bytes = attachment_bytes
+        self.supports_range = True
+        self.drop_downloads = 0
+        self.drop_after_bytes = 100_000
+
+        self.requests = 0
+        self.requests_by_path: Dict[str, int] = {}
+        self.batch_items = 0
+        self.bytes_sent = 0
+        self.downloads = 0
+        self.download_bytes = 0
+
+        for message in messages or []:
+            self.add_message(message)
+
+    # --------------------------
+    # Mailbox mutations
+    # --------------------------
+
+    def add_message(self, message: Dict[str, Any]) -> None:
+        message.setdefault("changeKey", "ck-0")
+        self.messages[message["id"]] = message
+        self.changes.append((message["id"], "upsert"))
+        self._notify("created", message["id"])
+
+    def update_message(self, graph_id: str, **fields: Any) -> None:
+        message = self.messages[graph_id]
+        message.update(fields)
+        message["changeKey"] = f"ck-{len(self.changes)}"
+        self.changes.append((graph_id, "upsert"))
+        self._notify("updated", graph_id)
+
+    def delete_message(self, graph_id: str) -> None:
+        self.messages.pop(graph_id, None)
+        self.changes.append((graph_id, "removed"))
+        self._notify("deleted", graph_id)
+
+    # --------------------------
+    # Notifications
+    # --------------------------
+
+    def _notify(self, change_type: str, graph_id: str) -> None:
+        # like Graph, only changes made while subscribed are notified
+        if self.subscriptions:
+            self.outbox.append((change_type, graph_id))
+
+    async def emit_notifications(self) -> int:
+        """POST the queued change notifications to every subscription; returns how many were sent."""
+        outbox, self.outbox = self.outbox, []
+        sent = 0
+        for subscription in list(self.subscriptions.values()):
+            value = [
+                {
+                    "subscriptionId": subscription["id"],
+                    "subscriptionExpirationDateTime": subscription["expirationDateTime"],
+                    "changeType": change_type,
+                    "resource": f"Users/fake-user/Messages/{graph_id}",
+                    "resourceData": {
+                        "@odata.type": "#Microsoft.Graph.Message",
+                        "@odata.id": f"Users/fake-user/Messages/{graph_id}",
+                        "id": graph_id,
+                    },
+                    "clientState": subscription.get("clientState"),
+                    "tenantId": "fake-tenant",
+                }
+                for change_type, graph_id in outbox
+            ]
+            if value:
+                await self._post_webhook(subscription["notificationUrl"], {"value": value})
+                sent += len(value)
+        return sent
+
+    async def emit_lifecycle(self, event: str, subscription_id: Optional[str] = None) -> None:
+        """Send a lifecycle notification (reauthorizationRequired, subscriptionRemoved, missed)."""
+        for subscription in list(self.subscriptions.values()):
+            if subscription_id is not None and subscription["id"] != subscription_id:
+                continue
+            if event == "subscriptionRemoved":
+                del self.subscriptions[subscription["id"]]
+            await self._post_webhook(subscription["lifecycleNotificationUrl"], {"value": [{
+                "subscriptionId": subscription["id"],
+                "subscriptionExpirationDateTime": subscription["expirationDateTime"],
+                "lifecycleEvent": event,
+                "clientState": subscription.get("clientState"),
+                "tenantId": "fake-tenant",
+            }]})
+
+    async def _post_webhook(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        async with httpx.AsyncClient(transport=self.webhook) as webhook:
+            response = await webhook.post(url, json=payload)
+        if response.status_code >= 300:
+            raise RuntimeError(f"webhook {url} answered {response.status_code}")
+        return response
+    # --------------------------
+    # HTTP
+    # --------------------------
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        path = request.url.path
+        self.requests_by_path[path] = self.requests_by_path.get(path, 0) + 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+
+        params = {k: v[-1] for k, v in parse_qs(request.url.query.decode()).items()}
+        if path == BATCH_PATH and request.method == "POST":
+            body = self._batch(json.loads(request.content))
+        elif path == SUBSCRIPTIONS_PATH or path.startswith(SUBSCRIPTIONS_PATH + "/"):
+            status, body = await self._subscription(request, path[len(SUBSCRIPTIONS_PATH) + 1:])
+            return self._json(status, body)
+        elif path == DELTA_PATH:
+            body = self._delta(params)
+        elif path == MESSAGES_PATH:
+            body = {"value": [self._project(m, params.get("$select")) for m in list(self.messages.values())[:10]]}
+        elif path.startswith(MESSAGES_PATH + "/") and path.endswith("/$value"):
+            return self._download(request, path[len(MESSAGES_PATH) + 1:])
+        elif path.startswith(MESSAGES_PATH + "/"):
+            status, body = self._get_message(path[len(MESSAGES_PATH) + 1:], params)
+            return self._json(status, body)
+        else:
+            return self._json(404, {"error": {"code": "NotFound", "message": path}})
+        return self._json(200, body)
+
+    async def _subscription(self, request: httpx.Request, subscription_id: str) -> Tuple[int, Dict[str, Any]]:
+        if request.method == "POST" and not subscription_id:
+            spec = json.loads(request.content)
+            # Graph validates the notification URL before creating the subscription
+            token = f"validation-{next(self._subscription_ids)}"
+            async with httpx.AsyncClient(transport=self.webhook) as webhook:
+                response = await webhook.post(spec["notificationUrl"], params={"validationToken": token})
+            if response.status_code != 200 or response.text != token:
+                return 400, {"error": {"code": "ValidationError", "message": "Subscription validation request failed"}}
+            subscription = {**spec, "id": f"sub-{token.split('-')[1]}"}
+            subscription.setdefault("lifecycleNotificationUrl", spec["notificationUrl"])
+            self.subscriptions[subscription["id"]] = subscription
+            return 201, {k: v for k, v in subscription.items() if k != "clientState"}
+
+        subscription = self.subscriptions.get(subscription_id)
+        if subscription is None:
+            return 404, {"error": {"code": "ResourceNotFound", "message": subscription_id}}
+        if request.method == "PATCH":
+            subscription["expirationDateTime"] = json.loads(request.content)["expirationDateTime"]
+        elif request.method == "DELETE":
+            del self.subscriptions[subscription_id]
+        return 200, {k: v for k, v in subscription.items() if k != "clientState"}
+
+    @staticmethod
+    def _project(message: Dict[str, Any], select: Optional[str]) -> Dict[str, Any]:
+        if not select:
+            return dict(message)
+        fields = {"id", *select.split(",")}
+        return {k: v for k, v in message.items() if k in fields}
+
+    def _get_message(self, path: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        graph_id, _, rest = path.partition("/")
+        message = self.messages.get(graph_id)
+        if message is None:
+            return 404, {"error": {"code": "ErrorItemNotFound", "message": graph_id}}
+        if rest == "attachments":
+            select = params.get("$select")
+            return 200, {"value": [
+                # like Graph, @odata.type comes back whatever $select says
+                {k: v for k, v in self._project(a, select).items() if not k.startswith("_")} | {"@odata.type": a["@odata.type"]}
+                for a in self.attachments_of(graph_id)
+            ]}
+        return 200, self._project(message, params.get("$select"))
+
+    def attachments_of(self, graph_id: str) -> List[Dict[str, Any]]:
+        message = self.messages[graph_id]
+        if graph_id not in self.attachments:
+            self.attachments[graph_id] = (
+                make_attachments(message, self.attachment_bytes) if message.get("hasAttachments") else []
+            )
+        return self.attachments[graph_id]
+
+    def _download(self, request: httpx.Request, path: str) -> httpx.Response:
+        # {graph id}/attachments/{attachment id}/$value
+        graph_id, _, attachment_id = path[:-len("/$value")].partition("/attachments/")
+        if graph_id not in self.messages:
+            return self._json(404, {"error": {"code": "ErrorItemNotFound", "message": graph_id}})
+        found = [a for a in self.attachments_of(graph_id) if a["id"] == attachment_id]
+        if not found:
+            return self._json(404, {"error": {"code": "ErrorItemNotFound", "message": attachment_id}})
+        attachment = found[0]
+        size = attachment["size"]
+        self.downloads += 1
+
+        status, headers = 200, {"Content-Type": attachment["contentType"]}
+        start, end = 0, size
+        match = RANGE_RE.fullmatch(request.headers.get("Range", ""))
+        if match and self.supports_range:
+            start = int(match.group(1))
+            if start >= size:
+                return httpx.Response(416, headers={"Content-Range": f"bytes */{size}"})
+            end = min(int(match.group(2)) + 1 if match.group(2) else size, size)
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+        drop = self.drop_downloads > 0 and end - start > self.drop_after_bytes
+        if drop:
+            self.drop_downloads -= 1
+
+        async def body():
+            for position in range(start, end, 16 * 1024):
+                if drop and position - start >= self.drop_after_bytes:
+                    raise httpx.ReadError("connection reset by fake Graph")
+                chunk = attachment_content(attachment, position, min(position + 16 * 1024, end))
+                self.download_bytes += len(chunk)
+                yield chunk
+
+        return httpx.Response(status, headers=headers, content=body())
+
+    def _batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        requests = payload.get("requests", [])
+        if len(requests) > 20:
+            raise ValueError("$batch allows at most 20 requests")
+        responses = []
+        for sub in requests:
+            self.batch_items += 1
+            if self.throttle_batch_items > 0:
+                self.throttle_batch_items -= 1
+                responses.append({"id": sub["id"], "status": 429, "headers": {"Retry-After": "0"}, "body": {}})
+                continue
+            path, _, query = sub["url"].partition("?")
+            params = {k: v[-1] for k, v in parse_qs(query).items()}
+            status, body = self._get_message(path[len("/me/messages/"):], params)
+            responses.append({"id": sub["id"], "status": status, "headers": {}, "body": body})
+        return {"responses": responses}
+
+    def _json(self, status: int, body: Dict[str, Any]) -> httpx.Response:
+        content = json.dumps(body).encode("utf-8")
+        self.bytes_sent += len(content)
+        return httpx.Response(status, content=content, headers={"Content-Type": "application/json"})
+
+    def _link(self, **params: Any) -> str:
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        return f"https://graph.microsoft.com{DELTA_PATH}?{query}"
+
+    def _delta(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        $deltatoken=N   -> changes after log position N
+        $skiptoken=N:O  -> page starting at offset O of the changes after N
+        (no token)      -> initial sync: everything currently in the mailbox
+        """
+        if "$skiptoken" in params:
+            since, offset = (int(x) for x in params["$skiptoken"].split(":"))
+        else:
+            since, offset = int(params.get("$deltatoken", -1)), 0
+
+        select = params.get("$select")
+        head = len(self.changes)
+        if since < 0:
+            items = [self._project(m, select) for m in self.messages.values()]
+        else:
+            latest: Dict[str, str] = {}
+            for graph_id, kind in self.changes[since:head]:
+                latest[graph_id] = kind
+            items = []
+            for graph_id, kind in latest.items():
+                if kind == "removed" or graph_id not in self.messages:
+                    items.append({"id": graph_id, "@removed": {"reason": "deleted"}})
+                else:
+                    items.append(self._project(self.messages[graph_id], select))
+
+        page = items[offset:offset + self.page_size]
+        body: Dict[str, Any] = {"value": page}
+        keep = {"$select": select} if select else {}
+        if offset + self.page_size < len(items):
+            body["@odata.nextLink"] = self._link(**{"$skiptoken": f"{since}:{offset + self.page_size}"}, **keep)
+        else:
+            body["@odata.deltaLink"] = self._link(**{"$deltatoken": head}, **keep)
+        return body
+
@@ -0,0 +1,147 @@
+# benchmarks/html_clean.py
+"""
+Micro-benchmark: HTML cleaning + regex entity extraction.
+
+Builds a corpus of marketing / statement style HTML bodies (20-150KB each:
+inline <style>, tracking <script>, nested layout tables, entities) and compares
+  - the old 12-pass regex clean_html against html_text.html_to_text
+  - the old one-scan-per-pattern extraction against the single ENTITY_RE scan
+
+Run from email_processing/:
+    python -m benchmarks.html_clean --messages 200
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from email_processor import AMOUNT_REGEX, DATE_REGEXES, REF_REGEX, extract_regex_entities
+from html_text import html_to_text
+
+
+# ==========================
+# Previous implementations (kept here for comparison only)
+# ==========================
+
+def legacy_clean_html(raw_html: str) -> str:
+    if not raw_html:
+        return ""
+    text = re.sub(r"&nbsp;", " ", raw_html)
+    text = re.sub(r"&lt;", "<", text)
+    text = re.sub(r"&gt;", ">", text)
+    text = re.sub(r"&amp;", "&", text)
+    text = re.sub(r"<!--[\s\S]*?-->", "", text)
+    text = re.sub(r"<\s*br\s*/?>", "\n", text, flags=re.IGNORECASE)
+    text = re.sub(r"<\s*/?p\s*>", "\n", text, flags=re.IGNORECASE)
+    text = re.sub(r"<.*?>", "", text)
+    text = re.sub(r"\r\n", "\n", text)
+    text = re.sub(r"\n+", "\n", text)
+    text = re.sub(r"[ \t]+", " ", text)
+    return text.strip()
+
+
+def legacy_extract_regex_entities(text: str) -> Dict[str, List[str]]:
+    dates: List[str] = []
+    for pattern in DATE_REGEXES:
+        dates.extend(re.findall(pattern, text))
+    return {
+        "dates": dates,
+        "amounts": re.findall(AMOUNT_REGEX, text),
+        "refs": re.findall(REF_REGEX, text, flags=re.IGNORECASE),
+    }
+
+
+# ==========================
+# Corpus
+# ==========================
+
+STYLE = "<style type=\"text/css\">" + "".join(
+    f".c{i} {{ font-family: Arial, sans-serif; color: #{i:06x}; padding: {i % 9}px; }}\n" for i in range(120)
+) + "</style>"
+
+SCRIPT = "<script>" + "var t=[];" * 200 + "(function(){/* tracking */})();</script>"
+
+PARAGRAPHS = [
+    "Dear&nbsp;Customer, your statement for 12 Jan 2025 is ready. Total due: $1,234.56.",
+    "Reference: AB-1234 &mdash; please log in to view the e&#8209;statement &amp; pay by 2025-02-01.",
+    "Your appointment #778-22 on 3/4/2025 is confirmed. Bring your NRIC &lt;original&gt;.",
+    "Earn up to 5% cashback&hellip; T&amp;Cs apply. Promotion ends 31 Mar 2025.",
+    "Case 99812: we&rsquo;ve received your request and will reply within 3 working days.",
+]
+
+
+def make_body(rng: random.Random, target_bytes: int) -> str:
+    parts = ["<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Statement</title>", STYLE, "</head><body>"]
+    size = sum(len(p) for p in parts)
+    while size < target_bytes:
+        cells = "".join(
+            f"<td class=\"c{rng.randrange(120)}\" style=\"padding:4px\"><p>{rng.choice(PARAGRAPHS)}</p></td>"
+            for _ in range(rng.randint(1, 3))
+        )
+        block = f"<table width=\"100%\"><tr>{cells}</tr></table><!-- spacer --><br/>"
+        if rng.random() < 0.05:
+            block += SCRIPT
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def make_corpus(messages: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    return [make_body(rng, rng.randint(20_000, 150_000)) for _ in range(messages)]
+
+
+# ==========================
+# Timing
+# ==========================
+
+def measure(fn: Callable[[str], Any], inputs: List[str]) -> Dict[str, float]:
+    total_bytes = sum(len(s) for s in inputs)
+    start = time.perf_counter()
+    for s in inputs:
+        fn(s)
+    elapsed = time.perf_counter() - start
+    return {
+        "mb_per_sec": round(total_bytes / elapsed / 1e6, 2),
+        "ms_per_message": round(elapsed / len(inputs) * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    legacy_texts = [legacy_clean_html(h) for h in corpus]
+    texts = [html_to_text(h) for h in corpus]
+
+    report: Dict[str, Any] = {
+        "messages": args.messages,
+        "avg_html_kb": round(sum(len(h) for h in corpus) / len(corpus) / 1024, 1),
+        # style/script text no longer reaches NER
+        "avg_text_kb": {
+            "legacy": round(sum(len(t) for t in legacy_texts) / len(corpus) / 1024, 1),
+            "html_to_text": round(sum(len(t) for t in texts) / len(corpus) / 1024, 1),
+        },
+        "clean_html": {
+            "legacy": measure(legacy_clean_html, corpus),
+            "html_to_text": measure(html_to_text, corpus),
+        },
+        "extract_regex_entities": {
+            "legacy": measure(legacy_extract_regex_entities, texts),
+            "single_scan": measure(extract_regex_entities, texts),
+        },
+        "extraction_matches": sum(
+            legacy_extract_regex_entities(t) == extract_regex_entities(t) for t in texts
+        ),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# benchmarks/mailbox.py
+"""
+Synthetic mailboxes for benchmarks, modelled on the notices in emails.json.
+
+Each message is a Graph message dict (same shape as fake_graph.make_message) with
+a realistic HTML body: <head>/<style>, a layout table, a details table with the
+amount / due date / reference, a call-to-action link, a legal footer, entities
+(&nbsp; &amp; &#36;) and a tracking pixel. Amounts, dates, references, names and
+read state vary per message, so analysis caches don't collapse the corpus.
+Generation is deterministic for a given (index, seed).
+
+Templates: IRAS tax, CPF statement, UOB billing, OCBC verification, POSB
+e-statement, HR contract renewal, LTA licence renewal, SP Group utilities,
+polyclinic appointment, ICA passport renewal, and a newsletter with no action.
+
+Write one out as Graph JSON lines:
+    python -m benchmarks.mailbox --messages 10000 --out mailbox-10k.jsonl
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+NAMES = ["Tan Wei Ming", "Siti Nurhaliza", "Rajesh Kumar", "Lim Mei Ling", "Fong Kah Wai", "Nur Aisyah"]
+RECEIVED_FROM = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def human_date(rng: random.Random) -> str:
+    return f"{rng.randint(1, 28)} {rng.choice(MONTHS)} 2025"
+
+
+def money(rng: random.Random, low: float, high: float) -> str:
+    return f"${rng.uniform(low, high):,.2f}"
+
+
+# --------------------------
+# Templates: (subject, sender, org, detail rows, paragraphs html, call to action)
+# --------------------------
+
+def iras(rng: random.Random):
+    ref = f"IRAS-{rng.randint(10**7, 10**8 - 1)}"
+    due = human_date(rng)
+    return (
+        "Notice of Assessment (Individual) for Year of Assessment 2025",
+        "no-reply@iras.gov.sg",
+        "IRAS",
+        [("Tax payable", money(rng, 200, 12000)), ("Due date", due), ("Reference", ref)],
+        f"<p>Your Notice of Assessment for Year of Assessment 2025 is ready. Please make payment by {due} "
+        "to avoid a late payment penalty.</p><p>If you are on GIRO, deductions will start automatically.</p>",
+        "Log in to myTax Portal",
+    )
+
+
+def cpf(rng: random.Random):
+    return (
+        f"Your CPF Contribution Statement for {rng.choice(MONTHS)} 2025",
+        "statements@cpf.gov.sg",
+        "CPF Board",
+        [
+            ("Ordinary Account", money(rng, 1000, 90000)),
+            ("MediSave Account", money(rng, 1000, 60000)),
+            ("Statement date", human_date(rng)),
+        ],
+        "<p>Your monthly CPF contribution statement is now available. Employer and employee "
+        "contributions for the month have been credited.</p>",
+        "View statement on my cpf digital services",
+    )
+
+
+def uob(rng: random.Random):
+    due = human_date(rng)
+    return (
+        "UOB Billing Statement Ready",
+        "statements@uob.com.sg",
+        "UOB",
+        [("Total amount payable", money(rng, 50, 5000)), ("Minimum payment", money(rng, 50, 100)), ("Payment due", due)],
+        "<p>Dear Customer,</p><p>Your UOB billing statement is now available.<br>"
+        f"Payment due on {due}.</p>",
+        "Click here to view statement",
+    )
+
+
+def ocbc(rng: random.Random):
+    return (
+        "Verification Needed for Your OCBC Account",
+        "alerts@ocbc.com",
+        "OCBC",
+        [("Activity detected", human_date(rng)), ("Device", rng.choice(["iPhone", "Android", "Windows PC"]))],
+        "<p>Dear User,</p><p>We detected unusual activity and verification is needed to secure your account. "
+        "Please verify your identity to continue accessing your services.</p>",
+        "Click here to log in to your OCBC account",
+    )
+
+
+def posb(rng: random.Random):
+    return (
+        f"Your POSB E-Statement for {rng.choice(MONTHS)}",
+        "estatements@posb.com.sg",
+        "POSB",
+        [("Account", f"***-**{rng.randint(100, 999)}-{rng.randint(0, 9)}"), ("Closing balance", money(rng, 10, 40000))],
+        "<p>Dear Customer,</p><p>Your monthly e-statement is now available. Please log in to access your "
+        "account and view statement.</p>",
+        "View e-statement",
+    )
+
+
+def hr(rng: random.Random):
+    return (
+        "Contract Renewal Discussion",
+        "hr@company.com.sg",
+        "HR Department",
+        [("Contract end", human_date(rng)), ("Consultation slots", "Mon-Fri, 10am-4pm")],
+        "<p>Hi,</p><p>This is a reminder regarding your upcoming contract renewal. Your employment contract is "
+        "expiring soon, and HR would like to schedule a consultation to discuss the next steps.</p>",
+        "Please click here to select an appointment date",
+    )
+
+
+def lta(rng: random.Random):
+    expiry = human_date(rng)
+    return (
+        "License Renewal Reminder",
+        "no-reply@lta.gov.sg",
+        "Land Transport Authority",
+        [("Licence", f"VL{rng.randint(10**5, 10**6 - 1)}"), ("Expiry date", expiry)],
+        f"<p>Dear Applicant,</p><p>Your vocational license is due for renewal and will expire on {expiry}. "
+        "Please submit the required documents to complete the renewal process.</p>",
+        "Click here to submit documents",
+    )
+
+
+def sp_group(rng: random.Random):
+    due = human_date(rng)
+    return (
+        "Your SP Utilities Bill is Ready",
+        "ebill@spgroup.com.sg",
+        "SP Group",
+        [("Amount due", money(rng, 40, 600)), ("Due date", due), ("Account no", str(rng.randint(10**9, 10**10 - 1)))],
+        "<p>Your electricity, water &amp; gas bill for this month is ready. Pay by the due date to avoid "
+        "late charges.</p>",
+        "Pay bill now",
+    )
+
+
+def polyclinic(rng: random.Random):
+    return (
+        "Appointment Confirmation - Polyclinic",
+        "appointments@polyclinic.gov.sg",
+        "SingHealth Polyclinics",
+        [("Appointment", f"{human_date(rng)}, {rng.randint(8, 16)}:{rng.choice(['00', '15', '30', '45'])}"),
+         ("Clinic", rng.choice(["Bedok", "Pasir Ris", "Tampines", "Marine Parade"]))],
+        "<p>Your appointment has been booked. Please bring your NRIC and arrive 15 minutes early. "
+        "To reschedule, use the link below.</p>",
+        "Manage appointment",
+    )
+
+
+def ica(rng: random.Random):
+    return (
+        "Passport Renewal: Documents Required",
+        "no-reply@ica.gov.sg",
+        "ICA",
+        [("Passport expiry", human_date(rng)), ("Application ref", f"ICA{rng.randint(10**6, 10**7 - 1)}")],
+        "<p>Your passport will expire within 6 months. Please submit a recent photograph and the required "
+        "documents to apply for a new passport.</p>",
+        "Apply online",
+    )
+
+
+def newsletter(rng: random.Random):
+    items = "".join(
+        f"<tr><td style=\"padding:8px\"><h3>Story {n}</h3><p>{' '.join(['Lorem ipsum dolor sit amet.'] * rng.randint(3, 12))}</p></td></tr>"
+        for n in range(rng.randint(3, 8))
+    )
+    return (
+        "This Week at Woodlands Community Club",
+        "news@community.org.sg",
+        "Woodlands CC",
+        [],
+        f"<table width=\"100%\">{items}</table>",
+        "Read more",
+    )
+
+
+# (template, weight): roughly the mix of a personal inbox full of notices
+TEMPLATES: List[Tuple[Callable[[random.Random], Tuple], int]] = [
+    (iras, 8), (cpf, 10), (uob, 14), (ocbc, 8), (posb, 10), (hr, 5),
+    (lta, 6), (sp_group, 12), (polyclinic, 7), (ica, 4), (newsletter, 16),
+]
+_WEIGHTS = [w for _, w in TEMPLATES]
+
+FOOTER = (
+    "<p style=\"font-size:11px;color:#888\">This is a system-generated email. Please do not reply.<br>"
+    "For security reasons, we will never ask for your password or OTP via email.<br>"
+    "&copy; 2025 {org}. All rights reserved.&nbsp;|&nbsp;<a href=\"https://example.com/privacy\">Privacy</a>"
+    "&nbsp;|&nbsp;<a href=\"https://example.com/unsubscribe\">Unsubscribe</a></p>"
+)
+
+
+def render_html(org: str, name: str, rows: List[Tuple[str, str]], paragraphs: str, action: str, token: str) -> str:
+    details = "".join(
+        # some mailers encode "$" as &#36;
+        f"<tr><td style=\"padding:4px 12px;color:#555\">{label}</td>"
+        f"<td style=\"padding:4px 12px\"><b>{value.replace('$', '&#36;') if n % 2 else value}</b></td></tr>"
+        for n, (label, value) in enumerate(rows)
+    )
+    return (
+        "<html><head><meta charset=\"utf-8\"><style>"
+        "body{font-family:Arial,sans-serif;color:#222} .btn{background:#0b5;color:#fff;padding:10px 16px}"
+        "</style></head><body>"
+        "<table width=\"100%\" cellpadding=\"0\" cellspacing=\"0\"><tr><td align=\"center\">"
+        f"<img src=\"https://example.com/logo/{org.replace(' ', '-').lower()}.png\" alt=\"{org}\" width=\"120\">"
+        "</td></tr><tr><td style=\"padding:16px\">"
+        f"<p>Dear {name},</p>{paragraphs}"
+        + (f"<table border=\"0\">{details}</table>" if details else "")
+        + f"<p><a class=\"btn\" href=\"https://example.com/go?t={token}\">{action}</a></p>"
+        f"<p>Regards,<br>{org}</p>"
+        "</td></tr></table>"
+        + FOOTER.format(org=org)
+        + f"<img src=\"https://example.com/open.gif?t={token}\" width=\"1\" height=\"1\" alt=\"\">"
+        "</body></html>"
+    )
+
+
+def make_message(i: int, seed: int = 0) -> Dict[str, Any]:
+    """Message i of the synthetic mailbox for seed; Graph message shape, id msg-{i:07d}."""
+    rng = random.Random(seed * 1_000_003 + i)
+    template = rng.choices(TEMPLATES, weights=_WEIGHTS)[0][0]
+    subject, sender, org, rows, paragraphs, action = template(rng)
+    name = rng.choice(NAMES)
+    token = f"{i:x}{rng.getrandbits(32):08x}"
+    html = render_html(org, name, rows, paragraphs, action, token)
+    received = RECEIVED_FROM + timedelta(minutes=i * 7 + rng.randint(0, 6))
+    return {
+        "id": f"msg-{i:07d}",
+        "changeKey": "ck-0",
+        "subject": subject,
+        "from": {"emailAddress": {"address": sender}},
+        "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "bodyPreview": f"Dear {name}, {subject}"[:255],
+        "isRead": rng.random() < 0.6,
+        "hasAttachments": rng.random() < 0.3,
+        "body": {"contentType": "html", "content": html},
+    }
+
+
+def make_mailbox(messages: int, seed: int = 0) -> List[Dict[str, Any]]:
+    return [make_message(i, seed) for i in range(messages)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    with open(args.out, "w", encoding="utf-8") as f:
+        for i in range(args.messages):
+            f.write(json.dumps(make_message(i, args.seed)) + "\n")
+    print(f"Wrote {args.messages} messages to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
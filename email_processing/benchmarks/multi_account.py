@@ -0,0 +1,107 @@
+# benchmarks/multi_account.py
+"""
+Many mailboxes in one process (accounts.py) against FakeGraph: one huge backfill
+plus many small accounts, synced together over one Graph connection pool.
+
+Each account gets its own FakeGraph; requests are routed by their bearer token.
+Reports when each account finished its first sync (small accounts should not wait
+for the big one), the Graph requests made and the process's peak RSS.
+
+Run from email_processing/:
+    python -m benchmarks.multi_account --big 5000 --small 20 --concurrency 4
+    python -m benchmarks.multi_account --big 5000 --small 20 --concurrency 4 --workers 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+from typing import Any, Dict
+
+# every run does the full analysis work (and leaves no cache behind)
+os.environ.setdefault("ANALYSIS_CACHE_MAX_ENTRIES", "0")
+
+import httpx  # noqa: E402
+
+from accounts import Account, AccountScheduler  # noqa: E402
+from analysis_pool import AnalysisPool  # noqa: E402
+from benchmarks.fake_graph import FakeGraph  # noqa: E402
+from benchmarks.mailbox import make_mailbox  # noqa: E402
+from graph_client import GraphClient  # noqa: E402
+
+
+def routed_transport(graphs: Dict[str, FakeGraph]) -> httpx.MockTransport:
+    async def handle(request: httpx.Request) -> httpx.Response:
+        token = request.headers["Authorization"].split(" ", 1)[1]
+        return await graphs[token].handle(request)
+
+    return httpx.MockTransport(handle)
+
+
+async def run(args: argparse.Namespace, root: str) -> Dict[str, Any]:
+    sizes = {"big": args.big, **{f"small-{i:03d}": args.small_messages for i in range(args.small)}}
+    graphs = {
+        account_id: FakeGraph(make_mailbox(size, seed=n), latency_seconds=args.latency_ms / 1000)
+        for n, (account_id, size) in enumerate(sizes.items())
+    }
+    accounts = []
+    for account_id in sizes:
+        account = Account(account_id, root=root)
+        account.get_token = lambda account_id=account_id: account_id
+        accounts.append(account)
+
+    pool = AnalysisPool(workers=args.workers) if args.workers else None
+    if pool is not None:
+        await pool.start()
+    finished: Dict[str, float] = {}
+    async with GraphClient(lambda: "", transport=routed_transport(graphs)) as graph:
+        scheduler = AccountScheduler(accounts, graph, pool, concurrency=args.concurrency)
+        run_account = scheduler.run_account
+        start = time.perf_counter()
+
+        async def timed(account: Account) -> Any:
+            result = await run_account(account)
+            finished[account.id] = time.perf_counter() - start
+            return result
+
+        scheduler.run_account = timed
+        results = await scheduler.run_all_once()
+    if pool is not None:
+        await pool.stop()
+
+    small = [finished[a] for a in sizes if a != "big" and a in finished]
+    return {
+        "accounts": len(sizes),
+        "concurrency": args.concurrency,
+        "analysis_workers": args.workers,
+        "errors": {a: r["error"] for a, r in results.items() if "error" in r},
+        "stored": {"big": results["big"].get("new"), "small_total": sum(r.get("new", 0) for a, r in results.items() if a != "big")},
+        "big_done_seconds": round(finished.get("big", float("nan")), 2),
+        "small_done_seconds": {
+            "p50": round(statistics.median(small), 2) if small else None,
+            "max": round(max(small), 2) if small else None,
+        },
+        "graph_requests": sum(g.requests for g in graphs.values()),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--big", type=int, default=5000, help="messages in the big mailbox")
+    parser.add_argument("--small", type=int, default=20, help="number of small accounts")
+    parser.add_argument("--small-messages", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=0, help="AnalysisPool workers (0 = analyze in threads)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated Graph latency per request")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="woomail-accounts-") as root:
+        print(json.dumps(asyncio.run(run(args, root)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
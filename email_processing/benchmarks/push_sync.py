@@ -0,0 +1,110 @@
+# benchmarks/push_sync.py
+"""
+End-to-end check of push mode against FakeGraph, through the real API app.
+
+Starts api.app in-process with GRAPH_NOTIFICATION_URL set (FakeGraph posts its
+notifications to the app through httpx.ASGITransport), then:
+  - waits for the subscription (validationToken handshake) and the initial poll
+  - for --rounds rounds: delivers --new-messages new messages plus read-state
+    changes, emits the notifications, and times how long until they are in the store
+  - sends lifecycle events (reauthorizationRequired, subscriptionRemoved) and
+    checks the subscription is renewed / recreated
+  - runs one polling sync at the end, which should find nothing left to do
+
+Reports notification-to-stored latency and Graph requests per round.
+
+Run from email_processing/ (uses ./emails.db, so point EMAIL_DB_PATH at a scratch file):
+    EMAIL_DB_PATH=/tmp/push.db python -m benchmarks.push_sync --messages 500 --rounds 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("GRAPH_NOTIFICATION_URL", "http://testserver/notifications")
+os.environ.setdefault("SYNC_INTERVAL_SECONDS", "3600")
+os.environ.setdefault("NOTIFICATION_DEBOUNCE_SECONDS", "0.05")
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+from benchmarks.fake_graph import FakeGraph, make_message  # noqa: E402
+from graph_client import GraphClient  # noqa: E402
+from store import get_store  # noqa: E402
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 30.0) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.005)
+    return False
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    graph = FakeGraph([make_message(i) for i in range(args.messages)], webhook=httpx.ASGITransport(app=api.app))
+    api.make_graph_client = lambda **kwargs: GraphClient(lambda: "bench-token", transport=graph.transport())
+    store = get_store()
+    report: Dict[str, Any] = {"messages": args.messages, "rounds": args.rounds}
+
+    async with api.app.router.lifespan_context(api.app):
+        state = api.app.state
+        report["subscribed"] = await wait_until(lambda: state.subscriptions.active)
+        report["initial_poll"] = await wait_until(lambda: state.scheduler.last_success_at is not None)
+
+        latencies: List[float] = []
+        requests: List[int] = []
+        next_id = args.messages
+        for r in range(args.rounds):
+            for _ in range(args.new_messages):
+                graph.add_message(make_message(next_id))
+                next_id += 1
+            for i in range(args.updates):
+                graph_id = f"msg-{(r * args.updates + i) % args.messages:07d}"
+                graph.update_message(graph_id, isRead=not graph.messages[graph_id]["isRead"])
+
+            runs, before = state.notifications.runs, graph.requests
+            start = time.perf_counter()
+            await graph.emit_notifications()
+            await wait_until(lambda: state.notifications.runs > runs)
+            latencies.append(time.perf_counter() - start)
+            requests.append(graph.requests - before)
+
+        stored = set(store.get_by_graph_ids(f"msg-{i:07d}" for i in range(args.messages, next_id)))
+        report["new_stored"] = f"{len(stored)}/{next_id - args.messages}"
+        report["latency_ms"] = {
+            "p50": round(statistics.median(latencies) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+        }
+        report["graph_requests_per_round"] = round(statistics.mean(requests), 1)
+
+        renewed = state.subscriptions.renewed
+        await graph.emit_lifecycle("reauthorizationRequired")
+        report["renewed"] = await wait_until(lambda: state.subscriptions.renewed > renewed)
+        created = state.subscriptions.created
+        await graph.emit_lifecycle("subscriptionRemoved")
+        report["recreated"] = await wait_until(lambda: state.subscriptions.created > created)
+
+        result = await state.scheduler.run_once()
+        report["fallback_poll"] = result
+        report["notifications"] = state.notifications.stats()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--new-messages", type=int, default=3, help="new messages per round")
+    parser.add_argument("--updates", type=int, default=5, help="read-state flips per round")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
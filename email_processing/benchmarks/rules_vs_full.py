@@ -0,0 +1,98 @@
+# benchmarks/rules_vs_full.py
+"""
+Throughput + accuracy of ANALYSIS_MODE=rules against the full spaCy pipeline.
+
+Accuracy is measured on benchmarks/data/labelled_sample.jsonl (hand-labelled
+org / email_type / summary flags); agreement is how often the two modes give
+the same answer per field. Throughput runs the sample set repeated up to
+--messages texts through analyze_emails with the analysis cache off.
+
+Run from email_processing/:
+    python -m benchmarks.rules_vs_full --messages 5000
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from email_processor import analyze_emails
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "labelled_sample.jsonl")
+FIELDS = [
+    "org",
+    "email_type",
+    "has_renewal",
+    "has_appointment",
+    "has_billing",
+    "docs_required",
+    "verification_needed",
+    "has_action_link",
+]
+
+
+def load_samples(path: str = SAMPLE_PATH) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def norm(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+def accuracy(results: List[Dict[str, Any]], samples: List[Dict[str, Any]]) -> Dict[str, float]:
+    scores = {}
+    for field in FIELDS:
+        correct = sum(norm(r.get(field)) == norm(s["labels"].get(field)) for r, s in zip(results, samples))
+        scores[field] = round(correct / len(samples), 3)
+    scores["all_fields"] = round(
+        sum(all(norm(r.get(f)) == norm(s["labels"].get(f)) for f in FIELDS) for r, s in zip(results, samples))
+        / len(samples),
+        3,
+    )
+    return scores
+
+
+def throughput(texts: List[str], mode: str) -> float:
+    analyze_emails(texts[:8], use_cache=False, mode=mode)  # warm up (model load, matcher build)
+    start = time.perf_counter()
+    analyze_emails(texts, use_cache=False, mode=mode)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    texts = [s["text"] for s in samples]
+    # make each copy distinct so nothing is deduplicated away
+    corpus = [f"{texts[i % len(texts)]}\n#{i}" for i in range(args.messages)]
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    report: Dict[str, Any] = {"samples": len(samples), "messages": args.messages, "modes": {}}
+    for mode in ("full", "rules"):
+        results[mode] = analyze_emails(texts, use_cache=False, mode=mode)
+        report["modes"][mode] = {
+            "messages_per_sec": round(throughput(corpus, mode), 1),
+            "accuracy": accuracy(results[mode], samples),
+        }
+
+    report["agreement"] = {
+        field: round(
+            sum(norm(f.get(field)) == norm(r.get(field)) for f, r in zip(results["full"], results["rules"]))
+            / len(samples),
+            3,
+        )
+        for field in FIELDS
+    }
+    full_rate = report["modes"]["full"]["messages_per_sec"]
+    report["speedup"] = round(report["modes"]["rules"]["messages_per_sec"] / full_rate, 1) if full_rate else None
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# benchmarks/search.py
+"""
+Full-text search (search.py / the store's sharded FTS5 index) at mailbox scale.
+
+Analyzes a sample of the synthetic mailbox (benchmarks/mailbox.py) with the rules
+pipeline, then stores N emails cycled from it, each with its own id, ref and amount
+so the index isn't just N copies. Reports:
+  - bulk indexing throughput (insert_emails with bodies) and database size
+  - one sync-sized insert (--batch emails) at full size: the incremental cost
+  - latency of typical queries (p50 / p99 over --repeat runs): common and rare words,
+    prefixes, phrases, label:/org: filters and a negation
+
+Run from email_processing/:
+    python -m benchmarks.search --messages 100000
+    python -m benchmarks.search --messages 1000000 --repeat 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List
+
+QUERIES = [
+    "statement",                      # in a large share of the mailbox
+    "stat",                           # typed so far: prefix
+    "passport renewal",
+    '"amount payable"',
+    "label:BILLING org:UOB",          # filters only: newest first
+    'org:"CPF Board" contribution',
+    "renewal -passport",
+    "REF-0012345",                    # one message
+]
+
+
+def build_records(sample: int, seed: int) -> List[Dict[str, Any]]:
+    from benchmarks.mailbox import make_mailbox
+    from email_processor import clean_html, summarize_rules
+
+    records = []
+    for message in make_mailbox(sample, seed=seed):
+        text = clean_html(message["body"]["content"])
+        records.append({"message": message, "text": text, "analysis": summarize_rules(text)})
+    return records
+
+
+def variant(template: Dict[str, Any], i: int) -> Any:
+    """Email i, cycled from template but with its own ids, ref and amount."""
+    message, analysis = template["message"], dict(template["analysis"])
+    ref = f"REF-{i:07d}"
+    amount = f"${i % 5000}.{i % 100:02d}"
+    analysis.update({
+        "refs": [ref],
+        "amounts": [amount],
+        "subject": message.get("subject"),
+        "category": analysis.get("email_type") or "Uncategorized",
+        "preview": message.get("bodyPreview", ""),
+    })
+    record = {
+        "id": i,
+        "graph_id": f"msg-{i:08d}",
+        "subject": message.get("subject"),
+        "senderEmail": message["from"]["emailAddress"]["address"],
+        "receivedAt": message.get("receivedDateTime"),
+        "analysis": analysis,
+    }
+    return record, f"{template['text']}\n{ref} {amount}"
+
+
+def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    from search import search_emails
+    from store import EmailStore
+
+    templates = build_records(args.sample, args.seed)
+    store = EmailStore(os.path.join(workdir, "emails.db"))
+
+    start = time.perf_counter()
+    chunk = 5000
+    for first in range(0, args.messages, chunk):
+        pairs = [variant(templates[i % len(templates)], i) for i in range(first, min(first + chunk, args.messages))]
+        store.insert_emails([r for r, _ in pairs], [b for _, b in pairs])
+    index_seconds = time.perf_counter() - start
+
+    pairs = [variant(templates[i % len(templates)], i) for i in range(args.messages, args.messages + args.batch)]
+    start = time.perf_counter()
+    store.insert_emails([r for r, _ in pairs], [b for _, b in pairs])
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    queries: Dict[str, Any] = {}
+    for q in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = search_emails(store, q, limit=20)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        queries[q] = {
+            "hits": len(result["items"]),
+            "p50_ms": round(statistics.median(timings), 2),
+            "p99_ms": round(timings[min(len(timings) - 1, int(0.99 * len(timings)))], 2),
+        }
+    store.close()
+
+    db_bytes = sum(
+        os.path.getsize(os.path.join(workdir, f)) for f in os.listdir(workdir) if f.startswith("emails.db")
+    )
+    return {
+        "messages": args.messages,
+        "index_messages_per_second": round(args.messages / index_seconds),
+        "db_mb": round(db_bytes / 1e6, 1),
+        f"insert_{args.batch}_ms": round(batch_ms, 2),
+        "queries": queries,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=2000, help="distinct analyzed messages to cycle through")
+    parser.add_argument("--batch", type=int, default=50, help="emails in the incremental insert")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="woomail-search-") as workdir:
+        print(json.dumps(run(args, workdir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
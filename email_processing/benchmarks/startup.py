@@ -0,0 +1,68 @@
+# benchmarks/startup.py
+"""
+Import-to-first-response benchmark: eager vs lazy model loading.
+
+Each sample is a fresh interpreter, timed from before `import api` until
+the first /health response (no lifespan, so nothing talks to Graph).
+  eager: load the spaCy model before serving, like the old import-time load
+  lazy:  serve /health straight away (the lifespan warms the model later)
+  ready: lazy import + warmup(), i.e. time until /health/ready would say 200
+
+Run from email_processing/:
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import api
+import email_processor
+mode = {mode!r}
+if mode in ("eager", "ready"):
+    email_processor.warmup()
+from fastapi.testclient import TestClient
+status = TestClient(api.app).get("/health").status_code
+t1 = time.perf_counter()
+print(json.dumps({{"seconds": t1 - t0, "status": status}}))
+"""
+
+
+def sample(mode: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(mode=mode)],
+        cwd=HERE, capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1]
+    return json.loads(out)["seconds"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("eager", "lazy", "ready"):
+        times = [sample(mode) for _ in range(args.runs)]
+        results[mode] = {
+            "median_ms": round(statistics.median(times) * 1000, 1),
+            "min_ms": round(min(times) * 1000, 1),
+            "max_ms": round(max(times) * 1000, 1),
+        }
+        print(f"{mode:>5}: median {results[mode]['median_ms']} ms "
+              f"(min {results[mode]['min_ms']}, max {results[mode]['max_ms']})")
+
+    speedup = results["eager"]["median_ms"] / max(results["lazy"]["median_ms"], 0.001)
+    print(f"first /health response {speedup:.1f}x sooner with lazy loading")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/stats.py
+"""
+GET /stats aggregates: columnar (columns.FlagColumns) vs. scanning email dicts.
+
+Builds N synthetic analysed emails (orgs / categories / flags / amounts drawn like
+the IRAS / CPF / UOB / OCBC mail we see), then times:
+  - bulk load into the columns (what the API does on first request)
+  - incremental upserts / removes (what each sync applies)
+  - stats() against the equivalent per-email Python loop
+
+Run from email_processing/:
+    python -m benchmarks.stats --sizes 100000 1000000
+"""
+
+import argparse
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from columns import FLAG_FIELDS, FlagColumns, first_amount
+
+ORGS = ["IRAS", "CPF Board", "UOB", "OCBC", "DBS", "SP Services", "SingHealth", None]
+CATEGORIES = ["Notice of Assessment", "billing statement", "CPF contribution", "e-statement",
+              "clinic appointment", "passport renewal", "Uncategorized"]
+
+
+def make_email(i: int, rng: random.Random) -> Dict[str, Any]:
+    analysis: Dict[str, Any] = {flag: rng.random() < 0.2 for flag in FLAG_FIELDS}
+    analysis.update({
+        "org": rng.choice(ORGS),
+        "category": rng.choice(CATEGORIES),
+        "isRead": rng.random() < 0.6,
+        "amounts": [f"${rng.randint(1, 5000)}.{rng.randint(0, 99):02d}"] if rng.random() < 0.5 else [],
+    })
+    return {"id": i, "analysis": analysis}
+
+
+def scan_stats(emails: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """What the dashboard did before: one pass over every email dict."""
+    counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    flags = dict.fromkeys(FLAG_FIELDS, 0)
+    due: Dict[str, float] = defaultdict(float)
+    for email in emails:
+        a = email["analysis"]
+        c = counts[a["category"]]
+        c[0] += 1
+        c[1] += not a["isRead"]
+        for flag in FLAG_FIELDS:
+            flags[flag] += bool(a[flag])
+        if a["has_billing"] and a["org"]:
+            amount = first_amount(a)
+            if amount == amount:
+                due[a["org"]] += amount
+    return {"categories": dict(counts), "flags": flags, "due": dict(due)}
+
+
+def timed(fn, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(size: int, updates: int) -> Dict[str, Any]:
+    rng = random.Random(size)
+    emails = [make_email(i, rng) for i in range(size)]
+
+    columns = FlagColumns()
+    load_seconds = timed(lambda: columns.extend(emails))
+
+    changed = [make_email(rng.randrange(size), rng) for _ in range(updates)]
+    upsert_seconds = timed(lambda: [columns.upsert(e["id"], e) for e in changed])
+    removed = [rng.randrange(size) for _ in range(updates)]
+    remove_seconds = timed(lambda: [columns.remove(i) for i in removed])
+
+    stats = columns.stats()
+    return {
+        "emails": size,
+        "column_bytes": columns.nbytes(),
+        "bulk_load_seconds": round(load_seconds, 3),
+        "upsert_us_per_email": round(upsert_seconds / updates * 1e6, 2),
+        "remove_us_per_email": round(remove_seconds / updates * 1e6, 2),
+        "stats_ms": round(timed(columns.stats, repeat=5) * 1000, 2),
+        "scan_ms": round(timed(lambda: scan_stats(emails)) * 1000, 2),
+        "total_after_updates": stats["total"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--updates", type=int, default=10_000, help="incremental upserts / removes to time")
+    args = parser.parse_args()
+
+    report = [run(size, args.updates) for size in args.sizes]
+    for r in report:
+        r["speedup"] = round(r["scan_ms"] / r["stats_ms"], 1) if r["stats_ms"] else None
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# benchmarks/suite.py
+"""
+End-to-end benchmark suite over synthetic mailboxes (benchmarks/mailbox.py).
+
+For each mailbox size (default 1k, 10k, 100k) a fresh interpreter with its own
+scratch store runs, in order:
+  clean_html        per message
+  analyze_email     per message, on the first --analyze-sample messages (NER is slow)
+  analyze_emails    the whole corpus in --chunk sized batches (the sync path)
+  sync_initial      sync_emails against FakeGraph into an empty store
+  sync_incremental  sync_emails after 1% new, 1% read-state flips, 0.5% deletes
+  build_task        build_task_and_attachments per stored email
+  generate_tasks    generate_tasks_and_attachments(full=True)
+The analysis cache is off, so every stage does the full work.
+
+Each stage reports messages/sec, p50/p99 per-message latency (batched stages:
+batch time / batch size; whole-sync stages: none) and peak RSS of the process
+at the end of the stage.
+
+Results go to --out as JSON. With a baseline (--baseline, default
+benchmarks/baseline.json) the run is compared stage by stage, and the exit status
+is 1 if any stage regressed past the thresholds: throughput drop, p99 increase,
+peak RSS increase (fractions; flags override the baseline's "thresholds").
+--save-baseline stores this run, with its thresholds, as the new baseline.
+
+Run from email_processing/:
+    python -m benchmarks.suite --sizes 1000,10000 --out bench.json
+    python -m benchmarks.suite --sizes 1000,10000 --save-baseline
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_THRESHOLDS = {
+    "throughput_drop": 0.15,
+    "p99_increase": 0.25,
+    "rss_increase": 0.20,
+}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(messages: int, seconds: float, latencies: Optional[List[float]] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "messages": messages,
+        "seconds": round(seconds, 3),
+        "messages_per_sec": round(messages / seconds, 1) if seconds > 0 else None,
+        "p50_ms": None,
+        "p99_ms": None,
+    }
+    if latencies:
+        latencies = sorted(latencies)
+        result["p50_ms"] = round(statistics.median(latencies) * 1000, 4)
+        result["p99_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 4)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def per_item(items: List[Any], fn: Callable[[Any], Any]) -> Dict[str, Any]:
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(len(items), time.perf_counter() - start, latencies)
+
+
+# ==========================
+# One mailbox size (runs in a fresh process)
+# ==========================
+
+def run_size(size: int, seed: int, chunk: int, analyze_sample: int, workdir: str) -> Dict[str, Any]:
+    # Store, cache and lock paths come from the environment / cwd, so set them before importing
+    os.chdir(workdir)
+    os.environ["EMAIL_DB_PATH"] = os.path.join(workdir, "emails.db")
+    os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(workdir, "analysis_cache.db")
+    os.environ["ANALYSIS_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["SYNC_LOCK_PATH"] = os.path.join(workdir, "sync.lock")
+    # attachment downloads have their own benchmark (benchmarks/attachments.py)
+    os.environ["ATTACHMENTS_ENABLED"] = "0"
+
+    from benchmarks.fake_graph import FakeGraph
+    from benchmarks.mailbox import make_mailbox, make_message
+    from email_processor import (
+        DELTA_PAGE_SIZE,
+        analyze_email,
+        analyze_emails,
+        build_task_and_attachments,
+        clean_html,
+        generate_tasks_and_attachments,
+        sync_emails,
+        warmup,
+    )
+    from graph_client import GraphClient
+    from store import get_store
+
+    stages: Dict[str, Any] = {}
+    messages = make_mailbox(size, seed)
+    stages["baseline_rss_mb"] = peak_rss_mb()
+
+    texts: List[str] = []
+    stages["clean_html"] = per_item(messages, lambda m: texts.append(clean_html(m["body"]["content"])))
+
+    warmup()  # model load isn't part of any stage
+    stages["analyze_email"] = per_item(texts[:analyze_sample], analyze_email)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), chunk):
+        batch = texts[i:i + chunk]
+        t0 = time.perf_counter()
+        analyze_emails(batch, use_cache=False)
+        latencies.append((time.perf_counter() - t0) / len(batch))
+    stages["analyze_emails"] = summarize(len(texts), time.perf_counter() - start, latencies)
+    del texts
+
+    graph = FakeGraph(messages, page_size=DELTA_PAGE_SIZE)
+
+    async def sync() -> Dict[str, Any]:
+        async with GraphClient(lambda: "bench-token", transport=graph.transport()) as client:
+            return await sync_emails(client)
+
+    start = time.perf_counter()
+    result = asyncio.run(sync())
+    stages["sync_initial"] = {**summarize(result["new"], time.perf_counter() - start), "result": result}
+
+    step = max(1, size // 100)
+    for n in range(step):
+        graph.add_message(make_message(size + n, seed))
+        graph_id = messages[n * 100 % size]["id"]
+        if graph_id in graph.messages:
+            graph.update_message(graph_id, isRead=not graph.messages[graph_id]["isRead"])
+        if n % 2:
+            graph.delete_message(messages[(n * 100 + 50) % size]["id"])
+    start = time.perf_counter()
+    result = asyncio.run(sync())
+    changed = result["new"] + result["changed"] + result["removed"]
+    stages["sync_incremental"] = {**summarize(changed, time.perf_counter() - start), "result": result}
+
+    emails = get_store().load_emails()
+    stages["build_task"] = per_item(emails, build_task_and_attachments)
+
+    start = time.perf_counter()
+    generate_tasks_and_attachments(full=True)
+    stages["generate_tasks"] = summarize(len(emails), time.perf_counter() - start)
+    return stages
+
+
+def _child(size: int, seed: int, chunk: int, analyze_sample: int, workdir: str, results) -> None:
+    sys.path.insert(0, os.path.dirname(HERE))
+    try:
+        results.put(run_size(size, seed, chunk, analyze_sample, workdir))
+    except BaseException as e:
+        results.put({"error": repr(e)})
+        raise
+
+
+# ==========================
+# Baseline comparison
+# ==========================
+
+def compare(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    thresholds: Dict[str, float],
+) -> List[Dict[str, Any]]:
+    """One row per (size, stage, metric) in both runs; "regressed" marks the ones past a threshold."""
+    rows = []
+    for size, stages in results.get("sizes", {}).items():
+        for stage, new in stages.items():
+            old = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if not isinstance(new, dict) or not isinstance(old, dict):
+                continue
+            checks = [
+                # (metric, limit: new must stay <= old * factor, or >= for throughput)
+                ("messages_per_sec", 1 - thresholds["throughput_drop"], False),
+                ("p99_ms", 1 + thresholds["p99_increase"], True),
+                ("peak_rss_mb", 1 + thresholds["rss_increase"], True),
+            ]
+            for metric, factor, lower_is_better in checks:
+                before, after = old.get(metric), new.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                regressed = after > before * factor if lower_is_better else after < before * factor
+                rows.append({
+                    "size": size,
+                    "stage": stage,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "change": round(change, 3),
+                    "regressed": regressed,
+                })
+    return rows
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated mailbox sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=256, help="batch size for analyze_emails")
+    parser.add_argument("--analyze-sample", type=int, default=2000, help="messages timed one by one in analyze_email")
+    parser.add_argument("--out", default="benchmark-results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--max-throughput-drop", type=float)
+    parser.add_argument("--max-p99-increase", type=float)
+    parser.add_argument("--max-rss-increase", type=float)
+    args = parser.parse_args()
+
+    from email_processor import ANALYSIS_MODE, SPACY_MODEL
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "analysis_mode": ANALYSIS_MODE,
+            "spacy_model": SPACY_MODEL,
+            "seed": args.seed,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "sizes": {},
+    }
+
+    # spawn: every size starts from a clean interpreter, so peak RSS is that size's alone
+    context = multiprocessing.get_context("spawn")
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        with tempfile.TemporaryDirectory(prefix="woomail-bench-") as workdir:
+            queue = context.Queue()
+            child = context.Process(
+                target=_child, args=(size, args.seed, args.chunk, args.analyze_sample, workdir, queue)
+            )
+            child.start()
+            stages = queue.get()
+            child.join()
+        if "error" in stages:
+            print(f"{size} messages: failed with {stages['error']}", file=sys.stderr)
+            return 2
+        results["sizes"][str(size)] = stages
+        for stage, r in stages.items():
+            if isinstance(r, dict):
+                print(
+                    f"{size:>7} {stage:<17} {r['messages_per_sec'] or 0:>10.1f} msg/s"
+                    f"  p50 {r['p50_ms'] if r['p50_ms'] is not None else '-':>8} ms"
+                    f"  p99 {r['p99_ms'] if r['p99_ms'] is not None else '-':>8} ms"
+                    f"  rss {r['peak_rss_mb']:>7.1f} MB"
+                )
+
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    for key, value in (
+        ("throughput_drop", args.max_throughput_drop),
+        ("p99_increase", args.max_p99_increase),
+        ("rss_increase", args.max_rss_increase),
+    ):
+        if value is not None:
+            thresholds[key] = value
+    results["thresholds"] = thresholds
+
+    regressions: List[Dict[str, Any]] = []
+    if baseline:
+        comparison = compare(results, baseline, thresholds)
+        regressions = [row for row in comparison if row["regressed"]]
+        results["comparison"] = {
+            "baseline_revision": baseline.get("meta", {}).get("revision"),
+            "rows": comparison,
+            "regressions": len(regressions),
+        }
+        for row in regressions:
+            print(
+                f"REGRESSION {row['size']} {row['stage']} {row['metric']}: "
+                f"{row['baseline']} -> {row['current']} ({row['change']:+.1%})"
+            )
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in results.items() if k != "comparison"}, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
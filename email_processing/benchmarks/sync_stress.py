@@ -0,0 +1,130 @@
+# benchmarks/sync_stress.py
+"""
+Stress test for sync coalescing and id allocation.
+
+Fires hundreds of concurrent sync requests at a FakeGraph, from several worker
+processes sharing one store + lock file, then checks:
+  - every message is stored exactly once
+  - ids are unique (and contiguous, since nothing was deleted)
+  - concurrent requests in a process were coalesced into a handful of runs
+
+Everything it writes (store, analysis cache, compiled patterns, attachments, lock files)
+goes to a fresh temp dir, and analysis runs in rules mode: this tests the sync
+plumbing, not NER, so it doesn't need a spaCy model.
+
+Run from email_processing/:
+    python -m benchmarks.sync_stress --messages 500 --requests 300 --workers 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_workdir(workdir: str) -> None:
+    """Point every file the sync writes at workdir (inherited by the spawned workers)."""
+    os.environ["EMAIL_DB_PATH"] = os.path.join(workdir, "emails.db")
+    os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(workdir, "analysis_cache.db")
+    os.environ["PATTERNS_COMPILED_DIR"] = os.path.join(workdir, "patterns.compiled")
+    os.environ["ATTACHMENTS_DIR"] = os.path.join(workdir, "attachments")
+    os.environ["SYNC_LOCK_PATH"] = os.path.join(workdir, "sync.lock")
+    os.environ["SUBSCRIPTION_LOCK_PATH"] = os.path.join(workdir, "subscription.lock")
+    os.environ["ANALYSIS_MODE"] = "rules"
+
+
+def worker(workdir: str, messages: int, requests: int, start_at: float, results) -> None:
+    # Anything still relative to the cwd lands in workdir too, shared by every process
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+
+    from benchmarks.fake_graph import FakeGraph, make_message
+    from email_processor import sync_emails
+    from graph_client import GraphClient
+    from scheduler import SyncScheduler
+
+    graph = FakeGraph([make_message(i) for i in range(messages)], latency_seconds=0.005)
+
+    async def main() -> Dict[str, Any]:
+        async with GraphClient(lambda: "stress-token", transport=graph.transport()) as client:
+            scheduler = SyncScheduler(lambda: sync_emails(client))
+            # line the processes up so their bursts actually overlap
+            await asyncio.sleep(max(0.0, start_at - time.time()))
+            outcomes = await asyncio.gather(
+                *(scheduler.run_once() for _ in range(requests)), return_exceptions=True
+            )
+            errors = [repr(o) for o in outcomes if isinstance(o, BaseException)]
+            return {
+                "pid": os.getpid(),
+                "runs": scheduler.runs,
+                "coalesced": scheduler.coordinator.coalesced,
+                "graph_requests": graph.requests,
+                "errors": errors[:3],
+            }
+
+    results.put(asyncio.run(main()))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=300, help="concurrent sync requests per worker")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes sharing one store")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sync-stress-")
+    use_workdir(workdir)
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start_at = time.time() + 3.0
+
+    procs = [
+        ctx.Process(target=worker, args=(workdir, args.messages, args.requests, start_at, results))
+        for _ in range(args.workers)
+    ]
+    for p in procs:
+        p.start()
+    reports = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    conn = sqlite3.connect(os.path.join(workdir, "emails.db"))
+    ids = [r[0] for r in conn.execute("SELECT id FROM emails ORDER BY id")]
+    graph_ids = [r[0] for r in conn.execute("SELECT graph_id FROM emails")]
+    conn.close()
+
+    for report in reports:
+        print(report)
+
+    failures = []
+    if len(ids) != args.messages:
+        failures.append(f"expected {args.messages} emails, found {len(ids)}")
+    if len(set(ids)) != len(ids):
+        failures.append("duplicate ids")
+    if len(set(graph_ids)) != len(graph_ids):
+        failures.append("duplicate graph ids")
+    if ids and ids != list(range(ids[0], ids[0] + len(ids))):
+        failures.append("ids are not contiguous")
+    if any(r["errors"] for r in reports):
+        failures.append("sync requests raised errors")
+
+    total_requests = args.requests * args.workers
+    total_runs = sum(r["runs"] for r in reports)
+    print(f"{total_requests} requests -> {total_runs} sync runs, {len(ids)} emails in {workdir}")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
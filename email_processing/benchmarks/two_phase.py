@@ -0,0 +1,103 @@
+# benchmarks/two_phase.py
+"""
+Bytes and Graph requests: one-phase vs. two-phase delta sync.
+
+Builds a FakeGraph mailbox, then for each mode runs the initial sync followed by
+--rounds steady-state syncs. Each steady-state round flips the read state of
+--updates messages and delivers --new-messages new ones:
+  - one-phase: the delta query selects every field, bodies included
+  - two-phase: the delta query selects only the listing fields, and bodies are
+    fetched with $batch for new messages only
+
+Reports response bytes, HTTP requests and $batch sub-requests for the initial sync
+and per steady-state round. Only the fetch is measured; nothing is analyzed or stored.
+
+Run from email_processing/:
+    python -m benchmarks.two_phase --messages 2000 --updates 50 --new-messages 5
+"""
+
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, Optional, Set
+
+from benchmarks.fake_graph import FakeGraph, make_message
+from email_processor import LISTING_SELECT, BODY_SELECT, fetch_email_delta, fetch_message_bodies
+from graph_client import GraphClient
+
+FULL_SELECT = f"{LISTING_SELECT},{BODY_SELECT}"
+
+
+async def fetch_round(
+    client: GraphClient,
+    two_phase: bool,
+    delta_link: Optional[str],
+    known: Set[str],
+) -> Optional[str]:
+    select = LISTING_SELECT if two_phase else FULL_SELECT
+    changed, removed, delta_link = await fetch_email_delta(client, delta_link, select=select)
+    known.difference_update(removed)
+    new_ids = [m["id"] for m in changed if m["id"] not in known]
+    if two_phase and new_ids:
+        await fetch_message_bodies(client, new_ids)
+    known.update(new_ids)
+    return delta_link
+
+
+def counters(graph: FakeGraph) -> Dict[str, int]:
+    return {"bytes": graph.bytes_sent, "requests": graph.requests, "batch_items": graph.batch_items}
+
+
+def diff(after: Dict[str, int], before: Dict[str, int], rounds: int = 1) -> Dict[str, float]:
+    return {k: round((after[k] - before[k]) / rounds, 1) for k in after}
+
+
+async def run(two_phase: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    graph = FakeGraph([make_message(i) for i in range(args.messages)])
+    known: Set[str] = set()
+    async with GraphClient(lambda: "bench-token", transport=graph.transport()) as client:
+        delta_link = await fetch_round(client, two_phase, None, known)
+        initial = counters(graph)
+
+        next_id = args.messages
+        for r in range(args.rounds):
+            for i in range(args.updates):
+                graph_id = f"msg-{(r * args.updates + i) % args.messages:07d}"
+                graph.update_message(graph_id, isRead=not graph.messages[graph_id]["isRead"])
+            for _ in range(args.new_messages):
+                graph.add_message(make_message(next_id))
+                next_id += 1
+            delta_link = await fetch_round(client, two_phase, delta_link, known)
+
+    return {
+        "initial": diff(initial, {k: 0 for k in initial}),
+        "steady_state_per_round": diff(counters(graph), initial, args.rounds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--updates", type=int, default=50, help="read-state flips per round")
+    parser.add_argument("--new-messages", type=int, default=5, help="new messages per round")
+    args = parser.parse_args()
+
+    one = asyncio.run(run(False, args))
+    two = asyncio.run(run(True, args))
+    report = {
+        "messages": args.messages,
+        "rounds": args.rounds,
+        "updates_per_round": args.updates,
+        "new_per_round": args.new_messages,
+        "one_phase": one,
+        "two_phase": two,
+        "steady_state_bytes_ratio": round(
+            two["steady_state_per_round"]["bytes"] / max(1.0, one["steady_state_per_round"]["bytes"]), 3
+        ),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/wire.py
+"""
+GET /emails on the wire: FastAPI's default dict response against wire.py
+(orjson, compact items, gzip / brotli, ETag + 304).
+
+Syncs --messages synthetic emails (benchmarks/mailbox.py, rules analysis) from
+FakeGraph into the real API app, then requests --requests pages of --limit emails
+through httpx.ASGITransport for each variant:
+  - before: the handler as it was, returning {"items": full records} for FastAPI to
+    run through jsonable_encoder + JSONResponse (mounted at /bench/emails-before)
+  - orjson_full: view=full, no compression
+  - orjson_compact: the default compact items, no compression
+  - compact_gzip (and compact_br with the brotli package): Accept-Encoding
+  - not_modified: If-None-Match with the page's ETag, i.e. an unchanged poll
+Reports bytes on the wire per response (as sent, before the client decompresses),
+requests/sec, wire MB/sec and CPU ms per request (client + server, same process).
+
+Run from email_processing/:
+    python -m benchmarks.wire --messages 2000 --limit 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+async def measure(client: httpx.AsyncClient, url: str, headers: Dict[str, str], requests: int) -> Dict[str, Any]:
+    async def get() -> httpx.Response:
+        async with client.stream("GET", url, headers=headers) as response:
+            # raw: the bytes as sent, without paying for decompression here
+            response.raw_body = b"".join([chunk async for chunk in response.aiter_raw()])
+        return response
+
+    response = await get()  # warm up
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(requests):
+        response = await get()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {
+        "status": response.status_code,
+        "encoding": response.headers.get("content-encoding"),
+        "wire_bytes": len(response.raw_body),
+        "requests_per_sec": round(requests / wall, 1),
+        "wire_mb_per_sec": round(len(response.raw_body) * requests / wall / 1e6, 2),
+        "cpu_ms_per_request": round(cpu / requests * 1000, 3),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import api
+    from benchmarks.fake_graph import FakeGraph
+    from benchmarks.mailbox import make_mailbox
+    from graph_client import GraphClient
+    from wire import brotli
+
+    graph = FakeGraph(make_mailbox(args.messages, seed=args.seed))
+    api.make_graph_client = lambda **kwargs: GraphClient(lambda: "bench-token", transport=graph.transport())
+
+    @api.app.get("/bench/emails-before", include_in_schema=False)
+    def emails_before(cursor: Optional[str] = None, limit: int = 50):
+        items, next_cursor = api.get_index().query_emails(
+            category=None, is_read=None, org=None, flags=[], due_from=None, due_to=None,
+            after=api.parse_cursor(cursor), limit=limit,
+        )
+        return {"items": items, "nextCursor": None if next_cursor is None else str(next_cursor)}
+
+    report: Dict[str, Any] = {"messages": args.messages, "limit": args.limit, "requests": args.requests}
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/sync?wait=true")
+            page = f"/emails?limit={args.limit}"
+            identity = {"Accept-Encoding": "identity"}
+            variants = {
+                "before": (f"/bench/emails-before?limit={args.limit}", identity),
+                "orjson_full": (f"{page}&view=full", identity),
+                "orjson_compact": (page, identity),
+                "compact_gzip": (page, {"Accept-Encoding": "gzip"}),
+            }
+            if brotli is not None:
+                variants["compact_br"] = (page, {"Accept-Encoding": "br"})
+            etag = (await client.get(page, headers={"Accept-Encoding": "gzip"})).headers["etag"]
+            variants["not_modified"] = (page, {"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+            results = {
+                name: await measure(client, url, headers, args.requests)
+                for name, (url, headers) in variants.items()
+            }
+
+    before = results["before"]
+    for result in results.values():
+        result["bytes_vs_before"] = round(result["wire_bytes"] / before["wire_bytes"], 3)
+        result["cpu_vs_before"] = round(result["cpu_ms_per_request"] / before["cpu_ms_per_request"], 3)
+    report["variants"] = results
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=500, help="emails per page")
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per variant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="woomail-wire-") as workdir:
+        # before the app is imported: a scratch store, no background work but the one sync
+        os.environ["EMAIL_DB_PATH"] = os.path.join(workdir, "emails.db")
+        os.environ.setdefault("ANALYSIS_MODE", "rules")
+        os.environ.setdefault("ANALYSIS_CACHE_MAX_ENTRIES", "0")
+        os.environ.setdefault("ATTACHMENTS_ENABLED", "0")
+        os.environ.setdefault("SYNC_INTERVAL_SECONDS", "3600")
+        os.environ.setdefault("PATTERNS_COMPILED_DIR", os.path.join(workdir, "patterns.compiled"))
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
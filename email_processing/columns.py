@@ -0,0 +1,244 @@
+# columns.py
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# ==========================
+# Config
+# ==========================
+
+# Boolean flags every analysis carries (see email_processor.summarize_entities)
+FLAG_FIELDS = (
+    "has_renewal",
+    "has_appointment",
+    "has_billing",
+    "docs_required",
+    "verification_needed",
+    "has_action_link",
+)
+BILLING_FLAG = FLAG_FIELDS.index("has_billing")
+
+# The dashboard's categories (frontend EmailCategory); CategoryCount rows use these
+DASHBOARD_CATEGORIES = ("government", "finance", "bills", "healthcare", "education", "insurance", "employment", "misc")
+# EMAIL_TYPE pattern ids (patterns.jsonl) -> dashboard category
+CATEGORY_BY_EMAIL_TYPE = {
+    "notice of assessment": "government",
+    "tax filing": "government",
+    "tax return": "government",
+    "cpf contribution": "government",
+    "license renewal": "government",
+    "passport expiring": "government",
+    "passport renewal": "government",
+    "bank statement": "finance",
+    "e-statement": "finance",
+    "billing statement": "bills",
+    "utility bill": "bills",
+    "clinic appointment": "healthcare",
+    "medical appointment": "healthcare",
+    "offer letter": "employment",
+    "hr update": "employment",
+    "contract renewal": "employment",
+}
+
+INITIAL_CAPACITY = 1024
+
+
+def first_amount(analysis: Dict[str, Any]) -> float:
+    """First regex amount ('$1,234.56') as a float, NaN if there is none."""
+    for amount in analysis.get("amounts") or []:
+        try:
+            return float(str(amount).lstrip("$").replace(",", ""))
+        except ValueError:
+            continue
+    return float("nan")
+
+
+def dashboard_category(analysis: Dict[str, Any], subject: Optional[str] = None) -> str:
+    """
+    Dashboard category of an analysis:
+    - its category, if that's already one (records from before this mapping hold the
+      EMAIL_TYPE string there, and go through the steps below)
+    - else its email_type, through CATEGORY_BY_EMAIL_TYPE
+    - else a guess from the org, subject and flags; "misc" if nothing fits
+    """
+    category = (analysis.get("category") or "").strip().lower()
+    if category in DASHBOARD_CATEGORIES:
+        return category
+    email_type = (analysis.get("email_type") or category).strip().lower()
+    if email_type in CATEGORY_BY_EMAIL_TYPE:
+        return CATEGORY_BY_EMAIL_TYPE[email_type]
+
+    org = (analysis.get("org") or "").lower()
+    if any(x in org for x in ["iras", "cpf", "authority", "ministry", "ica"]):
+        return "government"
+    if any(x in org for x in ["dbs", "ocbc", "uob", "posb", "bank"]):
+        return "finance"
+    if "bill" in (subject or analysis.get("subject") or "").lower() or "utility" in email_type:
+        return "bills"
+    if analysis.get("has_appointment"):
+        return "healthcare"
+    if analysis.get("has_renewal"):
+        return "government"  # e.g., LTA license renewal
+    return "misc"
+
+
+class Dictionary:
+    """Case-insensitive string <-> int code mapping; shows each value as first seen."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, value: Optional[str]) -> int:
+        """Code for value, -1 for None / empty."""
+        if not value:
+            return -1
+        key = value.strip().lower()
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(value.strip())
+        return code
+
+
+class FlagColumns:
+    """
+    Columnar copy of the per-email analysis fields the dashboards aggregate over.
+    - one row per email: alive / is_read bool columns, one bool column per flag
+      (a (flags x rows) matrix), int32 category / org codes, float64 first amount
+    - rows are addressed by email id; removed rows are marked dead and reused
+    - stats() is a handful of vectorized reductions (bincount / sum), no per-email Python
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.categories = Dictionary()
+        self.orgs = Dictionary()
+        self.size = 0
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._allocate(capacity)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _allocate(self, capacity: int) -> None:
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.is_read = np.zeros(capacity, dtype=bool)
+        self.flags = np.zeros((len(FLAG_FIELDS), capacity), dtype=bool)
+        self.category = np.full(capacity, -1, dtype=np.int32)
+        self.org = np.full(capacity, -1, dtype=np.int32)
+        self.amount = np.full(capacity, np.nan, dtype=np.float64)
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        old = (self.alive, self.is_read, self.flags, self.category, self.org, self.amount)
+        self._allocate(new_capacity)
+        self.alive[:capacity] = old[0]
+        self.is_read[:capacity] = old[1]
+        self.flags[:, :capacity] = old[2]
+        self.category[:capacity] = old[3]
+        self.org[:capacity] = old[4]
+        self.amount[:capacity] = old[5]
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.alive, self.is_read, self.flags, self.category, self.org, self.amount))
+
+    # --------------------------
+    # Writes
+    # --------------------------
+
+    def upsert(self, email_id: int, email: Dict[str, Any]) -> None:
+        row = self._rows.get(email_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                self._grow(self.size + 1)
+                row = self.size
+                self.size += 1
+            self._rows[email_id] = row
+
+        analysis = email.get("analysis") or {}
+        self.alive[row] = True
+        self.is_read[row] = bool(analysis.get("isRead"))
+        for i, flag in enumerate(FLAG_FIELDS):
+            self.flags[i, row] = bool(analysis.get(flag))
+        self.category[row] = self.categories.encode(dashboard_category(analysis))
+        self.org[row] = self.orgs.encode(analysis.get("org"))
+        self.amount[row] = first_amount(analysis)
+
+    def extend(self, emails: Iterable[Dict[str, Any]]) -> None:
+        """Bulk-append emails not seen before (initial load): one slice assignment per column."""
+        emails = [e for e in emails if int(e["id"]) not in self._rows]
+        if not emails:
+            return
+        analyses = [e.get("analysis") or {} for e in emails]
+        start, end = self.size, self.size + len(emails)
+        self._grow(end)
+
+        self.alive[start:end] = True
+        self.is_read[start:end] = [bool(a.get("isRead")) for a in analyses]
+        for i, flag in enumerate(FLAG_FIELDS):
+            self.flags[i, start:end] = [bool(a.get(flag)) for a in analyses]
+        self.category[start:end] = [self.categories.encode(dashboard_category(a)) for a in analyses]
+        self.org[start:end] = [self.orgs.encode(a.get("org")) for a in analyses]
+        self.amount[start:end] = [first_amount(a) for a in analyses]
+
+        for row, email in enumerate(emails, start):
+            self._rows[int(email["id"])] = row
+        self.size = end
+
+    def remove(self, email_id: int) -> None:
+        row = self._rows.pop(email_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self._free.append(row)
+
+    # --------------------------
+    # Aggregates
+    # --------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Dashboard numbers:
+        - categories: CategoryCount rows (category, count, unread), by dashboard_category
+        - flags: emails with each analysis flag set
+        - amountDueByOrg: sum of the first amount on billing emails, per org
+        """
+        n = self.size
+        alive = self.alive[:n]
+        unread = alive & ~self.is_read[:n]
+        category = self.category[:n]
+        n_categories = len(self.categories)
+
+        counts = np.bincount(category[alive], minlength=n_categories)
+        unread_counts = np.bincount(category[unread], minlength=n_categories)
+        flag_counts = (self.flags[:, :n] & alive).sum(axis=1)
+
+        org = self.org[:n]
+        amount = self.amount[:n]
+        billed = alive & self.flags[BILLING_FLAG, :n] & (org >= 0) & ~np.isnan(amount)
+        due = np.bincount(org[billed], weights=amount[billed], minlength=len(self.orgs))
+        due_counts = np.bincount(org[billed], minlength=len(self.orgs))
+
+        return {
+            "total": int(alive.sum()),
+            "unread": int(unread.sum()),
+            "categories": [
+                {"category": self.categories.values[i], "count": int(counts[i]), "unread": int(unread_counts[i])}
+                for i in np.flatnonzero(counts)
+            ],
+            "flags": {flag: int(flag_counts[i]) for i, flag in enumerate(FLAG_FIELDS)},
+            "amountDueByOrg": [
+                {"org": self.orgs.values[i], "amount": round(float(due[i]), 2), "emails": int(due_counts[i])}
+                for i in np.flatnonzero(due_counts)
+            ],
+        }
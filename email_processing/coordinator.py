@@ -0,0 +1,91 @@
+# coordinator.py
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+
+# ==========================
+# Config
+# ==========================
+
+SYNC_LOCK_PATH = os.getenv("SYNC_LOCK_PATH", "sync.lock")
+LOCK_POLL_SECONDS = 0.05
+
+
+class ProcessLock:
+    """
+    Exclusive flock on a lock file, shared by every worker process on the host.
+    Acquired by polling with LOCK_NB so a waiting coroutine stays cancellable.
+    """
+
+    def __init__(self, path: str = SYNC_LOCK_PATH):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def acquire(self) -> None:
+        if fcntl is None:
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class SyncCoordinator:
+    """
+    Single-flight wrapper around a sync function.
+    - Callers that arrive while a sync is in flight share that run's result (or error)
+    - The run itself holds a cross-process lock, so uvicorn workers never sync in parallel
+    """
+
+    def __init__(self, sync_fn: Callable[[], Awaitable[Any]], lock_path: str = SYNC_LOCK_PATH):
+        self.sync_fn = sync_fn
+        self.lock = ProcessLock(lock_path)
+        self.coalesced = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self._inflight is not None
+
+    async def run(self) -> Any:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._run_locked())
+            self._inflight.add_done_callback(self._clear)
+        else:
+            self.coalesced += 1
+        # shield: one caller going away must not cancel the run for everyone else
+        return await asyncio.shield(self._inflight)
+
+    def _clear(self, future: asyncio.Future) -> None:
+        if self._inflight is future:
+            self._inflight = None
+        if not future.cancelled():
+            future.exception()  # mark retrieved; waiters (if any) already re-raised it
+
+    async def _run_locked(self) -> Any:
+        await self.lock.acquire()
+        try:
+            return await self.sync_fn()
+        finally:
+            self.lock.release()
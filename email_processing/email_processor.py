@@ -2,119 +2,184 @@
 
 import os
 import json
+import asyncio
+import logging
 import re
-import random
-from pathlib import Path
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+import copy
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 
-import httpx
 from dotenv import load_dotenv
 from ms_graph import get_access_token, MS_GRAPH_BASE_URL
-
-import spacy
-from spacy.pipeline import EntityRuler
+from graph_client import GraphClient, GraphError
+from store import current_account, get_store
+from analysis_cache import AnalysisCache, make_fingerprint, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_PATH
+from rule_matcher import TOKEN_RE, PhraseIndex, address_mask
+from pattern_set import PatternSet, active_pattern_set, get_pattern_set, reload_if_changed
+from html_text import html_to_text
+from analysis_pool import AnalysisPool
+from columns import dashboard_category
+from attachments import ingest_attachments
+from metrics import MESSAGES_PROCESSED, get_logger, log_event, stage
+
+log = get_logger("sync")
 
 # ==========================
 # Config
 # ==========================
 
-EMAIL_JSON_PATH = "emails.json"
-EMAILS_PATH = Path("emails.json")
-TASKS_PATH = Path("tasks.json")
-ATTACHMENTS_PATH = Path("attachments.json")
 PRIORITIES = ["low", "normal", "high", "urgent"]
 STATUS_DEFAULT = "pending"
+# Stand-in for a missing receivedDateTime, so derived tasks stay the same run to run
+UNKNOWN_RECEIVED_AT = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# nlp.pipe tuning for batch analysis (sync / backfill)
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "64"))
+NER_N_PROCESS = int(os.getenv("NER_N_PROCESS", "1"))
+
+# "full" = spaCy NER + our patterns, "rules" = patterns only; both match the patterns
+# (pattern_set.py, patterns.jsonl) with a rule_matcher.PhraseIndex
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "full")
+ANALYSIS_MODES = ("full", "rules")
+
+# Bump when summarize_doc / extract_regex_entities change output, to invalidate cached analyses
+ANALYSIS_VERSION = 5
+
+# "delta" = incremental sync via /messages/delta, "full" = legacy first-page fetch
+SYNC_MODE = os.getenv("SYNC_MODE", "delta")
+DELTA_PAGE_SIZE = int(os.getenv("DELTA_PAGE_SIZE", "50"))
+# New messages are fetched, analyzed and stored this many at a time, so a large
+# backfill holds one chunk of bodies in memory rather than the whole mailbox
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "500"))
+# Two-phase fetch: list changes with just these properties, then $batch-fetch bodies
+# for the messages we haven't stored yet
+LISTING_SELECT = "id,receivedDateTime,isRead,hasAttachments,subject,from,changeKey"
+BODY_SELECT = "body,bodyPreview"
 
 # ==========================
 # NER model + patterns
 # ==========================
 
-# Load base NER model
-nlp = spacy.load("en_core_web_sm")
-
-# Add custom EntityRuler
-ruler = nlp.add_pipe("entity_ruler", before="ner")
-
-patterns = [
-    # --- Organisations / Sources (ORG) ---
-    {"label": "ORG", "pattern": "IRAS"},
-    {"label": "ORG", "pattern": "Inland Revenue Authority of Singapore"},
-    {"label": "ORG", "pattern": "ICA"},
-    {"label": "ORG", "pattern": "Immigration & Checkpoints Authority"},
-    {"label": "ORG", "pattern": "CPF Board"},
-    {"label": "ORG", "pattern": "SP Services"},
-    {"label": "ORG", "pattern": "SingHealth"},
-    {"label": "ORG", "pattern": "NHG"},
-    {"label": "ORG", "pattern": "NUHS"},
-    {"label": "ORG", "pattern": "DBS"},
-    {"label": "ORG", "pattern": "POSB"},
-    {"label": "ORG", "pattern": "OCBC"},
-    {"label": "ORG", "pattern": "UOB"},
-
-    # --- Email Type / Category ---
-    {"label": "EMAIL_TYPE", "pattern": "Notice of Assessment"},
-    {"label": "EMAIL_TYPE", "pattern": "tax filing"},
-    {"label": "EMAIL_TYPE", "pattern": "tax return"},
-    {"label": "EMAIL_TYPE", "pattern": "passport renewal"},
-    {"label": "EMAIL_TYPE", "pattern": "passport expiring"},
-    {"label": "EMAIL_TYPE", "pattern": "clinic appointment"},
-    {"label": "EMAIL_TYPE", "pattern": "medical appointment"},
-    {"label": "EMAIL_TYPE", "pattern": "utility bill"},
-    {"label": "EMAIL_TYPE", "pattern": "billing statement"},
-    {"label": "EMAIL_TYPE", "pattern": "CPF contribution"},
-    {"label": "EMAIL_TYPE", "pattern": "e-statement"},
-    {"label": "EMAIL_TYPE", "pattern": "bank statement"},
-    {"label": "EMAIL_TYPE", "pattern": "license renewal"},
-    {"label": "EMAIL_TYPE", "pattern": "contract renewal"},
-    {"label": "EMAIL_TYPE", "pattern": "offer letter"},
-    {"label": "EMAIL_TYPE", "pattern": "HR update"},
-
-    # --- Renewal / Expiry (RENEWAL) ---
-    {"label": "RENEWAL", "pattern": "renew"},
-    {"label": "RENEWAL", "pattern": "renewal"},
-    {"label": "RENEWAL", "pattern": "expiring"},
-    {"label": "RENEWAL", "pattern": "expiry"},
-    {"label": "RENEWAL", "pattern": "expires on"},
-    {"label": "RENEWAL", "pattern": "valid until"},
-    {"label": "RENEWAL", "pattern": "due for renewal"},
-
-    # --- Appointments (APPOINTMENT) ---
-    {"label": "APPOINTMENT", "pattern": "appointment"},
-    {"label": "APPOINTMENT", "pattern": "scheduled"},
-    {"label": "APPOINTMENT", "pattern": "appointment date"},
-    {"label": "APPOINTMENT", "pattern": "consultation"},
-
-    # --- Billing / Payment (BILLING) ---
-    {"label": "BILLING", "pattern": "payment due"},
-    {"label": "BILLING", "pattern": "due date"},
-    {"label": "BILLING", "pattern": "invoice"},
-    {"label": "BILLING", "pattern": "bill"},
-    {"label": "BILLING", "pattern": "amount payable"},
-    {"label": "BILLING", "pattern": "outstanding balance"},
-    {"label": "BILLING", "pattern": "total charges"},
-
-    # --- Documents required (DOC_REQUIRED) ---
-    {"label": "DOC_REQUIRED", "pattern": "documents required"},
-    {"label": "DOC_REQUIRED", "pattern": "required documents"},
-    {"label": "DOC_REQUIRED", "pattern": "please submit"},
-    {"label": "DOC_REQUIRED", "pattern": "supporting documents"},
-
-    # --- Verification (VERIFICATION) ---
-    {"label": "VERIFICATION", "pattern": "verification needed"},
-    {"label": "VERIFICATION", "pattern": "verify your identity"},
-    {"label": "VERIFICATION", "pattern": "please verify"},
-    {"label": "VERIFICATION", "pattern": "account verification"},
-
-    # --- CTAs / Links (ACTION_LINK) ---
-    {"label": "ACTION_LINK", "pattern": "click here"},
-    {"label": "ACTION_LINK", "pattern": "log in to"},
-    {"label": "ACTION_LINK", "pattern": "view statement"},
-    {"label": "ACTION_LINK", "pattern": "view details"},
-    {"label": "ACTION_LINK", "pattern": "access your account"},
-]
+# The spaCy model is loaded lazily (see get_nlp) so importing this module stays cheap.
+# Entity patterns live in patterns.jsonl and are reloaded when it changes (pattern_set.py)
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+PATTERNS_PIPE = "patterns"
+
+_nlp = None
+_nlp_lock = threading.Lock()
+# One nlp.pipe at a time per process: a spaCy pipeline isn't safe to run from several
+# threads at once (concurrent account syncs analyze in threads when there's no AnalysisPool)
+_pipe_lock = threading.Lock()
+
+
+class PatternEntities:
+    """
+    spaCy pipeline component in front of ner, in place of an EntityRuler: marks our
+    pattern matches as entities so ner keeps them and labels the rest.
+    index is the PhraseIndex to use; analyze_emails sets it per batch, so a pattern
+    reload never has to rebuild the pipeline.
+    - matches the doc's own tokens, each split the way patterns are (TOKEN_RE, so
+      "Ltd." still ends "ABC Pte Ltd")
+    - an entity is exactly the text matched: a token it only partly covers is split
+      first, so the entity is "ABC Pte Ltd", not "ABC Pte Ltd."
+    - URLs and email addresses match nothing, by the same check as rules mode
+      (rule_matcher.address_mask): a footer's billing@dbs.com or www.uob.com.sg isn't
+      the organisation
+    """
+
+    def __init__(self, index: Optional[PhraseIndex] = None):
+        self.index = index
+
+    def __call__(self, doc):
+        from spacy.util import filter_spans
+
+        pieces: List[Optional[str]] = []
+        bounds: List[Tuple[int, int]] = []  # (start char, end char) of each piece
+        owners: List[int] = []  # doc token of each piece
+        for token in doc:
+            for m in TOKEN_RE.finditer(token.text):  # none for whitespace tokens
+                pieces.append(m.group())
+                bounds.append((token.idx + m.start(), token.idx + m.end()))
+                owners.append(token.i)
+        mask = address_mask(doc.text, bounds)
+        if mask is not None:
+            pieces = [None if masked else piece for piece, masked in zip(pieces, mask)]
+
+        matches = self.index.match_tokens(pieces)
+        # Cut tokens where a match starts or ends inside them ("Ltd." -> "Ltd" + ".")
+        cuts: Dict[int, set] = {}
+        for start, end, _ in matches:
+            for i, char in ((owners[start], bounds[start][0]), (owners[end - 1], bounds[end - 1][1])):
+                token = doc[i]
+                if token.idx < char < token.idx + len(token.text):
+                    cuts.setdefault(i, set()).add(char - token.idx)
+        if cuts:
+            with doc.retokenize() as retokenizer:
+                for i, offsets in cuts.items():
+                    token = doc[i]
+                    edges = [0, *sorted(offsets), len(token.text)]
+                    orths = [token.text[a:b] for a, b in zip(edges, edges[1:])]
+                    retokenizer.split(token, orths, heads=[(token, 0)] * len(orths))
+
+        spans = [
+            doc.char_span(bounds[start][0], bounds[end - 1][1], label=label)
+            for start, end, label in matches
+        ]
+        doc.ents = filter_spans(spans)
+        return doc
+
+
+def get_nlp():
+    """
+    Load the base NER model + our pattern component on first use.
+    Thread-safe: concurrent callers wait for the one load instead of loading twice.
+    """
+    global _nlp
+    if _nlp is not None:
+        return _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            from spacy.language import Language
+
+            # Load base NER model
+            nlp = spacy.load(SPACY_MODEL)
 
-ruler.add_patterns(patterns)
+            # Our patterns go in before ner, like an EntityRuler would
+            if not Language.has_factory("woomail_patterns"):
+                Language.factory("woomail_patterns", func=lambda nlp, name: PatternEntities())
+            component = nlp.add_pipe("woomail_patterns", name=PATTERNS_PIPE, before="ner")
+            component.index = get_pattern_set().index
+
+            _nlp = nlp
+    return _nlp
+
+
+def get_rule_matcher() -> PhraseIndex:
+    """Case-insensitive PhraseIndex over the current patterns, for ANALYSIS_MODE=rules."""
+    return get_pattern_set().index
+
+
+def is_model_ready(mode: str = ANALYSIS_MODE) -> bool:
+    if mode == "rules":
+        return active_pattern_set() is not None
+    return _nlp is not None
+
+
+def warmup(mode: str = ANALYSIS_MODE) -> None:
+    """
+    Load the model (or build the rule matcher), run one document through the analysis
+    pipeline and open the analysis cache, so the first real request doesn't pay for any of it.
+    """
+    sample = "Warmup: UOB billing statement, amount payable $1.00 by 1 Jan 2025."
+    if mode == "rules":
+        summarize_rules(sample)
+    else:
+        nlp = get_nlp()
+        with _pipe_lock:
+            list(nlp.pipe([sample], disable=unused_pipes()))
+    get_analysis_cache(mode)
 
 # -------------------------
 # Regex helpers for dates / amounts / refs
@@ -128,37 +193,92 @@ DATE_REGEXES = [
 
 AMOUNT_REGEX = r"\$[0-9,]+\.\d{2}"
 
-REF_REGEX = r"(ref(?:erence)?|appointment|case)\s*[:#]?\s*[A-Za-z0-9-]+"
+REF_KEYWORDS = r"ref(?:erence)?|appointment|case"
+REF_REGEX = rf"({REF_KEYWORDS})\s*[:#]?\s*[A-Za-z0-9-]+"
+REF_FULL_RE = re.compile(REF_REGEX, re.IGNORECASE)
+
+# One alternation for all of the above, so the text is scanned once.
+# - each date pattern keeps its own group, so dates can be listed in pattern order as before
+# - a ref only consumes its keyword (the id is a lookahead), so a date right after
+#   "Appointment:" is still found, just like when every pattern scanned the text separately
+# - a date and an amount can no longer claim the same characters ("$3.51/2/25"):
+#   the leftmost match wins
+# - the leading lookahead lets the engine skip positions no branch can start at
+ENTITY_RE = re.compile(
+    r"(?=[0-9$rRaAcC])(?:"
+    + "|".join(f"(?P<date{i}>{pattern})" for i, pattern in enumerate(DATE_REGEXES))
+    + f"|(?P<amount>{AMOUNT_REGEX})"
+    + rf"|(?i:(?P<ref>{REF_KEYWORDS})(?=\s*[:#]?\s*[A-Za-z0-9-]))"
+    + ")"
+)
 
 
 def extract_regex_entities(text: str) -> Dict[str, List[str]]:
-    dates: List[str] = []
-    for pattern in DATE_REGEXES:
-        dates.extend(re.findall(pattern, text))
-
-    amounts = re.findall(AMOUNT_REGEX, text)
-    refs = re.findall(REF_REGEX, text, flags=re.IGNORECASE)
+    dates_by_pattern: List[List[str]] = [[] for _ in DATE_REGEXES]
+    amounts: List[str] = []
+    refs: List[str] = []
+    ref_end = 0  # where the last ref's id ended; refs never overlap each other
+
+    for m in ENTITY_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "amount":
+            amounts.append(m.group())
+        elif kind == "ref":
+            if m.start() >= ref_end:
+                refs.append(m.group())
+                ref_end = REF_FULL_RE.match(text, m.start()).end()
+        else:
+            dates_by_pattern[int(kind[4:])].append(m.group())
 
     return {
-        "dates": dates,
+        "dates": [d for dates in dates_by_pattern for d in dates],
         "amounts": amounts,
         "refs": refs,
     }
 
 
-def analyze_email(text: str) -> Dict[str, Any]:
+def unused_pipes() -> List[str]:
     """
-    Run NER + regex to extract useful info from an email body.
+    Pipeline components we can skip because we only read doc.ents.
+    Keeps our patterns + ner, and tok2vec only if ner listens to it.
     """
-    doc = nlp(text)
+    nlp = get_nlp()
+    needed = {PATTERNS_PIPE, "ner"}
+    if "tok2vec" in nlp.pipe_names:
+        listeners = getattr(nlp.get_pipe("tok2vec"), "listening_components", [])
+        if "ner" in listeners:
+            needed.add("tok2vec")
+    return [name for name in nlp.pipe_names if name not in needed]
 
+
+def summarize_doc(doc, text: str) -> Dict[str, Any]:
+    """
+    Turn a processed spaCy doc (+ regex matches on the same text) into our summary dict.
+    """
     entities: List[Dict[str, str]] = []
     for ent in doc.ents:
         entities.append({
             "text": ent.text,
             "label": ent.label_
         })
+    return summarize_entities(entities, text)
 
+
+def summarize_rules(text: str, index: Optional[PhraseIndex] = None) -> Dict[str, Any]:
+    """
+    Rules-only analysis: our patterns via the PhraseIndex (default: the current one),
+    no statistical NER. raw_entities then holds only pattern matches (no MONEY / DATE /
+    PERSON spans); dates and amounts come from the regex extractors as in the full pipeline.
+    """
+    index = index or get_rule_matcher()
+    entities = [
+        {"text": text[start:end], "label": label}
+        for start, end, label in index.find(text)
+    ]
+    return summarize_entities(entities, text)
+
+
+def summarize_entities(entities: List[Dict[str, str]], text: str) -> Dict[str, Any]:
     regex_entities = extract_regex_entities(text)
 
     # Rough categorisation: pick first EMAIL_TYPE / ORG we see
@@ -188,36 +308,121 @@ def analyze_email(text: str) -> Dict[str, Any]:
     }
 
 
-def clean_html(raw_html: str) -> str:
-    """
-    Very simple HTML → text cleaner using regex.
-    (You can swap this later for BeautifulSoup if you want.)
-    """
-    if not raw_html:
-        return ""
+# mode -> (pattern set digest, cache)
+_analysis_caches: Dict[str, Tuple[str, AnalysisCache]] = {}
+_analysis_cache_lock = threading.Lock()
 
-    # Decode common HTML entities
-    text = re.sub(r"&nbsp;", " ", raw_html)
-    text = re.sub(r"&lt;", "<", text)
-    text = re.sub(r"&gt;", ">", text)
-    text = re.sub(r"&amp;", "&", text)
 
-    # Remove HTML comments
-    text = re.sub(r"<!--[\s\S]*?-->", "", text)
+def analysis_fingerprint(mode: str = ANALYSIS_MODE, pattern_set: Optional[PatternSet] = None) -> str:
+    """Everything that can change analyze_email output for the same text."""
+    patterns_digest = (pattern_set or get_pattern_set()).digest
+    if mode == "rules":
+        # No spaCy involved, so don't load it just to fingerprint
+        return make_fingerprint(ANALYSIS_VERSION, mode, patterns_digest, DATE_REGEXES, AMOUNT_REGEX, REF_REGEX)
 
-    # Replace <br> and <p> with newlines before stripping everything else
-    text = re.sub(r"<\s*br\s*/?>", "\n", text, flags=re.IGNORECASE)
-    text = re.sub(r"<\s*/?p\s*>", "\n", text, flags=re.IGNORECASE)
+    import spacy
 
-    # Strip all remaining tags
-    text = re.sub(r"<.*?>", "", text)
+    nlp = get_nlp()
+    return make_fingerprint(
+        ANALYSIS_VERSION,
+        spacy.__version__,
+        nlp.meta.get("name"),
+        nlp.meta.get("version"),
+        nlp.pipe_names,
+        patterns_digest,
+        DATE_REGEXES,
+        AMOUNT_REGEX,
+        REF_REGEX,
+    )
+
+
+def get_analysis_cache(mode: str = ANALYSIS_MODE, pattern_set: Optional[PatternSet] = None) -> Optional[AnalysisCache]:
+    """
+    Process-wide analysis cache for this mode and pattern set (default: the current one),
+    or None if disabled (ANALYSIS_CACHE_MAX_ENTRIES=0).
+    Each mode has its own file, so one mode's traffic doesn't evict the other's results;
+    a new pattern set reopens it under its own fingerprint, and the old set's results age
+    out through LRU eviction.
+    """
+    if ANALYSIS_CACHE_MAX_ENTRIES <= 0:
+        return None
+    pattern_set = pattern_set or get_pattern_set()
+    with _analysis_cache_lock:
+        digest, cache = _analysis_caches.get(mode, (None, None))
+        if digest != pattern_set.digest:
+            path = ANALYSIS_CACHE_PATH if mode == "full" else ANALYSIS_CACHE_PATH.with_suffix(f".{mode}.db")
+            cache = AnalysisCache(analysis_fingerprint(mode, pattern_set), path=path)
+            _analysis_caches[mode] = (pattern_set.digest, cache)
+        return cache
+
+
+def analyze_emails(
+    texts: List[str],
+    batch_size: int = NER_BATCH_SIZE,
+    n_process: int = NER_N_PROCESS,
+    use_cache: bool = True,
+    mode: str = ANALYSIS_MODE,
+) -> List[Dict[str, Any]]:
+    """
+    Batch version of analyze_email.
+    - mode "full": nlp.pipe with only our patterns + ner running (see unused_pipes),
+      so doc.ents is unchanged; mode "rules": patterns only, no statistical NER
+    - The whole batch uses one pattern set; a newer pattern file (see pattern_set.py)
+      is picked up by the next batch
+    - Texts already in the analysis cache (or repeated within the batch) skip analysis
+    - Results come back in the same order as texts, one independent dict each
+    """
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode {mode!r}; expected one of {ANALYSIS_MODES}")
+    if not texts:
+        return []
+
+    reload_if_changed()
+    pattern_set = get_pattern_set()
+    cache = get_analysis_cache(mode, pattern_set) if use_cache else None
+    results: List[Optional[Dict[str, Any]]] = cache.get_many(texts) if cache else [None] * len(texts)
+
+    pending = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    if pending:
+        if mode == "rules":
+            computed = {text: summarize_rules(text, pattern_set.index) for text in pending}
+        else:
+            nlp = get_nlp()
+            with _pipe_lock:
+                nlp.get_pipe(PATTERNS_PIPE).index = pattern_set.index
+                docs = nlp.pipe(
+                    pending,
+                    batch_size=batch_size,
+                    n_process=n_process,
+                    disable=unused_pipes(),
+                )
+                computed = {text: summarize_doc(doc, text) for doc, text in zip(docs, pending)}
+        if cache:
+            cache.put_many(pending, [computed[t] for t in pending])
+
+        seen = set()
+        for i, text in enumerate(texts):
+            if results[i] is None:
+                # the first copy can be handed out as-is; repeats get their own dict
+                results[i] = computed[text] if text not in seen else copy.deepcopy(computed[text])
+                seen.add(text)
+
+    return results
+
+
+def analyze_email(text: str, mode: str = ANALYSIS_MODE) -> Dict[str, Any]:
+    """
+    Run NER + regex to extract useful info from an email body.
+    """
+    return analyze_emails([text], n_process=1, mode=mode)[0]
 
-    # Collapse multiple whitespace/newlines
-    text = re.sub(r"\r\n", "\n", text)
-    text = re.sub(r"\n+", "\n", text)
-    text = re.sub(r"[ \t]+", " ", text)
 
-    return text.strip()
+def clean_html(raw_html: str) -> str:
+    """
+    HTML → text in a single html.parser pass (see html_text.py):
+    all entities decoded, <script>/<style> dropped, block tags become newlines.
+    """
+    return html_to_text(raw_html)
 
 
 def extract_sender_name(email: str) -> str:
@@ -227,32 +432,25 @@ def extract_sender_name(email: str) -> str:
 
 
 # ==========================
-# JSON file helpers
+# Storage helpers (SQLite store, see store.py)
 # ==========================
 
 def load_emails_from_file() -> List[Dict[str, Any]]:
-    if not os.path.exists(EMAIL_JSON_PATH):
-        return []
-    try:
-        with open(EMAIL_JSON_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+    return get_store().load_emails()
 
 
 def save_emails_to_file(emails: List[Dict[str, Any]]) -> None:
-    with open(EMAIL_JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump(emails, f, ensure_ascii=False, indent=2)
+    get_store().upsert_emails(emails)
 
 
 # ==========================
 # Microsoft Graph integration
 # ==========================
 
-def fetch_emails_from_graph() -> List[Dict[str, Any]]:
+def get_graph_token(interactive: bool = False) -> str:
     """
-    Call Microsoft Graph /me/messages and return the raw messages list.
-    NOTE: This currently fetches only the first page. You can add paging later.
+    Access token for the configured mailbox. Services call this non-interactively and get
+    ms_graph.ReauthRequired when the cached tokens are gone; only the CLI may prompt.
     """
     load_dotenv()
     application_id = os.getenv("APPLICATION_ID")
@@ -262,56 +460,234 @@ def fetch_emails_from_graph() -> List[Dict[str, Any]]:
     if not application_id or not client_secret:
         raise RuntimeError("APPLICATION_ID or CLIENT_SECRET missing in environment")
 
-    endpoint = f"{MS_GRAPH_BASE_URL}/me/messages"
+    return get_access_token(application_id, client_secret, scope, interactive=interactive)
 
-    access_token = get_access_token(application_id, client_secret, scope)
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
 
-    response = httpx.get(endpoint, headers=headers)
+def make_graph_client(**kwargs: Any) -> GraphClient:
+    """Shared Graph client for this mailbox (the API keeps one for its whole lifetime)."""
+    return GraphClient(get_graph_token, **kwargs)
 
-    if response.status_code != 200:
-        raise Exception(
-            f"API request failed with status code {response.status_code}: {response.text}"
-        )
 
-    messages = response.json().get("value", [])
-    print("=============RAW CONTENT================")
-    print(messages)
+async def fetch_emails_from_graph(client: GraphClient) -> List[Dict[str, Any]]:
+    """
+    Call Microsoft Graph /me/messages and return the raw messages list (listing fields only).
+    NOTE: This currently fetches only the first page. Use fetch_email_delta for paging.
+    """
+    page = await client.get_json(f"{MS_GRAPH_BASE_URL}/me/messages", params={"$select": LISTING_SELECT})
+
+    messages = page.get("value", [])
+    log_event(log, logging.DEBUG, "graph_listing", messages=len(messages), ids=[m.get("id") for m in messages])
     return messages
 
 
-# ==========================
-# Sync logic used by CLI
-# ==========================
+class DeltaLinkExpired(Exception):
+    """Graph no longer recognises the stored deltaLink; a full resync is needed."""
+
 
-def sync_emails() -> List[Dict[str, Any]]:
+async def fetch_email_delta(
+    client: GraphClient,
+    delta_link: Optional[str] = None,
+    select: str = LISTING_SELECT,
+) -> Tuple[List[Dict[str, Any]], List[str], Optional[str]]:
     """
-    - Load existing emails from emails.json
-    - Fetch current messages from Graph
-    - For any *new* email (by Graph id), run analyze_email and append
-    - Assign a simple incremental id starting from 0
-    - Save back to emails.json
-    - Return the full list
+    Walk /me/mailFolders/inbox/messages/delta to the end.
+    - With no delta_link this is the initial (full) sync of the inbox
+    - Follows every @odata.nextLink page
+    - Only the select properties come back (Graph keeps the $select in its links);
+      bodies are fetched separately, see fetch_message_bodies
+    - Returns (changed messages, removed graph ids, new @odata.deltaLink)
     """
-    existing = load_emails_from_file()
+    headers = {"Prefer": f"odata.maxpagesize={DELTA_PAGE_SIZE}"}
 
-    # We use the Graph message id as the dedupe key
-    existing_graph_ids = {e.get("graph_id") for e in existing}
-    # Our own incremental id: continue from current length (0-based)
-    next_id = len(existing)
+    if delta_link:
+        url = delta_link
+        params: Optional[Dict[str, str]] = None
+    else:
+        url = f"{MS_GRAPH_BASE_URL}/me/mailFolders/inbox/messages/delta"
+        params = {"$select": select}
 
-    messages = fetch_emails_from_graph()
+    changed: Dict[str, Dict[str, Any]] = {}
+    removed: List[str] = []
+    new_delta_link: Optional[str] = None
 
-    for each_message in messages:
-        graph_id = each_message.get("id")
-        if not graph_id:
+    try:
+        async for page in client.iter_pages(url, params=params, headers=headers):
+            for item in page.get("value", []):
+                graph_id = item.get("id")
+                if not graph_id:
+                    continue
+                if "@removed" in item:
+                    # deleted, or moved out of the inbox
+                    changed.pop(graph_id, None)
+                    removed.append(graph_id)
+                else:
+                    # later pages win if the same message shows up twice
+                    changed[graph_id] = item
+
+            if "@odata.deltaLink" in page:
+                new_delta_link = page["@odata.deltaLink"]
+    except GraphError as e:
+        if e.status_code == 410:
+            raise DeltaLinkExpired(str(e)) from e
+        raise
+
+    return list(changed.values()), removed, new_delta_link
+
+
+async def fetch_messages_by_id(client: GraphClient, graph_ids: List[str], select: str) -> Dict[str, Dict[str, Any]]:
+    """
+    GET /me/messages/{id}?$select=... for each id, 20 per $batch call.
+    Returns {graph id: message}; messages that no longer exist (404) are left out,
+    any other failure raises GraphError.
+    """
+    if not graph_ids:
+        return {}
+    requests = [
+        {"id": str(i), "method": "GET", "url": f"/me/messages/{graph_id}?$select={select}"}
+        for i, graph_id in enumerate(graph_ids)
+    ]
+    responses = await client.batch(requests)
+
+    found: Dict[str, Dict[str, Any]] = {}
+    for i, graph_id in enumerate(graph_ids):
+        sub = responses.get(str(i)) or {}
+        status = sub.get("status")
+        if status == 404:
             continue
+        if status is None or status >= 400:
+            raise GraphError(status or 0, f"fetching message {graph_id}: {sub.get('body')}")
+        found[graph_id] = sub.get("body") or {}
+    return found
+
+
+async def fetch_message_bodies(client: GraphClient, graph_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Second phase of the fetch: body + bodyPreview for just these messages.
+    Returns {graph id: {"body": ..., "bodyPreview": ...}}; messages deleted since the
+    listing are left out.
+    """
+    return await fetch_messages_by_id(client, graph_ids, BODY_SELECT)
+
+
+def load_delta_link() -> Optional[str]:
+    return get_store().get_meta("delta_link") or None
+
+
+def save_delta_link(delta_link: Optional[str]) -> None:
+    get_store().set_meta("delta_link", delta_link or None)
+
+
+def load_analysis_retry() -> List[str]:
+    """Graph ids of new messages whose analysis failed; the next sync fetches them again."""
+    return json.loads(get_store().get_meta("analysis_retry") or "[]")
+
+
+def save_analysis_retry(graph_ids: List[str]) -> None:
+    get_store().set_meta("analysis_retry", json.dumps(graph_ids) if graph_ids else None)
+
+
+async def fetch_changes(
+    client: GraphClient,
+) -> Tuple[List[Dict[str, Any]], List[str], Optional[str]]:
+    """
+    Fetch messages according to SYNC_MODE.
+    Returns (messages, removed graph ids, deltaLink to store after a successful save).
+    """
+    if SYNC_MODE != "delta":
+        return await fetch_emails_from_graph(client), [], None
+
+    try:
+        return await fetch_email_delta(client, load_delta_link())
+    except DeltaLinkExpired:
+        log_event(log, logging.WARNING, "delta_link_expired", account=current_account(), action="full_resync")
+        save_delta_link(None)
+        return await fetch_email_delta(client, None)
 
-        if graph_id in existing_graph_ids:
-            continue  # already processed
 
+def apply_message_changes(record: Dict[str, Any], message: Dict[str, Any]) -> bool:
+    """
+    Copy mutable Graph fields (read state etc.) from a changed message onto a stored record.
+    Returns True if anything actually changed.
+    """
+    if message.get("changeKey") and record.get("changeKey") == message.get("changeKey"):
+        return False  # Graph says nothing about this message changed since we stored it
+    analysis = record.setdefault("analysis", {})
+    changed = False
+    if message.get("changeKey"):
+        # remember the new changeKey so the next listing can skip this message
+        record["changeKey"] = message["changeKey"]
+        changed = True
+    for field in ("isRead", "hasAttachments"):
+        if field in message and analysis.get(field) != message.get(field, False):
+            analysis[field] = message.get(field, False)
+            changed = True
+    return changed
+
+
+# ==========================
+# Sync logic used by CLI
+# ==========================
+
+def analyze_new_messages(graph_ids: List[str], texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    analyze_emails over one sync's new messages (or one AnalysisPool batch).
+    Returns None in place of any message whose analysis failed.
+    """
+    try:
+        return list(analyze_emails(texts))
+    except Exception as e:
+        # One bad email shouldn't sink the whole batch: fall back to one at a time
+        log_event(
+            log, logging.WARNING, "batch_analysis_failed", account=current_account(),
+            messages=len(texts), error=str(e), action="retry_individually",
+        )
+
+    summaries: List[Optional[Dict[str, Any]]] = []
+    for graph_id, text in zip(graph_ids, texts):
+        try:
+            summaries.append(analyze_email(text))
+        except Exception as e:
+            # Log and continue; don't crash the whole sync for one bad email
+            log_event(
+                log, logging.ERROR, "message_analysis_failed", account=current_account(),
+                graph_id=graph_id, error=str(e),
+            )
+            summaries.append(None)
+    return summaries
+
+
+def message_priority(message: Dict[str, Any]) -> Tuple[int, float]:
+    """Analysis order for AnalysisPool (lowest first): unread before read, then newest first."""
+    received = message.get("receivedDateTime")
+    timestamp = parse_iso(received).timestamp() if received else 0.0
+    return (1 if message.get("isRead") else 0, -timestamp)
+
+
+def insert_analyzed(
+    messages: List[Dict[str, Any]],
+    summaries: List[Optional[Dict[str, Any]]],
+    texts: Optional[List[str]] = None,
+) -> int:
+    """
+    Build email records for analyzed messages and insert them into the store.
+    texts: the cleaned bodies they were analyzed from, for the search index
+    Messages whose analysis failed (summary None) are skipped. Returns the inserted count.
+    """
+    store = get_store()
+
+    # Our own incremental id, from the store's persisted counter (stable across runs and deletions)
+    analyzed = sum(1 for summary in summaries if summary is not None)
+    if not analyzed:
+        return 0
+    next_id = store.allocate_email_ids(analyzed)
+    new_records: List[Dict[str, Any]] = []
+    bodies: List[str] = []
+
+    for n, (each_message, summary) in enumerate(zip(messages, summaries)):
+        if summary is None:
+            continue
+
+        graph_id = each_message.get("id")
         subject = each_message.get("subject")
         sender = each_message.get("from", {}).get("emailAddress", {}).get("address")
         sender_name = extract_sender_name(sender)
@@ -319,59 +695,283 @@ def sync_emails() -> List[Dict[str, Any]]:
         body_preview = each_message.get("bodyPreview", "")
         is_read = each_message.get("isRead", False)
         has_attachments = each_message.get("hasAttachments", False)
-        raw_html = each_message.get("body", {}).get("content", "")
 
-        text = clean_html(raw_html)
+        category = dashboard_category(summary, subject)
+        summary.update({
+            "subject": subject,
+            "category": category,
+            "senderEmail": sender,
+            "sender": sender_name,
+            "receivedAt": received,
+            "preview": body_preview,
+            "isRead": is_read,
+            "hasAttachments": has_attachments,
+        })
 
-        try:
-            summary = analyze_email(text)
-            category = summary.get("email_type") or "Uncategorized"
-            summary.update({
-                "subject": subject,
-                "category": category,
-                "senderEmail": sender,
-                "sender": sender_name,
-                "receivedAt": received,
-                "preview": body_preview,
-                "isRead": is_read,
-                "hasAttachments": has_attachments,
-            })
-
-            record: Dict[str, Any] = {
-                "id": next_id,          # incremental id: 0,1,2,...
-                "graph_id": graph_id,   # original Graph id
-                "subject": subject,
-                "senderEmail": sender,
-                "receivedAt": received,
-                "analysis": summary,
-            }
-
-            existing.append(record)
-            existing_graph_ids.add(graph_id)
-            next_id += 1
+        record: Dict[str, Any] = {
+            "id": next_id,          # incremental id: 0,1,2,...
+            "graph_id": graph_id,   # original Graph id
+            "changeKey": each_message.get("changeKey"),
+            "subject": subject,
+            "senderEmail": sender,
+            "receivedAt": received,
+            "analysis": summary,
+        }
 
-        except Exception as e:
-            # Log and continue; don't crash the whole sync for one bad email
-            print(f"Error calling NER analyzer for message {graph_id}: {e}")
+        new_records.append(record)
+        bodies.append(texts[n] if texts is not None else body_preview)
+        next_id += 1
 
-    save_emails_to_file(existing)
-    return existing
+    return store.insert_emails(new_records, bodies)
+
+
+async def sync_emails(client: Optional[GraphClient] = None, pool: Optional[AnalysisPool] = None) -> Dict[str, int]:
+    """
+    client: shared GraphClient (the API passes its own); a temporary one is used if omitted
+    pool: AnalysisPool to analyze on (analysis_pool.py); without one, analysis runs in a thread
+
+    - List changes from Graph (delta query, or first page in "full" mode), listing fields only
+    - Delete records Graph reports as removed, update read state on changed ones
+    - Look up only the fetched Graph ids in the store (indexed) to find new emails
+    - Fetch bodies for just the new emails ($batch, 20 per call), SYNC_CHUNK_SIZE at a time
+    - For any *new* email, run analyze_emails (batched) and insert it; with a pool,
+      unread/newest mail goes first and each finished batch is stored right away
+    - Assign incremental ids from the store's persisted counter (never reused); the
+      cleaned bodies go into the store's search index with them (search.py)
+    - Messages whose analysis failed are kept in a retry list (store meta) before the
+      deltaLink moves past them; the next sync fetches them again by id
+    - Store the new deltaLink once the records are written
+    - Download the attachments of emails that have some (attachments.ingest_attachments)
+    - Re-derive tasks / attachments for the emails that changed (generate_tasks_and_attachments)
+    - Return counts of what changed (read the emails back with load_emails_from_file)
+    """
+    if client is None:
+        async with make_graph_client() as own_client:
+            return await sync_emails(own_client, pool)
+
+    with stage("sync"):
+        with stage("graph_list"):
+            messages, removed_ids, delta_link = await fetch_changes(client)
+            retried = await fetch_analysis_retry(client, messages, removed_ids)
+        counts = await apply_fetched_messages(client, messages + retried, removed_ids, pool)
+
+        if delta_link:
+            save_delta_link(delta_link)
+
+        fetched_attachments = await ingest_attachments(client)
+        # Tasks / attachments for just the emails written above
+        with stage("tasks"):
+            materialized = await asyncio.to_thread(generate_tasks_and_attachments)
+    result = {
+        "fetched": len(messages),
+        "retried": len(retried),
+        **counts,
+        "attachment_files": fetched_attachments.get("files", 0),
+        "tasks_updated": materialized["tasks"],
+    }
+    log_event(log, logging.INFO, "sync_done", **result)
+    return result
+
+
+async def sync_message_ids(
+    client: GraphClient,
+    graph_ids: List[str],
+    removed_ids: Optional[List[str]] = None,
+    pool: Optional[AnalysisPool] = None,
+) -> Dict[str, int]:
+    """
+    Targeted sync for change notifications (subscriptions.py): only these messages.
+    - removed_ids are deleted from the store
+    - graph_ids are fetched by id ($batch): listing fields for ones we already have,
+      listing fields + body for new ones, so new mail needs a single round trip
+    - ids that no longer exist (404) are treated as removed
+    - the deltaLink is left alone; the next poll sees these changes again and skips
+      them (same changeKey / already stored)
+    """
+    store = get_store()
+    removed = list(dict.fromkeys(removed_ids or []))
+    gone = set(removed)
+    wanted = [g for g in dict.fromkeys(graph_ids) if g and g not in gone]
+
+    known = set(store.get_by_graph_ids(wanted))
+    with stage("graph_list"):
+        listed, created = await asyncio.gather(
+            fetch_messages_by_id(client, [g for g in wanted if g in known], LISTING_SELECT),
+            fetch_messages_by_id(client, [g for g in wanted if g not in known], f"{LISTING_SELECT},{BODY_SELECT}"),
+        )
+    found = {**listed, **created}
+    removed += [g for g in wanted if g not in found]
+    messages = [found[g] for g in wanted if g in found]
+
+    counts = await apply_fetched_messages(client, messages, removed, pool)
+    fetched_attachments = await ingest_attachments(client)
+    with stage("tasks"):
+        materialized = await asyncio.to_thread(generate_tasks_and_attachments)
+    result = {
+        "notified": len(wanted) + len(gone),
+        **counts,
+        "attachment_files": fetched_attachments.get("files", 0),
+        "tasks_updated": materialized["tasks"],
+    }
+    log_event(log, logging.INFO, "targeted_sync_done", **result)
+    return result
+
+
+async def fetch_analysis_retry(
+    client: GraphClient,
+    messages: List[Dict[str, Any]],
+    removed_ids: List[str],
+) -> List[Dict[str, Any]]:
+    """
+    Messages from the analysis retry list that this listing didn't bring anyway,
+    fetched by id with their bodies. Ids that no longer exist leave the list.
+    """
+    retry_ids = load_analysis_retry()
+    if not retry_ids:
+        return []
+    listed = {m.get("id") for m in messages}.union(removed_ids)
+    wanted = [g for g in retry_ids if g not in listed]
+    found = await fetch_messages_by_id(client, wanted, f"{LISTING_SELECT},{BODY_SELECT}")
+    if len(found) < len(wanted):
+        save_analysis_retry([g for g in retry_ids if g in listed or g in found])
+    return [found[g] for g in wanted if g in found]
+
+
+async def apply_fetched_messages(
+    client: GraphClient,
+    messages: List[Dict[str, Any]],
+    removed_ids: List[str],
+    pool: Optional[AnalysisPool] = None,
+) -> Dict[str, int]:
+    """
+    Write one batch of Graph changes to the store (shared by sync_emails and sync_message_ids):
+    removals, read-state changes on stored emails, and analysis + insert for new ones.
+    New messages without a body get theirs through fetch_message_bodies.
+    New messages whose analysis fails go on the analysis retry list (load_analysis_retry);
+    messages seen here otherwise leave it.
+    """
+    store = get_store()
+
+    if removed_ids:
+        store.delete_by_graph_ids(removed_ids)
+
+    # We use the Graph message id as the dedupe key
+    existing_by_graph_id = store.get_by_graph_ids(m.get("id") for m in messages)
+    existing_graph_ids = set(existing_by_graph_id)
+    changed_records: List[Dict[str, Any]] = []
+
+    # Collect new messages first so their bodies come in a few $batch calls and
+    # NER can run over them in nlp.pipe batches
+    new_messages: List[Dict[str, Any]] = []
+    for each_message in messages:
+        graph_id = each_message.get("id")
+        if not graph_id:
+            continue
+
+        if graph_id in existing_graph_ids:
+            # already processed; only pick up read-state changes
+            record = existing_by_graph_id.get(graph_id)
+            if record is not None and apply_message_changes(record, each_message):
+                changed_records.append(record)
+            continue
+
+        existing_graph_ids.add(graph_id)
+        new_messages.append(each_message)
+
+    store.upsert_emails(changed_records)
+
+    if pool is not None:
+        # unread / newest first across the whole sync, not just within each chunk
+        new_messages.sort(key=message_priority)
+    inserted = 0
+    failed: List[str] = []
+    for start in range(0, len(new_messages), SYNC_CHUNK_SIZE):
+        chunk_inserted, chunk_failed = await store_new_messages(
+            client, new_messages[start:start + SYNC_CHUNK_SIZE], pool, store.namespace
+        )
+        inserted += chunk_inserted
+        failed += chunk_failed
+
+    # Before the caller stores a deltaLink past them: a failed message must be retried
+    retry_ids = load_analysis_retry()
+    if retry_ids or failed:
+        seen = set(existing_graph_ids).union(removed_ids)
+        save_analysis_retry([g for g in retry_ids if g not in seen] + failed)
+        if failed:
+            log_event(
+                log, logging.WARNING, "analysis_retry_queued", account=current_account(),
+                messages=len(failed),
+            )
+
+    counts = {"new": inserted, "changed": len(changed_records), "removed": len(removed_ids), "failed": len(failed)}
+    for outcome, count in counts.items():
+        if count:
+            MESSAGES_PROCESSED.inc(count, outcome=outcome)
+    return counts
+
+
+async def store_new_messages(
+    client: GraphClient,
+    new_messages: List[Dict[str, Any]],
+    pool: Optional[AnalysisPool] = None,
+    tenant: Optional[str] = None,
+) -> Tuple[int, List[str]]:
+    """
+    One chunk of apply_fetched_messages: fetch missing bodies, clean, analyze, insert.
+    tenant: the account, so a shared AnalysisPool can take turns between mailboxes.
+    Returns (inserted, graph ids whose analysis failed).
+    """
+    with stage("graph_bodies"):
+        bodies = await fetch_message_bodies(client, [m["id"] for m in new_messages if "body" not in m])
+    # anything missing was deleted after the listing; the next delta reports the removal
+    new_messages = [
+        {**m, **bodies[m["id"]]} if "body" not in m else m
+        for m in new_messages
+        if "body" in m or m["id"] in bodies
+    ]
+    with stage("clean_html"):
+        texts = [clean_html(m.get("body", {}).get("content", "")) for m in new_messages]
+
+    graph_ids = [m.get("id") for m in new_messages]
+    inserted = 0
+    failed: List[str] = []
+    if pool is None:
+        # NER is CPU-bound; run it off the event loop
+        with stage("analyze"):
+            summaries = await asyncio.to_thread(analyze_new_messages, graph_ids, texts)
+        failed = [g for g, summary in zip(graph_ids, summaries) if summary is None]
+        inserted = insert_analyzed(new_messages, summaries, texts)
+    elif new_messages:
+        priorities = [message_priority(m) for m in new_messages]
+        # includes storing each finished batch, which overlaps with the pool's work
+        with stage("analyze"):
+            async for done in pool.analyze(texts, priorities, graph_ids, tenant):
+                failed += [graph_ids[i] for i, summary in done if summary is None]
+                inserted += insert_analyzed(
+                    [new_messages[i] for i, _ in done],
+                    [summary for _, summary in done],
+                    [texts[i] for i, _ in done],
+                )
+    return inserted, failed
 
 
 # ==========================
 # ==== NEW: Task / attachment generation helpers
 # ==========================
 
-def parse_iso(dt_str: str) -> datetime:
-    """Parse ISO-style datetime like 2025-12-10T14:39:10Z."""
+def parse_iso(dt_str: str, default: Optional[datetime] = None) -> datetime:
+    """
+    Parse ISO-style datetime like 2025-12-10T14:39:10Z.
+    Missing / unparseable values give default, or the current time if no default is given.
+    """
     if not dt_str:
-        return datetime.utcnow()
+        return default or datetime.utcnow()
     try:
         if dt_str.endswith("Z"):
             dt_str = dt_str[:-1] + "+00:00"
         return datetime.fromisoformat(dt_str)
     except Exception:
-        return datetime.utcnow()
+        return default or datetime.utcnow()
 
 
 def parse_human_date(date_str: str) -> Optional[datetime]:
@@ -387,27 +987,8 @@ def parse_human_date(date_str: str) -> Optional[datetime]:
 
 
 def infer_category(analysis: Dict[str, Any], subject: str) -> str:
-    org = (analysis.get("org") or "").lower()
-    email_type = (analysis.get("email_type") or "").lower()
-    subject_lower = (subject or "").lower()
-    existing_cat = (analysis.get("category") or "").lower()
-
-    # If analysis already gave something non-uncategorized, prefer it
-    if existing_cat and existing_cat != "uncategorized":
-        return existing_cat
-
-    if any(x in org for x in ["iras", "cpf", "authority", "ministry", "ica"]):
-        return "government"
-    if any(x in org for x in ["dbs", "ocbc", "uob", "posb", "bank"]):
-        return "finance"
-    if "bill" in subject_lower or "utility" in email_type:
-        return "bills"
-    if analysis.get("has_appointment"):
-        return "healthcare"
-    if analysis.get("has_renewal"):
-        return "government"  # e.g., LTA license renewal
-
-    return "uncategorized"
+    """Dashboard category (frontend EmailCategory) for an email and its tasks."""
+    return dashboard_category(analysis, subject)
 
 
 def parse_amount_from_string(amount_str: str) -> Optional[float]:
@@ -469,94 +1050,143 @@ def make_quick_action(email: Dict[str, Any], analysis: Dict[str, Any]) -> Option
     return None
 
 
-def generate_tasks_and_attachments() -> None:
+def infer_priority(analysis: Dict[str, Any], received_dt: datetime, due_dt: datetime) -> str:
     """
-    Read emails.json and generate:
-      - tasks.json with Task[] matching your mockTasks shape
-      - attachments.json with Attachment[] matching your mockAttachments shape
+    Rule-based priority, so regenerating a task always gives the same answer.
+    - urgent: verification needed, or a bill due within 3 days of arriving
+    - high: billing, documents required or a renewal
+    - normal: appointments and anything with a call to action
+    - low: everything else
     """
-    if not EMAILS_PATH.exists():
-        print(f"{EMAILS_PATH} not found; skipping task/attachment generation.")
-        return
+    days_to_due = (due_dt.date() - received_dt.date()).days
+    if analysis.get("verification_needed") or (analysis.get("has_billing") and days_to_due <= 3):
+        return "urgent"
+    if analysis.get("has_billing") or analysis.get("docs_required") or analysis.get("has_renewal"):
+        return "high"
+    if analysis.get("has_appointment") or analysis.get("has_action_link"):
+        return "normal"
+    return "low"
+
+
+def attachment_file_type(name: str, content_type: Optional[str]) -> str:
+    """File extension of name (statement.PDF -> "pdf"), else the MIME subtype (application/pdf -> "pdf")."""
+    _, dot, extension = name.rpartition(".")
+    if dot and extension and len(extension) <= 8:
+        return extension.lower()
+    subtype = (content_type or "").split(";")[0].split("/")[-1].strip().lower()
+    return subtype or "file"
+
+
+def build_task_and_attachments(email: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Derive the Task and Attachments for one stored email.
+    Attachments come from the files attachments.py fetched for it (none until then).
+    Pure function of the email record: same email in, byte-identical rows out.
+    """
+    email_id = email.get("id")
+    subject = email.get("subject") or ""
+    received_at_str = email.get("receivedAt") or email.get("received") or ""
+    analysis = email.get("analysis") or {}
+
+    received_dt = parse_iso(received_at_str, default=UNKNOWN_RECEIVED_AT)
+    created_at = received_dt
+
+    # dueDate: from first analysis date, else +7 days
+    dates_list = analysis.get("dates") or []
+    due_dt: Optional[datetime] = None
+    if dates_list:
+        due_dt = parse_human_date(dates_list[0])
+    if due_dt is None:
+        due_dt = received_dt + timedelta(days=7)
+
+    preview = analysis.get("preview") or ""
+    description = preview if len(preview) <= 200 else preview[:197] + "..."
+
+    category = infer_category(analysis, subject)
+    priority = infer_priority(analysis, received_dt, due_dt)
+    status = STATUS_DEFAULT
+
+    quick_action = make_quick_action(email, analysis)
+
+    # Task: match your mockTasks TypeScript shape
+    task: Dict[str, Any] = {
+        "id": str(email_id),
+        "title": subject or "Follow up email",
+        "description": description,
+        "emailId": str(email_id),
+        "category": category,
+        "priority": priority,                  # 'low' | 'normal' | 'high' | 'urgent'
+        "status": status,                      # 'pending'
+        "dueDate": due_dt.isoformat(),         # TS: new Date(...)
+        "createdAt": created_at.isoformat(),   # TS: new Date(...)
+    }
 
-    with EMAILS_PATH.open("r", encoding="utf-8") as f:
-        emails = json.load(f)
+    if quick_action:
+        task["quickActionType"] = quick_action
 
-    tasks: List[Dict[str, Any]] = []
+    # Attachments: one per file fetched from Graph (attachments.ingest_attachments)
     attachments: List[Dict[str, Any]] = []
-    attachment_id_counter = 1
-
-    for email in emails:
-        email_id = email.get("id")
-        subject = email.get("subject") or ""
-        received_at_str = email.get("receivedAt") or email.get("received") or ""
-        analysis = email.get("analysis") or {}
-
-        received_dt = parse_iso(received_at_str)
-        created_at = received_dt
-
-        # dueDate: from first analysis date, else +7 days
-        dates_list = analysis.get("dates") or []
-        due_dt: Optional[datetime] = None
-        if dates_list:
-            due_dt = parse_human_date(dates_list[0])
-        if due_dt is None:
-            due_dt = received_dt + timedelta(days=7)
-
-        preview = analysis.get("preview") or ""
-        description = preview if len(preview) <= 200 else preview[:197] + "..."
-
-        category = infer_category(analysis, subject)
-        priority = random.choice(PRIORITIES)
-        status = STATUS_DEFAULT
-
-        quick_action = make_quick_action(email, analysis)
-
-        # Task: match your mockTasks TypeScript shape
-        task: Dict[str, Any] = {
-            "id": str(email_id),
-            "title": subject or "Follow up email",
-            "description": description,
-            "emailId": str(email_id),
+    has_attachments = analysis.get("hasAttachments") or email.get("hasAttachments")
+    fetched_files = (email.get("attachments") or []) if has_attachments else []
+    for n, fetched in enumerate(fetched_files):
+        file_name = fetched.get("name") or f"attachment_{n + 1}"
+        attachments.append({
+            "id": f"{email_id}-{n}",
+            "fileName": file_name,
+            "fileType": attachment_file_type(file_name, fetched.get("contentType")),
+            "fileSize": fetched.get("size") or 0,
             "category": category,
-            "priority": priority,                  # 'low' | 'normal' | 'high' | 'urgent'
-            "status": status,                      # 'pending'
-            "dueDate": due_dt.isoformat(),         # TS: new Date(...)
-            "createdAt": created_at.isoformat(),   # TS: new Date(...)
-        }
+            "uploadedAt": parse_iso(fetched.get("lastModifiedDateTime") or "", default=received_dt).isoformat(),
+            "emailId": str(email_id),
+            "contentType": fetched.get("contentType"),
+            "sha256": fetched.get("sha256"),  # None: listed only (too big / not a file)
+        })
 
-        if quick_action:
-            task["quickActionType"] = quick_action
+    return task, attachments
 
-        tasks.append(task)
 
-        # Attachment: generate dummy PDF if hasAttachments true
-        has_attachments = analysis.get("hasAttachments") or email.get("hasAttachments")
-        if has_attachments:
-            file_name_base = subject.strip() or f"email_{email_id}"
-            file_name = file_name_base.replace(" ", "_") + ".pdf"
-            file_size = random.randint(80_000, 300_000)
+def generate_tasks_and_attachments(full: bool = False) -> Dict[str, int]:
+    """
+    Bring tasks / attachments in the store up to date with the emails:
+      - tasks with Task[] matching your mockTasks shape
+      - attachments with Attachment[] matching your mockAttachments shape
+    Incremental: only emails written since the last run (store seq > tasks_watermark)
+    are re-derived and upserted; deleted emails take their rows with them (see
+    EmailStore.delete_by_graph_ids). full=True (or no watermark yet) rebuilds everything.
+    (python store.py export writes them back out as tasks.json / attachments.json)
+    """
+    store = get_store()
+    # Read the version before the emails: anything written after it is picked up next run
+    version = store.version
+    watermark = None if full else store.get_tasks_watermark()
+    emails = store.load_emails() if watermark is None else store.load_emails_since(watermark)
 
-            attachment = {
-                "id": str(attachment_id_counter),
-                "fileName": file_name,
-                "fileType": "pdf",
-                "fileSize": file_size,
-                "category": category,
-                "uploadedAt": received_dt.isoformat(),  # TS: new Date(...)
-                "emailId": str(email_id),
-            }
-            attachments.append(attachment)
-            attachment_id_counter += 1
+    tasks: List[Dict[str, Any]] = []
+    attachments: List[Dict[str, Any]] = []
+    for email in emails:
+        task, email_attachments = build_task_and_attachments(email)
+        tasks.append(task)
+        attachments.extend(email_attachments)
 
-    with TASKS_PATH.open("w", encoding="utf-8") as f:
-        json.dump(tasks, f, ensure_ascii=False, indent=2)
+    if watermark is None:
+        store.replace_tasks_and_attachments(tasks, attachments, watermark=version)
+        log_event(
+            log, logging.INFO, "tasks_rebuilt", account=current_account(),
+            tasks=len(tasks), attachments=len(attachments),
+        )
+        return {"emails": len(emails), "tasks": len(tasks), "attachments": len(attachments)}
 
-    with ATTACHMENTS_PATH.open("w", encoding="utf-8") as f:
-        json.dump(attachments, f, ensure_ascii=False, indent=2)
+    if not emails:
+        return {"emails": 0, "tasks": 0, "attachments": 0}
 
-    print(f"Wrote {len(tasks)} tasks to {TASKS_PATH}")
-    print(f"Wrote {len(attachments)} attachments to {ATTACHMENTS_PATH}")
+    changed = store.upsert_tasks_and_attachments(
+        [str(e.get("id")) for e in emails], tasks, attachments, watermark=version
+    )
+    log_event(
+        log, logging.INFO, "tasks_updated", account=current_account(),
+        emails=len(emails), tasks=changed["tasks"], attachments=changed["attachments"],
+    )
+    return {"emails": len(emails), **changed}
 
 
 # ==========================
@@ -564,6 +1194,7 @@ def generate_tasks_and_attachments() -> None:
 # ==========================
 
 if __name__ == "__main__":
-    emails = sync_emails()
+    get_graph_token(interactive=True)  # sign in at the terminal if needed, before syncing
+    asyncio.run(sync_emails())
+    emails = load_emails_from_file()
     print(json.dumps(emails, indent=2, ensure_ascii=False))
-    generate_tasks_and_attachments()
@@ -0,0 +1,277 @@
+# events.py
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from indexes import Change
+from metrics import get_logger, log_event
+
+log = get_logger("events")
+
+# ==========================
+# Config
+# ==========================
+
+# Events kept for Last-Event-ID resume (and for slow clients to catch up from)
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "10000"))
+# How often a worker with connected clients checks the store for writes by other workers
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "1.0"))
+# Comment line sent on idle streams so proxies keep the connection open
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Reconnect delay suggested to EventSource clients
+EVENTS_RETRY_MS = 3000
+
+EVENT_TYPES = (
+    "email.added",
+    "email.read_state",
+    "email.analyzed",
+    "email.updated",
+    "email.removed",
+    "task.created",
+    "task.updated",
+    "task.removed",
+)
+
+# Analysis keys mirrored from Graph; a change to anything else means the analysis changed
+GRAPH_ANALYSIS_FIELDS = ("isRead", "hasAttachments")
+
+
+def event_type(kind: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> str:
+    """Name of the event for one index change (see indexes.Change)."""
+    if after is None:
+        return f"{kind}.removed"
+    if kind == "task":
+        return "task.created" if before is None else "task.updated"
+    if before is None:
+        # emails are only stored once analyzed, so this carries the analysis
+        return "email.added"
+
+    old = before.get("analysis") or {}
+    new = after.get("analysis") or {}
+    if old.get("isRead") != new.get("isRead"):
+        return "email.read_state"
+    strip = lambda analysis: {k: v for k, v in analysis.items() if k not in GRAPH_ANALYSIS_FIELDS}  # noqa: E731
+    if strip(old) != strip(new):
+        return "email.analyzed"
+    return "email.updated"
+
+
+def sse_frame(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def sse_id(version: int) -> bytes:
+    # an id-only frame moves the client's Last-Event-ID without dispatching an event
+    return f"id: {version}\n\n".encode("utf-8")
+
+
+# ==========================
+# Event bus
+# ==========================
+
+class EventBus:
+    """
+    Fan-out of index changes to Server-Sent Events streams, one bus per worker process.
+    - Fed by MailboxIndex listeners: each refresh is one group of events, all with the
+      store version of that refresh as event id (so ids mean the same on every worker)
+    - Events are encoded once, into a bounded in-memory log; every client is just a
+      cursor into that log, woken by a single shared asyncio.Event when a group lands
+      (no per-client queues, no per-client polling)
+    - The id is sent after each group, so a client dropped mid-group replays that whole
+      group; events carry full records, so replays are harmless
+    - A client resuming from before the oldest buffered version, or one that falls
+      behind the buffer, gets a "reset" event and should reload GET /emails, /tasks
+    """
+
+    def __init__(self, capacity: int = EVENTS_BUFFER_SIZE):
+        self.capacity = max(1, capacity)
+        self._entries: List[Tuple[int, str, bytes]] = []  # (version, event type, frame)
+        self._offset = 0  # absolute position of _entries[0]
+        # joined frames per (from position, filter) since the last append: caught-up
+        # clients all sit at the same position, so one join serves all of them
+        self._chunks: Dict[Tuple[int, Tuple[str, ...]], bytes] = {}
+        self.floor: Optional[int] = None  # every event after this version is buffered
+        self.version: Optional[int] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.published = 0
+        self.clients = 0
+        self.resets = 0
+
+    def start(
+        self,
+        refresh: Callable[[], Any],
+        poll_seconds: float = EVENTS_POLL_SECONDS,
+        heartbeat: float = EVENTS_HEARTBEAT_SECONDS,
+    ) -> None:
+        """Attach to the running loop; refresh (e.g. api.get_index) is polled while clients are connected."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow(refresh, poll_seconds, heartbeat), name="event-bus")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _follow(self, refresh: Callable[[], Any], poll_seconds: float, heartbeat: float) -> None:
+        # One store check and one heartbeat timer per worker, not per client;
+        # syncs in this worker refresh the index directly
+        loop = asyncio.get_running_loop()
+        next_beat = loop.time() + heartbeat
+        while True:
+            await asyncio.sleep(min(poll_seconds, heartbeat))
+            if not self.clients:
+                continue
+            try:
+                await asyncio.to_thread(refresh)
+            except Exception as e:
+                log_event(log, logging.WARNING, "event_bus_refresh_failed", error=str(e))
+            if loop.time() >= next_beat:
+                next_beat = loop.time() + heartbeat
+                self._wake()  # clients with nothing new send a keepalive
+
+    # --------------------------
+    # Producer side
+    # --------------------------
+
+    def publish(self, version: int, changes: List[Change]) -> None:
+        """MailboxIndex listener; may be called from any thread. Encodes here, appends on the loop."""
+        entries = []
+        for kind, id_, before, after in changes:
+            type_ = event_type(kind, before, after)
+            data = after if after is not None else {"id": (before or {}).get("id", id_)}
+            entries.append((version, type_, sse_frame(type_, data)))
+
+        if self._loop is None:
+            self._append(version, entries)
+        else:
+            self._loop.call_soon_threadsafe(self._append, version, entries)
+
+    def _append(self, version: int, entries: List[Tuple[int, str, bytes]]) -> None:
+        if self.floor is None:
+            self.floor = version  # baseline: nothing before this is buffered
+        self.version = version
+        if not entries:
+            return
+        self._entries.extend(entries)
+        self.published += len(entries)
+        self._chunks.clear()
+
+        overflow = len(self._entries) - self.capacity
+        if overflow > 0:
+            # drop whole groups only, so "everything after floor is buffered" stays true
+            self.floor = self._entries[overflow - 1][0]
+            while overflow < len(self._entries) and self._entries[overflow][0] == self.floor:
+                overflow += 1
+            del self._entries[:overflow]
+            self._offset += overflow
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    # --------------------------
+    # Consumer side
+    # --------------------------
+
+    def _end(self) -> int:
+        return self._offset + len(self._entries)
+
+    def _reset_frame(self) -> bytes:
+        self.resets += 1
+        return sse_frame("reset", {"version": self.version}) + sse_id(self.version or 0)
+
+    def _resume(self, last_event_id: Optional[str]) -> Tuple[int, bytes]:
+        """(absolute log position to stream from, frame to send first)."""
+        if last_event_id is None:
+            return self._end(), sse_id(self.version or 0)
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            return self._end(), self._reset_frame()
+        if self.version is None or since >= self.version:
+            return self._end(), b""
+        if self.floor is None or since < self.floor:
+            return self._end(), self._reset_frame()
+        # "\uffff" sorts after any event type, so this skips every entry of version since
+        return self._offset + bisect.bisect_right(self._entries, (since, "\uffff")), b""
+
+    async def stream(
+        self,
+        last_event_id: Optional[str] = None,
+        types: Optional[List[str]] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        SSE body for one client.
+        - last_event_id: resume after this version (the Last-Event-ID header on reconnects)
+        - types: only these event types; "task" matches every task.* event
+        """
+        wanted = tuple(types or ())
+
+        def wants(type_: str) -> bool:
+            return not wanted or type_ in wanted or type_.split(".", 1)[0] in wanted
+
+        self.clients += 1
+        try:
+            position, first = self._resume(last_event_id)
+            yield f"retry: {EVENTS_RETRY_MS}\n\n".encode("utf-8") + first
+
+            while True:
+                if position < self._offset:
+                    # fell further behind than the buffer reaches
+                    yield self._reset_frame()
+                    position = self._end()
+
+                if position < self._end():
+                    chunk = self._chunks.get((position, wanted))
+                    if chunk is None:
+                        chunk = self._chunks[(position, wanted)] = self._render(position, wants)
+                    position = self._end()
+                    yield chunk
+                    continue
+
+                await self._changed.wait()
+                if position == self._end():
+                    yield b": keepalive\n\n"
+        finally:
+            self.clients -= 1
+
+    def _render(self, position: int, wants: Callable[[str], bool]) -> bytes:
+        """Frames from position to the end of the log, with an id frame after each group."""
+        chunks: List[bytes] = []
+        group: Optional[int] = None
+        for version, type_, frame in self._entries[position - self._offset:]:
+            if group is not None and version != group:
+                chunks.append(sse_id(group))
+            if wants(type_):
+                chunks.append(frame)
+            group = version
+        chunks.append(sse_id(group))
+        return b"".join(chunks)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": self.clients,
+            "version": self.version,
+            "oldest_resumable_version": self.floor,
+            "buffered": len(self._entries),
+            "capacity": self.capacity,
+            "published": self.published,
+            "resets": self.resets,
+        }
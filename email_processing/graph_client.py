@@ -0,0 +1,383 @@
+# graph_client.py
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from metrics import GRAPH_REQUESTS, GRAPH_REQUEST_SECONDS, GRAPH_RETRIES, stage
+from ms_graph import MS_GRAPH_BASE_URL
+
+# ==========================
+# Config
+# ==========================
+
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "8"))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+GRAPH_TIMEOUT_SECONDS = float(os.getenv("GRAPH_TIMEOUT_SECONDS", "30"))
+# In-flight requests per account when several accounts share one client (accounts.py)
+GRAPH_ACCOUNT_MAX_CONCURRENCY = int(os.getenv("GRAPH_ACCOUNT_MAX_CONCURRENCY", "4"))
+GRAPH_BACKOFF_BASE_SECONDS = 0.5
+GRAPH_BACKOFF_MAX_SECONDS = 60.0
+# Graph's JSON batching limit: at most 20 sub-requests per $batch call
+GRAPH_BATCH_SIZE = 20
+
+# Throttling + transient server errors are retried; everything else is returned as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GraphError(Exception):
+    """Non-2xx response from Microsoft Graph (after retries)."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Graph request failed with status code {status_code}: {message}")
+        self.status_code = status_code
+
+
+# ==========================
+# Metrics
+# ==========================
+
+class GraphMetrics:
+    """
+    Per-request latency + status counters, kept in memory.
+    Latencies are a rolling window so percentiles reflect recent traffic.
+    Everything is also exported on /metrics (woomail_graph_* in metrics.py).
+    """
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.retries = 0
+        self.transport_errors = 0
+        self.by_status: Dict[int, int] = {}
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def observe(self, method: str, status_code: Optional[int], seconds: float) -> None:
+        GRAPH_REQUESTS.inc(method=method, status="error" if status_code is None else status_code)
+        GRAPH_REQUEST_SECONDS.observe(seconds, method=method)
+        self.requests += 1
+        self.latencies.append(seconds)
+        if status_code is None:
+            self.transport_errors += 1
+        else:
+            self.by_status[status_code] = self.by_status.get(status_code, 0) + 1
+
+    def retried(self, kind: str, count: int = 1) -> None:
+        GRAPH_RETRIES.inc(count, kind=kind)
+        self.retries += count
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "transport_errors": self.transport_errors,
+            "by_status": dict(self.by_status),
+            "latency_ms": {"p50": pct(0.50), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+# ==========================
+# Client
+# ==========================
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parse Retry-After (delta-seconds or HTTP-date)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def sub_retry_after_seconds(sub_response: Dict[str, Any]) -> Optional[float]:
+    """Retry-After of one $batch sub-response (header names aren't case-normalized there)."""
+    for name, value in (sub_response.get("headers") or {}).items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    ceiling = min(GRAPH_BACKOFF_MAX_SECONDS, GRAPH_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class GraphClient:
+    """
+    Shared async Microsoft Graph client.
+    - One pooled httpx.AsyncClient (HTTP/2, keep-alive) for the whole app
+    - A semaphore bounds in-flight requests, so parallel page/body fetches can't stampede Graph
+    - 429 / 5xx / transport errors are retried with backoff, honouring Retry-After
+    - for_account() gives other accounts their own token and in-flight cap on the same
+      connection pool and overall limit, so one busy mailbox can't take every slot
+    """
+
+    def __init__(
+        self,
+        token_getter: Callable[[], str],
+        base_url: str = MS_GRAPH_BASE_URL,
+        max_concurrency: int = GRAPH_MAX_CONCURRENCY,
+        max_retries: int = GRAPH_MAX_RETRIES,
+        timeout: float = GRAPH_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        parent: Optional["GraphClient"] = None,
+    ):
+        self.token_getter = token_getter
+        self.max_retries = max_retries
+        self.metrics = GraphMetrics()
+        # this client's own cap; a for_account() client also takes a slot of its parent's
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._shared: Optional[asyncio.Semaphore] = None
+        self._owns_http = parent is None
+        if parent is not None:
+            self._shared = parent._slots
+            self._http = parent._http
+            return
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=True,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "GraphClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._owns_http:
+            await self._http.aclose()
+
+    def for_account(
+        self,
+        token_getter: Callable[[], str],
+        max_concurrency: int = GRAPH_ACCOUNT_MAX_CONCURRENCY,
+    ) -> "GraphClient":
+        """Client for another mailbox on this client's connection pool; closing it leaves the pool open."""
+        return GraphClient(token_getter, max_concurrency=max_concurrency, max_retries=self.max_retries, parent=self)
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """One in-flight request slot: this client's cap, then the shared overall limit."""
+        async with self._slots:
+            if self._shared is None:
+                yield
+                return
+            async with self._shared:
+                yield
+
+    async def auth_headers(self) -> Dict[str, str]:
+        # Token acquisition may hit the network; keep it off the event loop
+        with stage("token"):
+            access_token = await asyncio.to_thread(self.token_getter)
+        return {"Authorization": f"Bearer {access_token}"}
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Send one request with retries. Returns the final response, whatever its status.
+        """
+        attempt = 0
+        while True:
+            response: Optional[httpx.Response] = None
+            error: Optional[httpx.TransportError] = None
+
+            # Per attempt: a long Retry-After wait can outlast the previous token
+            request_headers = await self.auth_headers()
+            if headers:
+                request_headers.update(headers)
+
+            async with self._slot():
+                start = time.perf_counter()
+                try:
+                    response = await self._http.request(
+                        method, url, params=params, json=json, headers=request_headers
+                    )
+                except httpx.TransportError as e:
+                    error = e
+                finally:
+                    self.metrics.observe(
+                        method,
+                        response.status_code if response is not None else None,
+                        time.perf_counter() - start,
+                    )
+
+            retryable = error is not None or response.status_code in RETRY_STATUSES
+            if not retryable:
+                return response
+            if attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            # Sleep outside the semaphore so throttled requests don't hold a slot
+            delay = retry_after_seconds(response) if response is not None else None
+            if delay is None:
+                delay = backoff_seconds(attempt)
+            self.metrics.retried("request")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Like request(), but the body is left unread: the response is yielded with its stream
+        open (holding a concurrency slot) for the caller to read, e.g. with aiter_bytes().
+        Retries only happen before the body starts; a connection lost while reading it
+        raises from the caller's read, which can resume with a Range request.
+        """
+        attempt = 0
+        while True:
+            response: Optional[httpx.Response] = None
+            error: Optional[httpx.TransportError] = None
+
+            # Per attempt: a long Retry-After wait can outlast the previous token
+            request_headers = await self.auth_headers()
+            if headers:
+                request_headers.update(headers)
+
+            async with self._slot():
+                start = time.perf_counter()
+                try:
+                    response = await self._http.send(
+                        self._http.build_request(method, url, headers=request_headers), stream=True
+                    )
+                except httpx.TransportError as e:
+                    error = e
+                finally:
+                    self.metrics.observe(
+                        method,
+                        response.status_code if response is not None else None,
+                        time.perf_counter() - start,
+                    )
+
+                retryable = error is not None or response.status_code in RETRY_STATUSES
+                if not retryable or attempt >= self.max_retries:
+                    if error is not None:
+                        raise error
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                if response is not None:
+                    await response.aclose()
+
+            delay = retry_after_seconds(response) if response is not None else None
+            if delay is None:
+                delay = backoff_seconds(attempt)
+            self.metrics.retried("request")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        response = await self.request("GET", url, params=params, headers=headers)
+        if response.status_code >= 400:
+            raise GraphError(response.status_code, response.text)
+        return response.json()
+
+    async def iter_pages(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every page of a collection, following @odata.nextLink.
+        """
+        next_url: Optional[str] = url
+        while next_url:
+            page = await self.get_json(next_url, params=params, headers=headers)
+            params = None  # nextLink already carries the query string
+            yield page
+            next_url = page.get("@odata.nextLink")
+
+    async def batch(self, requests: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Send sub-requests through JSON batching ($batch), GRAPH_BATCH_SIZE per call,
+        with the calls for one round running concurrently.
+        - requests: [{"id": "1", "method": "GET", "url": "/me/messages/..."}], ids unique
+        - Returns {id: sub-response}, each {"id", "status", "headers", "body"}
+        - Throttled (429) / 5xx sub-requests are sent again in a later round, after the
+          longest Retry-After among them (or backoff), up to max_retries rounds
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = list(requests)
+        attempt = 0
+        while pending:
+            chunks = [pending[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(pending), GRAPH_BATCH_SIZE)]
+            pages = await asyncio.gather(*(self._post_batch(chunk) for chunk in chunks))
+
+            by_id = {r["id"]: r for r in pending}
+            retry: List[Dict[str, Any]] = []
+            delay = 0.0
+            for page in pages:
+                for sub in page:
+                    results[sub["id"]] = sub
+                    if sub.get("status") in RETRY_STATUSES and attempt < self.max_retries:
+                        retry.append(by_id[sub["id"]])
+                        wait = sub_retry_after_seconds(sub)
+                        delay = max(delay, backoff_seconds(attempt) if wait is None else wait)
+
+            if not retry:
+                break
+            self.metrics.retried("batch_item", len(retry))
+            attempt += 1
+            pending = retry
+            await asyncio.sleep(delay)
+        return results
+
+    async def _post_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        response = await self.request("POST", "$batch", json={"requests": requests})
+        if response.status_code >= 400:
+            raise GraphError(response.status_code, response.text)
+        return response.json().get("responses", [])
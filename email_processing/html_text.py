@@ -0,0 +1,95 @@
+# html_text.py
+
+import re
+from html.parser import HTMLParser
+from typing import List
+
+# Tags whose contents are never shown to the reader (and <head>, handled on its own)
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+# Tags that start / end a line of text
+BLOCK_TAGS = {
+    "br", "p", "div", "li", "tr", "table", "ul", "ol", "hr", "blockquote",
+    "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "header", "footer",
+}
+
+# Table cells are separated by a space ("Due date</td><td>20 Jan 2025")
+CELL_TAGS = {"td", "th"}
+
+# Any run of whitespace: collapses to "\n" if it contains a line break, else to " "
+WHITESPACE_RE = re.compile(r"[ \t\r\n\xa0]+")
+
+
+def _collapse(match: "re.Match[str]") -> str:
+    run = match.group(0)
+    return "\n" if ("\n" in run or "\r" in run) else " "
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Streaming HTML -> text converter.
+    - One pass over the markup: feed() chunks as they arrive, then close() + text()
+    - All named / numeric character references are decoded (convert_charrefs)
+    - <script>, <style>, <head> ... contents and comments are dropped
+    - <head> also ends at <body> or the first block / cell tag, as in browsers, so an
+      unclosed <head> (common in generated mail) doesn't drop the whole message
+    - Block-level tags become line breaks, table cells are separated by a space
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._in_head = False
+
+    def _end_head(self, tag: str) -> None:
+        """Close an unclosed <head> when tag can only be body content."""
+        if tag == "body":
+            self._in_head = False
+            self._skip_depth = 0  # nothing left open in the head outlives it
+        elif not self._skip_depth and (tag in BLOCK_TAGS or tag in CELL_TAGS):
+            self._in_head = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._in_head:
+            self._end_head(tag)
+        if tag == "head":
+            self._in_head = True
+        elif tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._parts.append("\n")
+        elif tag in CELL_TAGS and not self._skip_depth:
+            self._parts.append(" ")
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/>, <hr/> ... never open a skipped section
+        if self._in_head:
+            self._end_head(tag)
+        if tag in BLOCK_TAGS and not self._skip_depth:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self._in_head = False
+        elif tag in SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not (self._skip_depth or self._in_head):
+            self._parts.append(data)
+
+    def text(self) -> str:
+        return WHITESPACE_RE.sub(_collapse, "".join(self._parts)).strip()
+
+
+def html_to_text(raw_html: str) -> str:
+    if not raw_html:
+        return ""
+    parser = HTMLTextExtractor()
+    parser.feed(raw_html)
+    parser.close()
+    return parser.text()
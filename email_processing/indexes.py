@@ -0,0 +1,353 @@
+# indexes.py
+
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from columns import FLAG_FIELDS, FlagColumns, dashboard_category
+from metrics import get_logger, log_event
+from store import EmailStore
+
+log = get_logger("indexes")
+
+# ==========================
+# Config
+# ==========================
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+Key = Tuple[str, Any]
+# ("email" | "task", id, record before, record after); None before = new, None after = removed
+Change = Tuple[str, int, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def _norm(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def _insort(ids: List[int], id_: int) -> None:
+    # ids mostly arrive in increasing order, so this is usually an append
+    if not ids or ids[-1] < id_:
+        ids.append(id_)
+    else:
+        bisect.insort(ids, id_)
+
+
+def _discard(ids: List[int], id_: int) -> None:
+    i = bisect.bisect_left(ids, id_)
+    if i < len(ids) and ids[i] == id_:
+        del ids[i]
+
+
+def email_keys(email: Dict[str, Any]) -> Iterable[Key]:
+    analysis = email.get("analysis") or {}
+    yield ("category", dashboard_category(analysis))
+    yield ("isRead", bool(analysis.get("isRead")))
+    if analysis.get("org"):
+        yield ("org", _norm(analysis["org"]))
+    for flag in FLAG_FIELDS:
+        if analysis.get(flag):
+            yield (flag, True)
+
+
+def task_keys(task: Dict[str, Any]) -> Iterable[Key]:
+    yield ("category", dashboard_category(task))
+    yield ("priority", _norm(task.get("priority")))
+    yield ("status", _norm(task.get("status")))
+
+
+def project(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Keep only the requested fields. "analysis.category" picks one key out of a nested dict;
+    unknown fields are skipped.
+    """
+    if not fields:
+        return record
+    out: Dict[str, Any] = {}
+    for field in fields:
+        head, _, rest = field.partition(".")
+        if head not in record:
+            continue
+        if not rest:
+            out[head] = record[head]
+        elif isinstance(record[head], dict) and rest in record[head]:
+            out.setdefault(head, {})[rest] = record[head][rest]
+    return out
+
+
+# ==========================
+# Index structures
+# ==========================
+
+class PostingIndex:
+    """
+    Records by integer id, with a sorted id list per (field, value) key.
+    - upsert/remove keep every list sorted, so ids double as stable cursors
+    - page() walks the shortest list that applies from the cursor on, and checks
+      the remaining filters against each record's key set
+    """
+
+    def __init__(self, keys_fn: Callable[[Dict[str, Any]], Iterable[Key]]):
+        self.keys_fn = keys_fn
+        self.records: Dict[int, Dict[str, Any]] = {}
+        self.ids: List[int] = []
+        self.postings: Dict[Key, List[int]] = {}
+        self._keys: Dict[int, FrozenSet[Key]] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def upsert(self, id_: int, record: Dict[str, Any]) -> None:
+        if id_ in self.records:
+            self.remove(id_)
+        keys = frozenset(self.keys_fn(record))
+        self.records[id_] = record
+        self._keys[id_] = keys
+        _insort(self.ids, id_)
+        for key in keys:
+            _insort(self.postings.setdefault(key, []), id_)
+
+    def remove(self, id_: int) -> None:
+        if self.records.pop(id_, None) is None:
+            return
+        _discard(self.ids, id_)
+        for key in self._keys.pop(id_):
+            ids = self.postings.get(key)
+            if ids is not None:
+                _discard(ids, id_)
+                if not ids:
+                    del self.postings[key]
+
+    def clear(self) -> None:
+        self.records.clear()
+        self.ids.clear()
+        self.postings.clear()
+        self._keys.clear()
+
+    def page(
+        self,
+        filters: List[Key],
+        after: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        candidates: Optional[List[int]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Records matching every filter key (and in candidates, a sorted id list, if given),
+        in id order, starting after the cursor id. Returns (records, next cursor or None).
+        """
+        lists = [self.postings.get(key, []) for key in filters]
+        if candidates is not None:
+            lists.append(candidates)
+        base = min(lists, key=len) if lists else self.ids
+
+        required = frozenset(filters)
+        candidate_set: Optional[Set[int]] = None
+        if candidates is not None and base is not candidates:
+            candidate_set = set(candidates)
+
+        matched: List[int] = []
+        i = bisect.bisect_right(base, after) if after is not None else 0
+        while i < len(base) and len(matched) <= limit:
+            id_ = base[i]
+            i += 1
+            if not required <= self._keys[id_]:
+                continue
+            if candidate_set is not None and id_ not in candidate_set:
+                continue
+            matched.append(id_)
+
+        next_cursor = matched[limit - 1] if len(matched) > limit else None
+        return [self.records[id_] for id_ in matched[:limit]], next_cursor
+
+
+class DueDateIndex:
+    """(dueDate, id) pairs kept sorted, for range queries on ISO dates."""
+
+    def __init__(self):
+        self._entries: List[Tuple[str, int]] = []
+        self._due: Dict[int, str] = {}
+
+    def upsert(self, id_: int, due: Optional[str]) -> None:
+        self.remove(id_)
+        if due:
+            bisect.insort(self._entries, (due, id_))
+            self._due[id_] = due
+
+    def remove(self, id_: int) -> None:
+        due = self._due.pop(id_, None)
+        if due is not None:
+            i = bisect.bisect_left(self._entries, (due, id_))
+            if i < len(self._entries) and self._entries[i] == (due, id_):
+                del self._entries[i]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._due.clear()
+
+    def ids_between(self, due_from: Optional[str], due_to: Optional[str]) -> List[int]:
+        """Sorted ids due in [due_from, due_to]; bounds are ISO prefixes, so "2025-01-31" includes that whole day."""
+        lo = bisect.bisect_left(self._entries, (due_from, -1)) if due_from else 0
+        # "\uffff" sorts after any time suffix, making the upper bound inclusive
+        hi = bisect.bisect_right(self._entries, (due_to + "\uffff",)) if due_to else len(self._entries)
+        return sorted(id_ for _, id_ in self._entries[lo:hi])
+
+
+# ==========================
+# Mailbox index
+# ==========================
+
+class MailboxIndex:
+    """
+    In-memory secondary indexes over the store's emails and tasks, for the paginated
+    /emails and /tasks endpoints.
+    - emails: posting lists per category, isRead, org and each analysis flag
+    - tasks: posting lists per category, priority, status, plus a sorted due-date index
+      (task ids are email ids, so the due-date index filters emails too)
+    - columns: the same emails as NumPy columns (columns.FlagColumns) for /stats
+    - refresh() applies only what changed since the last refresh: rows whose seq is newer,
+      and tombstones for deletions, so keeping up with a sync costs O(delta)
+    - listeners get (version, changes) after every refresh, inside the lock so they see
+      deltas in order (events.EventBus turns them into SSE events); the first load is the
+      baseline and has no changes
+    """
+
+    def __init__(self, store: EmailStore):
+        self.store = store
+        self.seq: Optional[int] = None
+        self.emails = PostingIndex(email_keys)
+        self.tasks = PostingIndex(task_keys)
+        self.due = DueDateIndex()
+        self.columns = FlagColumns()
+        self._stats: Optional[Dict[str, Any]] = None
+        self._stats_seq: Optional[int] = None
+        self._lock = threading.RLock()
+        self.listeners: List[Callable[[int, List[Change]], None]] = []
+
+    def add_listener(self, listener: Callable[[int, List[Change]], None]) -> None:
+        """Register listener and call it once with the current version (its baseline)."""
+        with self._lock:
+            self.listeners.append(listener)
+            if self.seq is not None:
+                listener(self.seq, [])
+
+    def refresh(self) -> bool:
+        """Catch up with the store; returns False if it was already current."""
+        with self._lock:
+            version = self.store.version
+            if version == self.seq:
+                return False
+
+            track = self.seq is not None and bool(self.listeners)
+            changes: List[Change] = []
+            old_tasks: Dict[int, Dict[str, Any]] = {}
+
+            if self.seq is None:
+                tombstones: List[tuple] = []
+                emails = self.store.load_emails()
+                tasks = self.store.load_tasks()
+            else:
+                tombstones = self.store.load_tombstones_since(self.seq)
+                emails = self.store.load_emails_since(self.seq)
+                if int(self.store.get_meta("tasks_rebuilt_at") or 0) > self.seq:
+                    if track:
+                        old_tasks = dict(self.tasks.records)
+                    self.tasks.clear()
+                    self.due.clear()
+                    tasks = self.store.load_tasks()
+                else:
+                    tasks = self.store.load_tasks_since(self.seq)
+
+            # Deletions first: a row deleted and written again since the last refresh
+            # is only in the loaded rows if it exists now
+            for kind, id_ in tombstones:
+                id_ = int(id_)
+                if kind == "email":
+                    if track and id_ in self.emails.records:
+                        changes.append(("email", id_, self.emails.records[id_], None))
+                    self.emails.remove(id_)
+                    self.columns.remove(id_)
+                elif kind == "task":
+                    if track and id_ in self.tasks.records:
+                        changes.append(("task", id_, self.tasks.records[id_], None))
+                    self.tasks.remove(id_)
+                    self.due.remove(id_)
+
+            if self.seq is None:
+                self.columns.extend(emails)
+            for email in emails:
+                email_id = int(email["id"])
+                if track:
+                    changes.append(("email", email_id, self.emails.records.get(email_id), email))
+                self.emails.upsert(email_id, email)
+                if self.seq is not None:
+                    self.columns.upsert(email_id, email)
+            for task in tasks:
+                task_id = int(task["id"])
+                if track:
+                    changes.append(("task", task_id, old_tasks.pop(task_id, None) or self.tasks.records.get(task_id), task))
+                self.tasks.upsert(task_id, task)
+                self.due.upsert(task_id, task.get("dueDate"))
+            # a rebuild dropped these without tombstones
+            changes.extend(("task", task_id, task, None) for task_id, task in old_tasks.items())
+
+            self.seq = version
+            changes = [c for c in changes if c[2] != c[3]]
+            for listener in self.listeners:
+                try:
+                    listener(version, changes)
+                except Exception as e:
+                    log_event(
+                        log, logging.ERROR, "index_listener_failed", account=self.store.namespace,
+                        version=version, error=str(e),
+                    )
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """columns.stats(), computed once per store version."""
+        with self._lock:
+            if self._stats_seq != self.seq or self._stats is None:
+                self._stats = self.columns.stats()
+                self._stats_seq = self.seq
+            return self._stats
+
+    def query_emails(
+        self,
+        category: Optional[str] = None,
+        is_read: Optional[bool] = None,
+        org: Optional[str] = None,
+        flags: Iterable[str] = (),
+        due_from: Optional[str] = None,
+        due_to: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        filters: List[Key] = [(flag, True) for flag in flags]
+        if category is not None:
+            filters.append(("category", _norm(category)))
+        if is_read is not None:
+            filters.append(("isRead", is_read))
+        if org is not None:
+            filters.append(("org", _norm(org)))
+        with self._lock:
+            candidates = self.due.ids_between(due_from, due_to) if (due_from or due_to) else None
+            return self.emails.page(filters, after, limit, candidates)
+
+    def query_tasks(
+        self,
+        category: Optional[str] = None,
+        priority: Optional[str] = None,
+        status: Optional[str] = None,
+        due_from: Optional[str] = None,
+        due_to: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        filters: List[Key] = []
+        for field, value in (("category", category), ("priority", priority), ("status", status)):
+            if value is not None:
+                filters.append((field, _norm(value)))
+        with self._lock:
+            candidates = self.due.ids_between(due_from, due_to) if (due_from or due_to) else None
+            return self.tasks.page(filters, after, limit, candidates)
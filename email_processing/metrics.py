@@ -0,0 +1,274 @@
+# metrics.py
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+# ==========================
+# Config
+# ==========================
+
+# DEBUG adds per-request detail (e.g. the Graph ids of each listing); never message bodies
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Seconds; spans a token cache hit (sub-ms) up to a full inbox resync with NER (minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ==========================
+# Metric types (Prometheus text exposition format)
+# ==========================
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """One metric family; children are keyed by label values, in declaration order."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # per child: (count per bucket, not cumulative), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the wall time of the block, including time spent awaiting inside it."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.metrics)
+
+
+# ==========================
+# Metrics for this service
+# ==========================
+# Per process, like the other counters: each API worker serves its own /metrics, and
+# work done inside AnalysisPool processes (NER, their cache lookups) isn't counted here,
+# only the time the sync spent waiting on the pool.
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "woomail_stage_seconds",
+    "Time spent per sync pipeline stage "
+    "(token, graph_list, graph_bodies, clean_html, analyze, store_write, attachments, tasks, sync)",
+    ["stage"],
+))
+MESSAGES_PROCESSED = REGISTRY.register(Counter(
+    "woomail_messages_processed_total",
+    "Messages applied to the store by syncs, by outcome (new, changed, removed, failed)",
+    ["outcome"],
+))
+ANALYSIS_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "woomail_analysis_cache_lookups_total",
+    "Analysis cache lookups by result (hit, miss)",
+    ["result"],
+))
+GRAPH_REQUESTS = REGISTRY.register(Counter(
+    "woomail_graph_requests_total",
+    "HTTP requests sent to Microsoft Graph, by method and status code (error = transport failure)",
+    ["method", "status"],
+))
+GRAPH_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "woomail_graph_request_seconds",
+    "Latency of single Microsoft Graph HTTP requests (each retry counted separately)",
+    ["method"],
+))
+GRAPH_RETRIES = REGISTRY.register(Counter(
+    "woomail_graph_retries_total",
+    "Graph requests retried after throttling / server / transport errors (kind: request or batch item)",
+    ["kind"],
+))
+STORE_WRITE_BYTES = REGISTRY.register(Counter(
+    "woomail_store_write_bytes_total",
+    "Bytes of JSON row data sent to the SQLite store, by table (includes task rows it then skips as unchanged)",
+    ["table"],
+))
+
+ATTACHMENT_BYTES = REGISTRY.register(Counter(
+    "woomail_attachment_bytes_total",
+    "Attachment bytes downloaded from Graph, and bytes of downloads dropped as duplicates of stored files",
+    ["result"],
+))
+
+PATTERN_RELOADS = REGISTRY.register(Counter(
+    "woomail_pattern_reloads_total",
+    "Entity pattern file reloads: a new version activated, or a changed file that couldn't be loaded",
+    ["result"],
+))
+
+
+def stage(name: str):
+    """with stage("clean_html"): ... records the block's duration under woomail_stage_seconds."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# ==========================
+# Structured logging
+# ==========================
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, plus the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_logging_lock = threading.Lock()
+_root: Optional[logging.Logger] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under "woomail", writing JSON lines to stderr at LOG_LEVEL."""
+    global _root
+    with _logging_lock:
+        if _root is None:
+            _root = logging.getLogger("woomail")
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(JsonFormatter())
+            _root.addHandler(handler)
+            _root.setLevel(LOG_LEVEL)
+            _root.propagate = False
+    return _root.getChild(name)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields: Any) -> None:
+    """log_event(log, logging.INFO, "sync_done", new=3) → {"event": "sync_done", "new": 3, ...}"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
@@ -1,45 +1,204 @@
+import logging
 import os
+import threading
+import time
 import webbrowser
+from typing import Any, Dict, List, Optional, Tuple
+
 import msal
 from dotenv import load_dotenv
 
+from metrics import get_logger, log_event
+
+log = get_logger("ms_graph")
+
 MS_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
 
-def get_access_token(application_id, client_secret, scope):
-    app = msal.ConfidentialClientApplication(
-        client_id=application_id,
-        authority="https://login.microsoftonline.com/consumers",
-        client_credential=client_secret,
-    )
+DEFAULT_AUTHORITY = "https://login.microsoftonline.com/consumers"
+# Point this at a local stub authority for tests
+AUTHORITY = os.getenv("MSAL_AUTHORITY", DEFAULT_AUTHORITY)
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH", "token_cache.json")
+REFRESH_TOKEN_PATH = "refresh_token.txt"
+
+# Cached tokens are served until this close to expiry, then refreshed inline
+TOKEN_EXPIRY_SKEW_SECONDS = 60
+# Inside this window the cached token is still served, but a background refresh starts
+TOKEN_REFRESH_AHEAD_SECONDS = 600
+
+
+class ReauthRequired(Exception):
+    """No usable token without someone signing in again (never prompted for outside the CLI)."""
+
+
+class TokenProvider:
+    """
+    One MSAL app + token cache per account.
+    - Access tokens are kept in memory, so the hot path is a dict lookup
+    - The MSAL SerializableTokenCache (refresh token included) is persisted atomically
+    - Tokens close to expiry are refreshed in a background thread while the old one is served
+    - Only interactive providers (the CLI sign-in) ever prompt; the API, scheduler and
+      accounts raise ReauthRequired instead, so a sync never waits on input()
+    """
+
+    def __init__(
+        self,
+        application_id: str,
+        client_secret: str,
+        scope: List[str],
+        authority: str = AUTHORITY,
+        cache_path: str = TOKEN_CACHE_PATH,
+        refresh_token_path: str = REFRESH_TOKEN_PATH,
+        interactive: bool = False,
+        **app_kwargs: Any,
+    ):
+        self.scope = scope
+        self.cache_path = cache_path
+        self.refresh_token_path = refresh_token_path
+        # False for background services: fail instead of prompting for an authorization code
+        self.interactive = interactive
+
+        self.cache = msal.SerializableTokenCache()
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                self.cache.deserialize(f.read())
+
+        if authority != DEFAULT_AUTHORITY:
+            # A stub authority can't answer Microsoft's instance discovery
+            app_kwargs.setdefault("instance_discovery", False)
+
+        self.app = msal.ConfidentialClientApplication(
+            client_id=application_id,
+            authority=authority,
+            client_credential=client_secret,
+            token_cache=self.cache,
+            **app_kwargs,
+        )
+
+        self._lock = threading.Lock()
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refreshing = False
+
+    def get_token(self) -> str:
+        now = time.time()
+        token, expires_at = self._access_token, self._expires_at
+
+        if token and now < expires_at - TOKEN_REFRESH_AHEAD_SECONDS:
+            return token
+        if token and now < expires_at - TOKEN_EXPIRY_SKEW_SECONDS:
+            self._refresh_in_background()
+            return token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if self._access_token and time.time() < self._expires_at - TOKEN_EXPIRY_SKEW_SECONDS:
+                return self._access_token
+            return self._refresh(force=False)
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run() -> None:
+            try:
+                with self._lock:
+                    self._refresh(force=True)
+            except Exception as e:
+                # The current token is still valid; the next call retries inline
+                log_event(log, logging.WARNING, "token_refresh_failed", error=str(e), action="retry_inline")
+            finally:
+                self._refreshing = False
 
-    refresh_token = None
-    if os.path.exists("refresh_token.txt"):
-        with open("refresh_token.txt", "r") as f:
-            refresh_token = f.read().strip()
-    
-    if refresh_token:
-        result = app.acquire_token_by_refresh_token(refresh_token, scopes=scope)
-        if "access_token" in result:
-            return result["access_token"]
-    else:
-        auth_url = app.get_authorization_request_url(scope)
+        threading.Thread(target=run, name="token-refresh", daemon=True).start()
+
+    def _refresh(self, force: bool) -> str:
+        """Acquire a token and update the in-memory copy. Caller holds self._lock."""
+        result: Optional[Dict[str, Any]] = None
+
+        accounts = self.app.get_accounts()
+        if accounts:
+            # Served from the MSAL cache, or redeemed via the cached refresh token
+            result = self.app.acquire_token_silent(self.scope, account=accounts[0], force_refresh=force)
+
+        if not result or "access_token" not in result:
+            result = self._bootstrap()
+
+        if "access_token" not in result:
+            raise ReauthRequired("Could not obtain access token: " + str(result.get("error_description")))
+
+        self._access_token = result["access_token"]
+        self._expires_at = time.time() + int(result.get("expires_in", 0))
+        self._save_cache()
+        return self._access_token
+
+    def _bootstrap(self) -> Dict[str, Any]:
+        """
+        First run for this account: redeem refresh_token.txt, or fall back to the
+        interactive authorization-code flow.
+        """
+        refresh_token = None
+        if os.path.exists(self.refresh_token_path):
+            with open(self.refresh_token_path, "r") as f:
+                refresh_token = f.read().strip()
+
+        if refresh_token:
+            return self.app.acquire_token_by_refresh_token(refresh_token, scopes=self.scope)
+
+        if not self.interactive:
+            raise ReauthRequired(f"No cached token or {self.refresh_token_path}; sign in again (python ms_graph.py)")
+        auth_url = self.app.get_authorization_request_url(self.scope)
         auth_code = input("Enter Authorization Code from {}: ".format(auth_url))
         if not auth_code:
             raise ValueError("Authorization code is required.")
-        token_response = app.acquire_token_by_authorization_code(
+        token_response = self.app.acquire_token_by_authorization_code(
             code=auth_code,
-            scopes=scope,
+            scopes=self.scope,
         )
-    result = app.acquire_token_for_client(scopes=scope)
-
-    if "access_token" in token_response:
         if 'refresh_token' in token_response:
-            with open("refresh_token.txt", "w") as f:
+            with open(self.refresh_token_path, "w") as f:
                 f.write(token_response['refresh_token'])
-        return token_response["access_token"]
-    else:
-        raise Exception("Could not obtain access token: " + str(result.get("error_description")))
-    
+        return token_response
+
+    def _save_cache(self) -> None:
+        if not self.cache.has_state_changed:
+            return
+        # Write to a temp file and rename so a crash never leaves a half-written cache
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.cache.serialize())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.cache_path)
+        self.cache.has_state_changed = False
+
+
+_providers: Dict[Tuple[str, str, str, bool], TokenProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(application_id, client_secret, scope, **kwargs) -> TokenProvider:
+    """Return the process-wide TokenProvider for this app / authority / cache file / interactive."""
+    key = (
+        application_id,
+        kwargs.get("authority", AUTHORITY),
+        kwargs.get("cache_path", TOKEN_CACHE_PATH),
+        kwargs.get("interactive", False),
+    )
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = TokenProvider(application_id, client_secret, scope, **kwargs)
+            _providers[key] = provider
+    return provider
+
+
+def get_access_token(application_id, client_secret, scope, interactive=False):
+    return get_token_provider(application_id, client_secret, scope, interactive=interactive).get_token()
+
+
 def main():
     load_dotenv()
     application_id = os.getenv("APPLICATION_ID")
@@ -47,10 +206,10 @@ def main():
     scope = ["User.Read", "Mail.ReadWrite"]
 
     try:
-        access_token = get_access_token(application_id, client_secret, scope)
+        access_token = get_access_token(application_id, client_secret, scope, interactive=True)
         print("Access Token:", access_token)
     except Exception as e:
         print("Error obtaining access token:", str(e))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,225 @@
+# pattern_set.py
+
+import os
+import json
+import logging
+import pickle
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from rule_matcher import PhraseIndex
+from metrics import PATTERN_RELOADS, get_logger, log_event
+
+log = get_logger("patterns")
+
+# ==========================
+# Config
+# ==========================
+
+# Entity patterns (organisations, notice types, ...): a JSONL file, see read_pattern_file
+PATTERNS_PATH = Path(os.getenv("PATTERNS_PATH", str(Path(__file__).with_name("patterns.jsonl"))))
+# Compiled matchers, one file per pattern file content; shared by every worker process
+PATTERNS_COMPILED_DIR = Path(os.getenv("PATTERNS_COMPILED_DIR", "patterns.compiled"))
+# How often analyses check the pattern file for a new version; 0 = load once, never reload
+PATTERNS_RELOAD_SECONDS = float(os.getenv("PATTERNS_RELOAD_SECONDS", "10"))
+
+# Bump when PhraseIndex's pickled layout changes, so stale compiled files aren't loaded
+COMPILED_FORMAT = 1
+
+
+class PatternFileError(ValueError):
+    """The pattern file can't be used (bad JSON, missing version / label / pattern)."""
+
+
+# ==========================
+# Pattern sets
+# ==========================
+
+class PatternSet:
+    """
+    One version of the pattern file, compiled: index is a case-insensitive PhraseIndex
+    (the same as spaCy's LOWER attribute) over all of its patterns.
+    - digest identifies the file content; analysis fingerprints use it instead of the
+      patterns themselves, which gets expensive to hash at thousands of patterns
+    - the index is never modified: a reload builds a new set and swaps the reference
+    """
+
+    def __init__(self, version: str, digest: str, index: PhraseIndex, path: Path, stamp: Tuple[int, int]):
+        self.version = version
+        self.digest = digest
+        self.index = index
+        self.path = path
+        self.stamp = stamp  # (mtime_ns, size) of the file it was read from
+        self.loaded_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "digest": self.digest[:12],
+            "patterns": self.index.size,
+            "path": str(self.path),
+            "loadedAt": self.loaded_at,
+        }
+
+
+def _stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def read_pattern_file(data: bytes, source: str = "patterns") -> Tuple[str, List[Dict[str, str]]]:
+    """
+    Parse a pattern file: (version, [{"label", "pattern"}]).
+    - first line: {"version": "..."} (anything else on it, e.g. "description", is ignored)
+    - then one {"label": "ORG", "pattern": "CPF Board"} per line; blank lines are skipped
+    - patterns match case-insensitively, on whole words / punctuation marks
+    """
+    version: Optional[str] = None
+    patterns: List[Dict[str, str]] = []
+    for n, line in enumerate(data.decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise PatternFileError(f"{source}:{n}: {e}") from None
+        if not isinstance(entry, dict):
+            raise PatternFileError(f"{source}:{n}: expected a JSON object")
+        if version is None:
+            if "version" not in entry:
+                raise PatternFileError(f'{source}:{n}: the first line must be {{"version": ...}}')
+            version = str(entry["version"])
+            continue
+        label, pattern = entry.get("label"), entry.get("pattern")
+        if not isinstance(label, str) or not label or not isinstance(pattern, str) or not pattern.strip():
+            raise PatternFileError(f"{source}:{n}: needs a non-empty \"label\" and \"pattern\"")
+        patterns.append({"label": label, "pattern": pattern})
+    if version is None:
+        raise PatternFileError(f"{source}: empty pattern file")
+    return version, patterns
+
+
+def compile_pattern_set(path: Path = PATTERNS_PATH, compiled_dir: Path = PATTERNS_COMPILED_DIR) -> PatternSet:
+    """
+    Load the pattern file, reusing its compiled matcher from compiled_dir when one
+    exists (unpickling is much faster than building the index for thousands of
+    patterns); otherwise build it and save it there for the next process.
+    """
+    path = Path(path)
+    stamp = _stamp(path)
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    compiled = Path(compiled_dir) / f"{digest}.v{COMPILED_FORMAT}.pickle"
+
+    try:
+        with open(compiled, "rb") as f:
+            version, index = pickle.load(f)
+        return PatternSet(version, digest, index, path, stamp)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # unreadable or from another PhraseIndex: rebuild it
+        log_event(log, logging.WARNING, "patterns_compiled_unreadable", path=str(compiled), error=str(e))
+
+    version, patterns = read_pattern_file(data, source=str(path))
+    index = PhraseIndex(patterns, ignore_case=True)
+    try:
+        compiled.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename: another process never sees a half-written file
+        tmp = compiled.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((version, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, compiled)
+    except OSError as e:
+        log_event(log, logging.WARNING, "patterns_compiled_not_saved", path=str(compiled), error=str(e))
+    return PatternSet(version, digest, index, path, stamp)
+
+
+# ==========================
+# Active set + hot reload
+# ==========================
+
+_active: Optional[PatternSet] = None
+_lock = threading.Lock()
+_checked_at = 0.0
+_failed_stamp: Optional[Tuple[int, int]] = None  # a broken file is reported once, not every check
+
+
+def get_pattern_set() -> PatternSet:
+    """
+    The pattern set analyses should use right now (loaded on first use).
+    Callers take it once per batch and use that object throughout, so a reload in the
+    middle of a batch never mixes two versions in one result.
+    """
+    global _active, _checked_at
+    if _active is None:
+        with _lock:
+            if _active is None:
+                _active = compile_pattern_set()
+                _checked_at = time.monotonic()
+                log_event(log, logging.INFO, "patterns_loaded", **_active.stats())
+    return _active
+
+
+def active_pattern_set() -> Optional[PatternSet]:
+    """The current set without loading it (None before first use)."""
+    return _active
+
+
+def reload_if_changed(force: bool = False) -> bool:
+    """
+    Swap in a new pattern set if the file changed (checked at most every
+    PATTERNS_RELOAD_SECONDS unless force). The swap is one reference assignment:
+    analyses already running finish with the set they started with.
+    A broken file is logged and the current set stays active.
+    Returns whether a new set was activated.
+    """
+    global _active, _checked_at, _failed_stamp
+    current = get_pattern_set()
+    if not force and (PATTERNS_RELOAD_SECONDS <= 0 or time.monotonic() - _checked_at < PATTERNS_RELOAD_SECONDS):
+        return False
+    if not _lock.acquire(blocking=force):
+        return False  # another thread is checking right now
+    try:
+        _checked_at = time.monotonic()
+        stamp: Optional[Tuple[int, int]] = None
+        try:
+            stamp = _stamp(current.path)
+            if stamp in (current.stamp, _failed_stamp):
+                return False
+            loaded = compile_pattern_set(current.path)
+        except (OSError, PatternFileError) as e:
+            _failed_stamp = stamp
+            PATTERN_RELOADS.inc(result="failed")
+            log_event(log, logging.ERROR, "patterns_reload_failed", path=str(current.path), error=str(e))
+            return False
+        if loaded.digest == current.digest:
+            current.stamp = loaded.stamp  # touched, not changed
+            return False
+        _active = loaded
+        PATTERN_RELOADS.inc(result="loaded")
+        log_event(log, logging.INFO, "patterns_loaded", previous=current.version, **loaded.stats())
+        return True
+    finally:
+        _lock.release()
+
+
+# ==========================
+# CLI
+# ==========================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check and precompile an entity pattern file.")
+    parser.add_argument("path", nargs="?", default=str(PATTERNS_PATH))
+    args = parser.parse_args()
+    try:
+        start = time.perf_counter()
+        pattern_set = compile_pattern_set(Path(args.path))
+    except PatternFileError as e:
+        raise SystemExit(str(e))
+    print(json.dumps({**pattern_set.stats(), "seconds": round(time.perf_counter() - start, 3)}, indent=2))
@@ -0,0 +1,142 @@
+# rule_matcher.py
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Same split spaCy's English tokenizer makes for our phrases: words, and each
+# punctuation mark on its own ("e-statement" -> e, -, statement)
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# URLs and email addresses in texts: no pattern matches inside them, so "alerts@dbs.com"
+# or "www.uob.com.sg/pay" aren't DBS / UOB. Both analysis modes skip these same spans
+# (address_mask), so rules and full mode agree on what counts as an address.
+ADDRESS_RE = re.compile(
+    r"(?:https?://|www\.)\S+"
+    r"|[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
+    r"|(?:[\w-]+\.)+(?:com|net|org|gov|edu|io|sg|my|uk|au)\b(?:/\S*)?"
+    r"|(?:[\w-]+\.)+[a-z]{2,}/\S*",  # any other domain, when a path follows ("dbs.bank/pay")
+    re.IGNORECASE,
+)
+# Cheap pre-scan for ADDRESS_RE (one character class, then lookbehinds): most texts have no
+# addresses, and running ADDRESS_RE from every position would double the tokenizing cost
+ADDRESS_HINT_RE = re.compile(
+    r"[@:.](?:(?<=@)|(?<=:)//|(?<=www\.)|(?<=\.)(?:com|net|org|gov|edu|io|sg|my|uk|au)\b|(?<=\.)[a-z]{2,}/)",
+    re.IGNORECASE,
+)
+WHITESPACE_RE = re.compile(r"\s")
+
+
+def address_spans(text: str) -> List[Tuple[int, int]]:
+    """(start char, end char) of the URLs and email addresses in text, in text order."""
+    spans: List[Tuple[int, int]] = []
+    for hint in ADDRESS_HINT_RE.finditer(text):
+        at = hint.start()
+        if spans and at < spans[-1][1]:
+            continue  # inside the address just found
+        # an address never spans whitespace: look within the chunk around the hint
+        start = at
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        space = WHITESPACE_RE.search(text, at)
+        end = space.start() if space else len(text)
+        for m in ADDRESS_RE.finditer(text, start, end):
+            if m.start() <= at < m.end():
+                spans.append(m.span())
+                break
+    return spans
+
+
+def address_mask(text: str, spans: Sequence[Tuple[int, int]]) -> Optional[List[bool]]:
+    """
+    For (start char, end char) token spans of text, in text order: whether each overlaps
+    a URL or email address (address_spans). None if text has no addresses at all.
+    """
+    addresses = address_spans(text)
+    if not addresses:
+        return None
+    mask = [False] * len(spans)
+    a = 0
+    for i, (start, end) in enumerate(spans):
+        while a < len(addresses) and addresses[a][1] <= start:
+            a += 1
+        if a == len(addresses):
+            break
+        mask[i] = addresses[a][0] < end
+    return mask
+
+
+class PhraseIndex:
+    """
+    Precompiled multi-pattern phrase matcher, a spaCy-free stand-in for the EntityRuler.
+    - Patterns are token sequences, indexed by their first token, so matching costs
+      one dict lookup per text token regardless of how many patterns are loaded
+    - Case-insensitive by default (compares lowercased tokens)
+    - Overlaps are resolved like spaCy's filter_spans: longest span wins, then earliest
+    - Never matches inside URLs or email addresses (address_spans), nor across them
+    """
+
+    def __init__(self, patterns: List[Dict[str, str]], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self.size = 0
+        # first token -> [(token tuple, label)], longest first
+        self._index: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+
+        seen = set()
+        for p in patterns:
+            tokens = tuple(self._norm(t) for t in TOKEN_RE.findall(p["pattern"]))
+            if not tokens or tokens in seen:
+                continue
+            seen.add(tokens)
+            self._index.setdefault(tokens[0], []).append((tokens, p["label"]))
+            self.size += 1
+
+        for candidates in self._index.values():
+            candidates.sort(key=lambda c: len(c[0]), reverse=True)
+
+    def _norm(self, token: str) -> str:
+        return token.lower() if self.ignore_case else token
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Return non-overlapping (start char, end char, label) matches in text order."""
+        spans = [(m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+        tokens: List[Optional[str]] = [self._norm(text[s:e]) for s, e in spans]
+        mask = address_mask(text, spans)
+        if mask is not None:
+            # None is in no pattern: address tokens match nothing, and break phrases around them
+            tokens = [None if masked else token for token, masked in zip(tokens, mask)]
+        return [(spans[start][0], spans[start + n - 1][1], label) for start, n, label in self._match(tokens)]
+
+    def match_tokens(self, tokens: Sequence[Optional[str]]) -> List[Tuple[int, int, str]]:
+        """
+        Non-overlapping (start token, end token, label) matches over text already split
+        into tokens (e.g. a spaCy Doc's), in order; None tokens match nothing.
+        """
+        normed = [self._norm(t) if t is not None else None for t in tokens]
+        return [(start, start + n, label) for start, n, label in self._match(normed)]
+
+    def _match(self, tokens: List[Optional[str]]) -> List[Tuple[int, int, str]]:
+        """(start token, length, label) of the matches kept, in order, over normalized tokens."""
+        # every (start token, length, label) that matches
+        matches: List[Tuple[int, int, str]] = []
+        for i, token in enumerate(tokens):
+            candidates = self._index.get(token) if token is not None else None
+            if not candidates:
+                continue
+            for phrase, label in candidates:
+                n = len(phrase)
+                if n == 1 or tuple(tokens[i:i + n]) == phrase:
+                    matches.append((i, n, label))
+
+        # filter_spans: longest first, then earliest; drop anything overlapping a kept span
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        taken = [False] * len(tokens)
+        kept: List[Tuple[int, int, str]] = []
+        for start, n, label in matches:
+            if any(taken[start:start + n]):
+                continue
+            for j in range(start, start + n):
+                taken[j] = True
+            kept.append((start, n, label))
+
+        kept.sort()
+        return kept
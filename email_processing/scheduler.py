@@ -0,0 +1,132 @@
+# scheduler.py
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from coordinator import SyncCoordinator, SYNC_LOCK_PATH
+from metrics import get_logger, log_event
+from store import current_account
+
+log = get_logger("scheduler")
+
+# ==========================
+# Config
+# ==========================
+
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "300"))
+# Random extra delay per cycle so many workers don't hit Graph in lockstep
+SYNC_JITTER_SECONDS = float(os.getenv("SYNC_JITTER_SECONDS", "30"))
+
+
+class SyncScheduler:
+    """
+    Runs sync_fn in the background every interval (+ jitter), and on demand.
+    - Runs go through a SyncCoordinator: concurrent callers share one in-flight run,
+      and only one worker process syncs at a time
+    - trigger() during a run schedules another right after it
+    - status() reports what the last run did and how old the data is
+    """
+
+    def __init__(
+        self,
+        sync_fn: Callable[[], Awaitable[Any]],
+        interval: float = SYNC_INTERVAL_SECONDS,
+        jitter: float = SYNC_JITTER_SECONDS,
+        lock_path: str = SYNC_LOCK_PATH,
+    ):
+        self.sync_fn = sync_fn
+        self.interval = interval
+        self.jitter = jitter
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.coordinator = SyncCoordinator(self._run_tracked, lock_path)
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_duration_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_result: Any = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="sync-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def trigger(self) -> None:
+        """Ask the background loop to sync now instead of waiting for the next tick."""
+        self._wakeup.set()
+
+    async def run_once(self) -> Any:
+        """Sync now, or join the sync already in flight, and return its result."""
+        return await self.coordinator.run()
+
+    async def _run_tracked(self) -> Any:
+        self.running = True
+        self.last_started_at = time.time()
+        try:
+            result = await self.sync_fn()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        else:
+            self.last_success_at = time.time()
+            self.last_error = None
+            self.last_result = result
+            return result
+        finally:
+            self.runs += 1
+            self.running = False
+            self.last_duration_seconds = round(time.time() - self.last_started_at, 3)
+
+    async def _loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Keep the loop alive; the error is reported through status()
+                log_event(log, logging.ERROR, "background_sync_failed", account=current_account(), error=str(e))
+
+            delay = self.interval + random.uniform(0, self.jitter)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def last_sync_age_seconds(self) -> Optional[float]:
+        if self.last_success_at is None:
+            return None
+        return round(time.time() - self.last_success_at, 3)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": "running" if self.running else "idle",
+            "runs": self.runs,
+            "coalesced_requests": self.coordinator.coalesced,
+            "failures": self.failures,
+            "last_success_at": self.last_success_at,
+            "last_sync_age_seconds": self.last_sync_age_seconds(),
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_error": self.last_error,
+            "last_result": self.last_result,
+            "interval_seconds": self.interval,
+            "jitter_seconds": self.jitter,
+        }
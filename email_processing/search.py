@@ -0,0 +1,133 @@
+# search.py
+
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from indexes import project
+from store import EmailStore, SEARCH_COLUMNS
+
+# ==========================
+# Config
+# ==========================
+
+# Only the newest N matches of a query are ranked (bm25 costs a little per match; a term
+# in half of a 1M-message mailbox would otherwise be ranked 500k times). 0 = rank all
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "2000"))
+# bm25 weight per column (subject, body, entities, org, labels): a hit in the subject or
+# an extracted entity says more than one somewhere in the body
+SEARCH_WEIGHTS = {"subject": 8.0, "body": 1.0, "entities": 4.0, "org": 4.0, "labels": 0.0}
+# Shorter prefixes would expand to most of the vocabulary
+MIN_PREFIX_CHARS = 2
+MAX_QUERY_TERMS = 16
+
+# field:value filters, by the column they look in
+FILTERS = {"label": "labels", "org": "org", "subject": "subject"}
+
+TERM_RE = re.compile(r'(-?)(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+
+
+class SearchQueryError(ValueError):
+    """The query has nothing searchable in it (e.g. only punctuation)."""
+
+
+# ==========================
+# Query parsing
+# ==========================
+
+def _phrase(text: str, prefix: bool = False) -> Optional[str]:
+    """text as an FTS5 string (quoted, so its punctuation is never query syntax)."""
+    if not re.search(r"\w", text):
+        return None
+    quoted = '"' + text.replace('"', '""') + '"'
+    return quoted + "*" if prefix else quoted
+
+
+def parse_query(q: str, prefix_last: bool = True) -> Tuple[str, bool]:
+    """
+    Turn a search box query into an FTS5 MATCH expression.
+    Returns (expression, whether it has free-text terms to rank by).
+    - words match anywhere (subject, body, entities, org); all must match
+    - "quoted words" match as a phrase; word* matches as a prefix, and so does the
+      last word when prefix_last (search as you type)
+    - label:BILLING / org:UOB / subject:renewal look in that field only;
+      org:"CPF Board" for several words
+    - -word / -label:ACTION_LINK exclude matches
+    """
+    include: List[str] = []
+    exclude: List[str] = []
+    has_text = False
+    matches = list(TERM_RE.finditer(q or ""))[:MAX_QUERY_TERMS]
+    for n, match in enumerate(matches):
+        negated, field, quoted, bare = match.groups()
+        column = FILTERS.get(field.lower()) if field else None
+        if field and column is None:
+            # not one of ours ("re:", "10:30"); search for the whole thing
+            bare = f"{field}:{bare}" if bare is not None else None
+            quoted = f"{field} {quoted}" if quoted is not None else None
+
+        text = quoted if quoted is not None else bare
+        prefix = False
+        if quoted is None:
+            if text.endswith("*"):
+                text, prefix = text.rstrip("*"), True
+            elif prefix_last and column is None and not negated and n == len(matches) - 1:
+                prefix = True
+            prefix = prefix and len(text) >= MIN_PREFIX_CHARS
+        phrase = _phrase(text, prefix)
+        if phrase is None:
+            continue
+
+        term = f"{column} : {phrase}" if column else phrase
+        if negated:
+            exclude.append(term)
+        else:
+            include.append(term)
+            has_text = has_text or column not in ("labels", "org")
+
+    if not include:
+        raise SearchQueryError("Nothing to search for")
+    expression = " AND ".join(include)
+    for term in exclude:
+        expression += f" NOT {term}"
+    return expression, has_text
+
+
+# ==========================
+# Search
+# ==========================
+
+def search_emails(
+    store: EmailStore,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Ranked search over the store's full-text index (EmailStore.search).
+    Free-text queries are ranked by bm25 (among the newest SEARCH_RANK_WINDOW matches);
+    filter-only queries (label:BILLING org:UOB) come back newest first.
+    Each item is the email (trimmed to fields) plus its "score" and a body "snippet".
+    """
+    start = time.perf_counter()
+    expression, has_text = parse_query(q)
+    hits = store.search(
+        expression,
+        limit=limit,
+        offset=offset,
+        weights=[SEARCH_WEIGHTS[c] for c in SEARCH_COLUMNS],
+        rank_window=SEARCH_RANK_WINDOW,
+        newest_first=not has_text,
+    )
+    items = [
+        {**project(email, fields), "score": round(-score, 4), "snippet": snippet}
+        for email, score, snippet in hits
+    ]
+    return {
+        "items": items,
+        "nextCursor": str(offset + limit) if len(hits) == limit else None,
+        "query": expression,
+        "tookMs": round((time.perf_counter() - start) * 1000, 2),
+    }
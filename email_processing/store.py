@@ -0,0 +1,830 @@
+# store.py
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Sequence, Tuple
+
+from metrics import STORE_WRITE_BYTES, get_logger, log_event, stage
+
+log = get_logger("store")
+
+# ==========================
+# Config
+# ==========================
+
+DB_PATH = Path(os.getenv("EMAIL_DB_PATH", "emails.db"))
+# Cleaned body text kept in the search index per email (the rest isn't searchable)
+SEARCH_BODY_MAX_CHARS = int(os.getenv("SEARCH_BODY_MAX_CHARS", "20000"))
+
+# Legacy JSON files, imported once into a fresh database
+EMAILS_JSON_PATH = Path("emails.json")
+TASKS_JSON_PATH = Path("tasks.json")
+ATTACHMENTS_JSON_PATH = Path("attachments.json")
+DELTA_LINK_TXT_PATH = Path("delta_link.txt")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    id          INTEGER PRIMARY KEY,
+    graph_id    TEXT UNIQUE,
+    received_at TEXT,
+    category    TEXT,
+    is_read     INTEGER NOT NULL DEFAULT 0,
+    seq         INTEGER NOT NULL,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_emails_received_at ON emails(received_at);
+CREATE INDEX IF NOT EXISTS idx_emails_category ON emails(category);
+CREATE INDEX IF NOT EXISTS idx_emails_seq ON emails(seq);
+-- Emails with attachments whose files haven't been fetched yet (attachments.py)
+CREATE INDEX IF NOT EXISTS idx_emails_attachments_pending ON emails(id)
+    WHERE json_extract(data, '$.analysis.hasAttachments') = 1 AND json_extract(data, '$.attachments') IS NULL;
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id       TEXT PRIMARY KEY,
+    email_id TEXT,
+    seq      INTEGER NOT NULL DEFAULT 0,
+    data     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_email_id ON tasks(email_id);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    id       TEXT PRIMARY KEY,
+    email_id TEXT,
+    seq      INTEGER NOT NULL DEFAULT 0,
+    data     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_email_id ON attachments(email_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- What was deleted, and at which version, so readers can follow deletions incrementally
+CREATE TABLE IF NOT EXISTS tombstones (
+    kind TEXT NOT NULL,   -- 'email' | 'task' | 'attachment'
+    id   TEXT NOT NULL,
+    seq  INTEGER NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS idx_tombstones_seq ON tombstones(seq);
+
+-- Attachment downloads / listings that failed: retried with backoff until given up (attachments.py).
+-- Not email data, so writing these never moves the store version
+CREATE TABLE IF NOT EXISTS attachment_failures (
+    graph_id      TEXT NOT NULL,
+    attachment_id TEXT NOT NULL,  -- '' for the message's attachment listing
+    failures      INTEGER NOT NULL,
+    retry_at      REAL NOT NULL,
+    error         TEXT,
+    PRIMARY KEY (graph_id, attachment_id)
+);
+"""
+
+# Full-text search (search.py): one FTS5 table per SEARCH_SHARD_SIZE email ids,
+# email_search_<id // SEARCH_SHARD_SIZE>, rowid = emails.id. body is the cleaned text the
+# email was analyzed from, which isn't kept anywhere else. '_' is part of a token so
+# label:EMAIL_TYPE matches that label only; the prefix indexes make 2-3 character
+# prefix queries cheap
+SEARCH_SHARD_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+    subject, body, entities, org, labels,
+    tokenize = "unicode61 remove_diacritics 2 tokenchars '_'",
+    prefix = '2 3'
+)
+"""
+SEARCH_COLUMNS = ("subject", "body", "entities", "org", "labels")
+# A query's cost (prefix expansion, reading doclists, ranking) grows with the size of the
+# shards it touches, not with the mailbox; changing this needs a fresh search index
+SEARCH_SHARD_SIZE = 50_000
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = [
+    ("tasks", "seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("attachments", "seq", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+POST_MIGRATION_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_tasks_seq ON tasks(seq);
+CREATE INDEX IF NOT EXISTS idx_attachments_seq ON attachments(seq);
+"""
+
+
+def _dumps(obj: Any, table: str) -> str:
+    """JSON for a row's data column; counted in woomail_store_write_bytes_total."""
+    data = json.dumps(obj, ensure_ascii=False)
+    STORE_WRITE_BYTES.inc(len(data) if data.isascii() else len(data.encode("utf-8")), table=table)
+    return data
+
+
+def _email_row(record: Dict[str, Any], seq: int) -> tuple:
+    analysis = record.get("analysis") or {}
+    return (
+        record["id"],
+        record.get("graph_id") or None,  # legacy records have graph_id "", keep UNIQUE happy
+        record.get("receivedAt"),
+        analysis.get("category"),
+        1 if analysis.get("isRead") else 0,
+        seq,
+        _dumps(record, "emails"),
+    )
+
+
+def _search_table(email_id: int) -> str:
+    return f"email_search_{int(email_id) // SEARCH_SHARD_SIZE}"
+
+
+def _search_row(record: Dict[str, Any], body: Optional[str] = None) -> tuple:
+    """(id, subject, body, entities, org, labels) for the search index; body falls back to the preview."""
+    analysis = record.get("analysis") or {}
+    entities = analysis.get("raw_entities") or []
+    orgs = dict.fromkeys([analysis.get("org"), *(e.get("text") for e in entities if e.get("label") == "ORG")])
+    return (
+        record["id"],
+        record.get("subject") or "",
+        (body if body is not None else analysis.get("preview") or "")[:SEARCH_BODY_MAX_CHARS],
+        " ".join([
+            *(e.get("text") or "" for e in entities),
+            *(analysis.get("refs") or []),
+            *(analysis.get("amounts") or []),
+        ]),
+        " ".join(org for org in orgs if org),
+        " ".join(dict.fromkeys(e.get("label") or "" for e in entities)),
+    )
+
+
+def _chunks(items: List[Any], size: int = 500) -> Iterable[List[Any]]:
+    # stay well under SQLite's bound-parameter limit
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _read_json_list(path: Path) -> List[Dict[str, Any]]:
+    """
+    Read a legacy JSON list file. Files left behind by interrupted rewrites can hold
+    several arrays back to back (e.g. "[][...]"); those are concatenated.
+    """
+    if not path.exists():
+        return []
+    text = path.read_text(encoding="utf-8")
+    decoder = json.JSONDecoder()
+    rows: List[Dict[str, Any]] = []
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            return rows
+        chunk, pos = decoder.raw_decode(text, pos)
+        rows.extend(chunk if isinstance(chunk, list) else [chunk])
+
+
+class EmailStore:
+    """
+    SQLite (WAL) store for processed emails, tasks and attachments.
+    - emails are indexed on graph_id, receivedAt and category
+    - every write that changes rows bumps a store-wide version; each email / task /
+      attachment row remembers the version (seq) it was last written at, and deletions
+      leave a tombstone with theirs, so later stages can pick up only what changed
+    - all writes are single transactions, so a crash never leaves a half-written store
+    - namespace: the account this store belongs to (accounts.py); None for the single-mailbox store
+    - an FTS5 index over subject, body and extracted entities is written in the same
+      transactions as the emails (search with search.py)
+    """
+
+    def __init__(self, path: Path = DB_PATH, namespace: Optional[str] = None):
+        self.path = Path(path)
+        self.namespace = namespace
+        self._lock = threading.RLock()
+        self._meta_changes = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self._conn.executescript(POST_MIGRATION_SCHEMA)
+        if self.get_meta("search_indexed") is None:
+            self._backfill_search()
+
+    def _backfill_search(self) -> None:
+        """
+        Index emails stored before the search index existed. Their bodies weren't kept,
+        so the preview stands in for the body.
+        """
+        # own transaction: derived data only, so the store version doesn't move
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for table in self._search_tables():
+                    cur.execute(f"DROP TABLE {table}")
+                rows = [_search_row(json.loads(data)) for (data,) in cur.execute("SELECT data FROM emails")]
+                for table, shard_rows in self._by_search_table(cur, rows).items():
+                    cur.executemany(
+                        f"INSERT INTO {table}(rowid, subject, body, entities, org, labels) VALUES (?, ?, ?, ?, ?, ?)",
+                        shard_rows,
+                    )
+                self._set(cur, "search_indexed", "1")
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        if rows:
+            log_event(
+                log, logging.INFO, "search_index_backfilled", account=self.namespace,
+                emails=len(rows), path=str(self.path),
+            )
+
+    def _search_tables(self) -> List[str]:
+        """Search shard tables, newest ids first."""
+        names = [
+            name for (name,) in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'email_search_[0-9]*'"
+            )
+            if name[len("email_search_"):].isdigit()  # not the FTS5 shadow tables (_data, _idx, ...)
+        ]
+        return sorted(names, key=lambda name: int(name[len("email_search_"):]), reverse=True)
+
+    @staticmethod
+    def _by_search_table(cur: sqlite3.Cursor, rows: List[tuple], create: bool = True) -> Dict[str, List[tuple]]:
+        """Group rows (email id first) by their search shard, creating missing shard tables."""
+        tables: Dict[str, List[tuple]] = {}
+        for row in rows:
+            tables.setdefault(_search_table(row[0]), []).append(row)
+        if create:
+            for table in tables:
+                cur.execute(SEARCH_SHARD_SQL.format(table=table))
+        return tables
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --------------------------
+    # Transactions / meta
+    # --------------------------
+
+    def _write(self, fn, *args):
+        """
+        Run fn(cursor, seq, *args) inside one IMMEDIATE transaction. The version only moves
+        to seq if fn inserted, updated or deleted rows other than meta, so a write that
+        changes nothing (an id allocation, a batch of duplicates) keeps readers' ETags valid.
+        """
+        with self._lock, stage("store_write"):
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._get_int(cur, "version") + 1
+                before, self._meta_changes = self._conn.total_changes, 0
+                result = fn(cur, seq, *args)
+                if self._conn.total_changes - before > self._meta_changes:
+                    self._set(cur, "version", str(seq))
+                cur.execute("COMMIT")
+                return result
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _get_int(cur: sqlite3.Cursor, key: str) -> int:
+        row = cur.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row and row[0] is not None else 0
+
+    def _set(self, cur: sqlite3.Cursor, key: str, value: Optional[str]) -> None:
+        cur.execute(
+            "INSERT INTO meta(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+        self._meta_changes += 1  # not a data change: see _write
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Optional[str]) -> None:
+        with self._lock:
+            self._set(self._conn.cursor(), key, value)
+
+    @property
+    def version(self) -> int:
+        return int(self.get_meta("version") or 0)
+
+    # --------------------------
+    # Emails
+    # --------------------------
+
+    def load_emails(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM emails ORDER BY id").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def load_emails_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Emails written after store version seq (uses the seq index, not a full scan)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM emails WHERE seq > ? ORDER BY id", (seq,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def count_emails(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+    def get_by_graph_ids(self, graph_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Index lookups for just the given Graph ids (no full-table scan)."""
+        ids = [g for g in set(graph_ids) if g]
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for chunk in _chunks(ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT graph_id, data FROM emails WHERE graph_id IN ({placeholders})", chunk
+                ).fetchall()
+                for graph_id, data in rows:
+                    found[graph_id] = json.loads(data)
+        return found
+
+    def load_emails_pending_attachments(self, limit: int, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Newest emails that have attachments but no fetched "attachments" list yet
+        (a partial index keeps this from scanning the whole table).
+        now: skip emails with a failed download still backing off until after now
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM emails "
+                "WHERE json_extract(data, '$.analysis.hasAttachments') = 1 "
+                "AND json_extract(data, '$.attachments') IS NULL AND graph_id IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM attachment_failures f WHERE f.graph_id = emails.graph_id AND f.retry_at > ?) "
+                "ORDER BY id DESC LIMIT ?",
+                (now if now is not None else float("-inf"), limit),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def load_attachment_failures(self, graph_ids: Iterable[str]) -> Dict[Tuple[str, str], int]:
+        """{(graph id, attachment id): failures so far} for these messages."""
+        ids = [g for g in set(graph_ids) if g]
+        found: Dict[Tuple[str, str], int] = {}
+        with self._lock:
+            for chunk in _chunks(ids):
+                rows = self._conn.execute(
+                    "SELECT graph_id, attachment_id, failures FROM attachment_failures "
+                    f"WHERE graph_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                found.update(((graph_id, attachment_id), failures) for graph_id, attachment_id, failures in rows)
+        return found
+
+    def record_attachment_failure(
+        self, graph_id: str, attachment_id: str, failures: int, retry_at: float, error: str
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO attachment_failures(graph_id, attachment_id, failures, retry_at, error) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (graph_id, attachment_id, failures, retry_at, error),
+            )
+
+    def clear_attachment_failures(self, graph_ids: Iterable[str]) -> None:
+        """Forget the failures of messages whose attachments are settled (fetched or given up)."""
+        ids = [g for g in set(graph_ids) if g]
+        with self._lock:
+            for chunk in _chunks(ids):
+                self._conn.execute(
+                    f"DELETE FROM attachment_failures WHERE graph_id IN ({','.join('?' * len(chunk))})", chunk
+                )
+
+    def search(
+        self,
+        match: str,
+        limit: int,
+        offset: int = 0,
+        weights: Sequence[float] = (1.0,) * len(SEARCH_COLUMNS),
+        rank_window: int = 0,
+        newest_first: bool = False,
+    ) -> List[Tuple[Dict[str, Any], float, str]]:
+        """
+        Emails matching an FTS5 MATCH expression (search.py builds it): [(email, bm25, snippet)],
+        best first (lowest bm25), or newest first. Shards are searched newest first.
+        - weights: bm25 weight per column of SEARCH_COLUMNS; scores use each shard's own
+          term statistics, which are close enough to compare at this shard size
+        - rank_window: only rank the newest N matches (0 = all); bm25 has to be computed for
+          every ranked match, so this bounds the cost of very common terms
+        - newest_first: no ranking, stop as soon as enough matches are found
+        - the snippet is the best body fragment, matches in [brackets]
+        """
+        wanted = offset + limit
+        weight_args = ", ".join(str(float(w)) for w in weights)
+        hits: List[Tuple[int, float, str]] = []
+        with self._lock:
+            remaining = rank_window
+            for table in self._search_tables():
+                columns = f"rowid, bm25({table}, {weight_args}) AS score, snippet({table}, 1, '[', ']', '…', 12)"
+                if newest_first:
+                    hits.extend(self._conn.execute(
+                        f"SELECT {columns} FROM {table} WHERE {table} MATCH ? ORDER BY rowid DESC LIMIT ?",
+                        (match, wanted - len(hits)),
+                    ))
+                    if len(hits) >= wanted:
+                        break
+                    continue
+
+                floor = None
+                if rank_window:
+                    row = self._conn.execute(
+                        f"SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                        (match, remaining - 1),
+                    ).fetchone()
+                    floor = row[0] if row else None
+                hits.extend(self._conn.execute(
+                    f"SELECT {columns} FROM {table} WHERE {table} MATCH ? AND rowid >= ? ORDER BY score LIMIT ?",
+                    (match, floor or 0, wanted),
+                ))
+                if rank_window:
+                    if floor is not None:
+                        break  # the window ends in this shard
+                    remaining -= self._conn.execute(
+                        f"SELECT count(*) FROM {table} WHERE {table} MATCH ?", (match,)
+                    ).fetchone()[0]
+
+            if not newest_first:
+                hits.sort(key=lambda hit: hit[1])
+            hits = hits[offset:wanted]
+            if not hits:
+                return []
+            ids = [hit[0] for hit in hits]
+            records = {
+                id_: json.loads(data)
+                for id_, data in self._conn.execute(
+                    f"SELECT id, data FROM emails WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+            }
+        return [(records[id_], score, snippet) for id_, score, snippet in hits if id_ in records]
+
+    def allocate_email_ids(self, count: int) -> int:
+        """
+        Reserve count consecutive ids and return the first one.
+        The counter is persisted and only moves forward, so ids are never reused,
+        even after the highest-numbered emails are deleted.
+        """
+        def run(cur, seq):
+            row = cur.execute("SELECT MAX(id) FROM emails").fetchone()
+            start = max(self._get_int(cur, "next_email_id"), (row[0] if row[0] is not None else -1) + 1)
+            self._set(cur, "next_email_id", str(start + count))
+            return start
+
+        return self._write(run)
+
+    def insert_emails(self, records: List[Dict[str, Any]], bodies: Optional[Sequence[str]] = None) -> int:
+        """
+        Atomically insert new records (ids already assigned), and index them for search.
+        bodies: the cleaned text of each record, for the search index (default: its preview)
+        Records whose graph_id is already stored are skipped; returns how many were inserted.
+        """
+        if not records:
+            return 0
+
+        def run(cur, seq):
+            before = self._conn.total_changes
+            cur.executemany(
+                "INSERT INTO emails(id, graph_id, received_at, category, is_read, seq, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(graph_id) DO NOTHING",
+                [_email_row(r, seq) for r in records],
+            )
+            inserted = self._conn.total_changes - before
+            if not inserted:
+                return 0
+            # skipped records kept their freshly allocated id, which no email row has
+            written = {id_ for (id_,) in cur.execute("SELECT id FROM emails WHERE seq = ?", (seq,))}
+            rows = [
+                _search_row(r, bodies[i] if bodies is not None else None)
+                for i, r in enumerate(records)
+                if int(r["id"]) in written
+            ]
+            for table, shard_rows in self._by_search_table(cur, rows).items():
+                cur.executemany(
+                    f"INSERT INTO {table}(rowid, subject, body, entities, org, labels) VALUES (?, ?, ?, ?, ?, ?)",
+                    shard_rows,
+                )
+            return inserted
+
+        return self._write(run)
+
+    def upsert_emails(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Insert or replace records by id (used for changed records and bulk imports).
+        Search rows keep their indexed body; the other columns are only rewritten if they changed.
+        """
+        if not records:
+            return
+
+        def run(cur, seq):
+            cur.executemany(
+                "INSERT OR REPLACE INTO emails(id, graph_id, received_at, category, is_read, seq, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [_email_row(r, seq) for r in records],
+            )
+            for table, rows in self._by_search_table(cur, [_search_row(r) for r in records]).items():
+                cur.executemany(
+                    f"UPDATE {table} SET subject = ?1, entities = ?2, org = ?3, labels = ?4 WHERE rowid = ?5 "
+                    "AND (subject != ?1 OR entities != ?2 OR org != ?3 OR labels != ?4)",
+                    [(subject, entities, org, labels, id_) for id_, subject, _, entities, org, labels in rows],
+                )
+                cur.executemany(
+                    f"INSERT INTO {table}(rowid, subject, body, entities, org, labels) "
+                    f"SELECT ?1, ?2, ?3, ?4, ?5, ?6 WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE rowid = ?1)",
+                    rows,
+                )
+
+        self._write(run)
+
+    def delete_by_graph_ids(self, graph_ids: Iterable[str]) -> int:
+        ids = [g for g in set(graph_ids) if g]
+        if not ids:
+            return 0
+
+        def run(cur, seq):
+            deleted = 0
+            for chunk in _chunks(ids):
+                placeholders = ",".join("?" * len(chunk))
+                email_ids = [
+                    str(r[0])
+                    for r in cur.execute(f"SELECT id FROM emails WHERE graph_id IN ({placeholders})", chunk)
+                ]
+                if not email_ids:
+                    continue
+                email_placeholders = ",".join("?" * len(email_ids))
+                self._tombstone(cur, "email", email_ids, seq)
+                cur.execute(f"DELETE FROM attachment_failures WHERE graph_id IN ({placeholders})", chunk)
+                cur.execute(f"DELETE FROM emails WHERE graph_id IN ({placeholders})", chunk)
+                deleted += cur.rowcount
+                existing = set(self._search_tables())
+                for table, rows in self._by_search_table(cur, [(int(i),) for i in email_ids], create=False).items():
+                    if table in existing:
+                        cur.executemany(f"DELETE FROM {table} WHERE rowid = ?", rows)
+                # tasks / attachments derived from these emails go with them
+                for kind, table in (("task", "tasks"), ("attachment", "attachments")):
+                    row_ids = [
+                        r[0]
+                        for r in cur.execute(
+                            f"SELECT id FROM {table} WHERE email_id IN ({email_placeholders})", email_ids
+                        )
+                    ]
+                    self._tombstone(cur, kind, row_ids, seq)
+                    cur.execute(f"DELETE FROM {table} WHERE email_id IN ({email_placeholders})", email_ids)
+            return deleted
+
+        return self._write(run)
+
+    @staticmethod
+    def _tombstone(cur: sqlite3.Cursor, kind: str, ids: List[Any], seq: int) -> None:
+        cur.executemany(
+            "INSERT INTO tombstones(kind, id, seq) VALUES (?, ?, ?) "
+            "ON CONFLICT(kind, id) DO UPDATE SET seq = excluded.seq",
+            [(kind, str(i), seq) for i in ids],
+        )
+
+    def load_tombstones_since(self, seq: int) -> List[tuple]:
+        """(kind, id) of emails / tasks / attachments deleted after store version seq."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kind, id FROM tombstones WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+
+    # --------------------------
+    # Tasks / attachments
+    # --------------------------
+
+    def load_tasks(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM tasks ORDER BY rowid").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def load_tasks_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Tasks written after store version seq."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM tasks WHERE seq > ?", (seq,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def load_attachments(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM attachments ORDER BY rowid").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_attachment(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def replace_tasks_and_attachments(
+        self,
+        tasks: List[Dict[str, Any]],
+        attachments: List[Dict[str, Any]],
+        watermark: Optional[int] = None,
+    ) -> None:
+        """
+        Replace every task and attachment.
+        watermark: store version the rows were derived at (see upsert_tasks_and_attachments)
+        """
+        def run(cur, seq):
+            before = self._conn.total_changes
+            cur.execute("DELETE FROM tasks")
+            cur.executemany(
+                "INSERT OR REPLACE INTO tasks(id, email_id, seq, data) VALUES (?, ?, ?, ?)",
+                [(t["id"], t.get("emailId"), seq, _dumps(t, "tasks")) for t in tasks],
+            )
+            cur.execute("DELETE FROM attachments")
+            cur.executemany(
+                "INSERT OR REPLACE INTO attachments(id, email_id, seq, data) VALUES (?, ?, ?, ?)",
+                [(a["id"], a.get("emailId"), seq, _dumps(a, "attachments")) for a in attachments],
+            )
+            # readers following tasks incrementally must start over (if there was anything to replace)
+            if self._conn.total_changes > before:
+                self._set(cur, "tasks_rebuilt_at", str(seq))
+            if watermark is not None:
+                self._set(cur, "tasks_watermark", str(watermark))
+
+        self._write(run)
+
+    @staticmethod
+    def _replace_derived(
+        cur: sqlite3.Cursor,
+        table: str,
+        kind: str,
+        email_ids: List[str],
+        rows: List[Dict[str, Any]],
+        seq: int,
+    ) -> int:
+        """
+        Make table hold exactly rows for email_ids. Rows whose data is unchanged are not
+        rewritten. Returns how many rows were inserted, updated or deleted.
+        """
+        keep = {r["id"] for r in rows}
+        stale: List[str] = []
+        for chunk in _chunks(email_ids):
+            placeholders = ",".join("?" * len(chunk))
+            stale.extend(
+                row_id
+                for (row_id,) in cur.execute(f"SELECT id FROM {table} WHERE email_id IN ({placeholders})", chunk)
+                if row_id not in keep
+            )
+
+        before = cur.connection.total_changes
+        cur.executemany(f"DELETE FROM {table} WHERE id = ?", [(row_id,) for row_id in stale])
+        changed = cur.connection.total_changes - before
+        EmailStore._tombstone(cur, kind, stale, seq)
+
+        before = cur.connection.total_changes
+        cur.executemany(
+            f"INSERT INTO {table}(id, email_id, seq, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET email_id = excluded.email_id, seq = excluded.seq, data = excluded.data "
+            f"WHERE {table}.data != excluded.data OR {table}.email_id IS NOT excluded.email_id",
+            [(r["id"], r.get("emailId"), seq, _dumps(r, table)) for r in rows],
+        )
+        return changed + cur.connection.total_changes - before
+
+    def get_tasks_watermark(self) -> Optional[int]:
+        value = self.get_meta("tasks_watermark")
+        return int(value) if value is not None else None
+
+    def upsert_tasks_and_attachments(
+        self,
+        email_ids: Iterable[str],
+        tasks: List[Dict[str, Any]],
+        attachments: List[Dict[str, Any]],
+        watermark: int,
+    ) -> Dict[str, int]:
+        """
+        Incremental counterpart of replace_tasks_and_attachments: tasks / attachments
+        for just email_ids are replaced (stale ones removed, unchanged ones left as-is),
+        and tasks_watermark moves to the store version they were derived at, all in one
+        transaction. Returns how many task / attachment rows actually changed.
+        """
+        ids = sorted(set(email_ids))
+
+        def run(cur, seq):
+            changed = {
+                "tasks": self._replace_derived(cur, "tasks", "task", ids, tasks, seq),
+                "attachments": self._replace_derived(cur, "attachments", "attachment", ids, attachments, seq),
+            }
+            self._set(cur, "tasks_watermark", str(watermark))
+            return changed
+
+        return self._write(run)
+
+    # --------------------------
+    # Import / export of the legacy JSON files
+    # --------------------------
+
+    def import_json_files(
+        self,
+        emails_path: Path = EMAILS_JSON_PATH,
+        tasks_path: Path = TASKS_JSON_PATH,
+        attachments_path: Path = ATTACHMENTS_JSON_PATH,
+        delta_link_path: Path = DELTA_LINK_TXT_PATH,
+    ) -> Dict[str, int]:
+        emails = _read_json_list(emails_path)
+        tasks = _read_json_list(tasks_path)
+        attachments = _read_json_list(attachments_path)
+
+        self.upsert_emails(emails)
+        self.replace_tasks_and_attachments(tasks, attachments)
+        if delta_link_path.exists():
+            self.set_meta("delta_link", delta_link_path.read_text(encoding="utf-8").strip() or None)
+        self.set_meta("json_imported", "1")
+
+        return {"emails": len(emails), "tasks": len(tasks), "attachments": len(attachments)}
+
+    def export_json_files(
+        self,
+        emails_path: Path = EMAILS_JSON_PATH,
+        tasks_path: Path = TASKS_JSON_PATH,
+        attachments_path: Path = ATTACHMENTS_JSON_PATH,
+    ) -> None:
+        """Dump the store back to the JSON shapes the frontend mock data uses."""
+        for path, rows in (
+            (emails_path, self.load_emails()),
+            (tasks_path, self.load_tasks()),
+            (attachments_path, self.load_attachments()),
+        ):
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+
+
+_store: Optional[EmailStore] = None
+_store_lock = threading.Lock()
+# Store of the account being synced by the current task (see use_store)
+_scoped_store: ContextVar[Optional[EmailStore]] = ContextVar("scoped_store", default=None)
+
+
+@contextmanager
+def use_store(store: EmailStore) -> Iterator[EmailStore]:
+    """
+    Make get_store() return store inside this block, for this task and whatever it
+    starts (asyncio tasks and asyncio.to_thread copy the context), so concurrent
+    syncs of different accounts each see their own store.
+    """
+    token = _scoped_store.set(store)
+    try:
+        yield store
+    finally:
+        _scoped_store.reset(token)
+
+
+def get_store() -> EmailStore:
+    """
+    Process-wide store (or the one selected with use_store). On first use against a
+    fresh database the legacy emails.json / tasks.json / attachments.json are imported.
+    """
+    global _store
+    scoped = _scoped_store.get()
+    if scoped is not None:
+        return scoped
+    with _store_lock:
+        if _store is None:
+            _store = EmailStore(DB_PATH)
+            if _store.get_meta("json_imported") is None and _store.count_emails() == 0:
+                counts = _store.import_json_files()
+                if any(counts.values()):
+                    log_event(log, logging.INFO, "legacy_json_imported", path=str(DB_PATH), **counts)
+        return _store
+
+
+def current_account() -> Optional[str]:
+    """Account (store namespace) of the use_store block this runs in; None for the single-mailbox store."""
+    scoped = _scoped_store.get()
+    return scoped.namespace if scoped is not None else None
+
+
+# ==========================
+# CLI entrypoint
+# ==========================
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    store = EmailStore(DB_PATH)
+    if command == "import":
+        print(store.import_json_files())
+    elif command == "export":
+        store.export_json_files()
+        print(f"Exported {DB_PATH} to JSON")
+    else:
+        print("usage: python store.py [import|export]")
@@ -0,0 +1,383 @@
+# subscriptions.py
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from coordinator import ProcessLock, SYNC_LOCK_PATH
+from graph_client import GraphClient, GraphError
+from metrics import get_logger, log_event
+from store import EmailStore, current_account, get_store
+
+log = get_logger("subscriptions")
+
+# ==========================
+# Config
+# ==========================
+
+# Public HTTPS URL of this API's POST /notifications route; empty = polling only
+GRAPH_NOTIFICATION_URL = os.getenv("GRAPH_NOTIFICATION_URL", "")
+# Inbox only, like the delta sync (plain me/messages would also notify for sent items, drafts...)
+SUBSCRIPTION_RESOURCE = os.getenv("GRAPH_SUBSCRIPTION_RESOURCE", "me/mailFolders('inbox')/messages")
+SUBSCRIPTION_CHANGE_TYPES = "created,updated,deleted"
+# Outlook message subscriptions live at most 10080 minutes (7 days)
+SUBSCRIPTION_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_MINUTES", "4200"))
+# Renew this long before expiry
+SUBSCRIPTION_RENEW_BEFORE_SECONDS = float(os.getenv("GRAPH_SUBSCRIPTION_RENEW_BEFORE_SECONDS", "3600"))
+# Wait before trying again after a failed create / renew
+SUBSCRIPTION_RETRY_SECONDS = 60.0
+SUBSCRIPTION_LOCK_PATH = os.getenv("SUBSCRIPTION_LOCK_PATH", "subscription.lock")
+SUBSCRIPTION_META_KEY = "graph_subscription"
+
+# Notifications arriving within this window are fetched together
+NOTIFICATION_DEBOUNCE_SECONDS = float(os.getenv("NOTIFICATION_DEBOUNCE_SECONDS", "0.5"))
+# Fallback poll interval while a subscription is active (polling catches anything missed)
+PUSH_SYNC_INTERVAL_SECONDS = float(os.getenv("PUSH_SYNC_INTERVAL_SECONDS", "1800"))
+
+
+def parse_graph_datetime(value: str) -> datetime:
+    """Graph timestamps: 'Z' suffix and up to 7 fractional digits."""
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    return datetime.fromisoformat(value)
+
+
+def format_graph_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# ==========================
+# Subscription lifecycle
+# ==========================
+
+class SubscriptionManager:
+    """
+    Keeps one Graph change-notification subscription on the inbox alive.
+    - created on start (Graph validates notification_url with a validationToken
+      handshake before the create call returns, so the API must already be serving)
+    - renewed (PATCH expirationDateTime) SUBSCRIPTION_RENEW_BEFORE_SECONDS before it
+      expires; recreated if Graph no longer knows it
+    - the subscription (id, expiry, clientState secret) is kept in store meta and
+      changed under a lock file, so every worker process shares one subscription
+    - on_active(bool) is called when push delivery starts / stops working
+    """
+
+    def __init__(
+        self,
+        client: GraphClient,
+        notification_url: str = GRAPH_NOTIFICATION_URL,
+        resource: str = SUBSCRIPTION_RESOURCE,
+        minutes: int = SUBSCRIPTION_MINUTES,
+        renew_before: float = SUBSCRIPTION_RENEW_BEFORE_SECONDS,
+        lock_path: str = SUBSCRIPTION_LOCK_PATH,
+        store: Optional[EmailStore] = None,
+        on_active: Optional[Callable[[bool], None]] = None,
+    ):
+        self.client = client
+        self.notification_url = notification_url
+        self.resource = resource
+        self.minutes = minutes
+        self.renew_before = renew_before
+        self.lock = ProcessLock(lock_path)
+        self.store = store or get_store()
+        self.on_active = on_active
+
+        self.subscription: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._force: Optional[str] = None  # "renew" | "recreate", set by lifecycle events
+        self._active = False
+
+        self.created = 0
+        self.renewed = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="graph-subscription")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def active(self) -> bool:
+        return self.subscription is not None and self.seconds_left() > 0
+
+    def seconds_left(self) -> float:
+        if self.subscription is None:
+            return 0.0
+        expires = parse_graph_datetime(self.subscription["expirationDateTime"])
+        return (expires - datetime.now(timezone.utc)).total_seconds()
+
+    def request_renewal(self, recreate: bool = False) -> None:
+        """Renew (or recreate) now instead of at the next scheduled time."""
+        if recreate or self._force is None:
+            self._force = "recreate" if recreate else "renew"
+        self._wakeup.set()
+
+    # --------------------------
+    # Create / renew
+    # --------------------------
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        raw = self.store.get_meta(SUBSCRIPTION_META_KEY)
+        if not raw:
+            return None
+        subscription = json.loads(raw)
+        # a different URL / resource was configured: that subscription isn't ours to reuse
+        if subscription.get("notificationUrl") != self.notification_url or subscription.get("resource") != self.resource:
+            return None
+        return subscription
+
+    def _save(self, subscription: Optional[Dict[str, Any]]) -> None:
+        self.store.set_meta(SUBSCRIPTION_META_KEY, json.dumps(subscription) if subscription else None)
+
+    def _expiry(self) -> str:
+        return format_graph_datetime(datetime.now(timezone.utc) + timedelta(minutes=self.minutes))
+
+    async def ensure(self) -> Dict[str, Any]:
+        """Make sure a subscription exists with more than renew_before left; returns it."""
+        await self.lock.acquire()
+        try:
+            force, self._force = self._force, None
+            # another worker may have created / renewed it already
+            self.subscription = self._load()
+            if force == "recreate":
+                self.subscription = None
+            if self.subscription is not None and (force == "renew" or self.seconds_left() <= self.renew_before):
+                self.subscription = await self._renew(self.subscription)
+            if self.subscription is None:
+                self.subscription = await self._create()
+            self._save(self.subscription)
+            return self.subscription
+        finally:
+            self.lock.release()
+
+    async def _create(self) -> Dict[str, Any]:
+        client_state = secrets.token_urlsafe(32)
+        response = await self.client.request("POST", "subscriptions", json={
+            "changeType": SUBSCRIPTION_CHANGE_TYPES,
+            "notificationUrl": self.notification_url,
+            # reauthorizationRequired / subscriptionRemoved / missed come to the same route
+            "lifecycleNotificationUrl": self.notification_url,
+            "resource": self.resource,
+            "expirationDateTime": self._expiry(),
+            "clientState": client_state,
+        })
+        if response.status_code >= 400:
+            raise GraphError(response.status_code, response.text)
+        created = response.json()
+        self.created += 1
+        log_event(
+            log, logging.INFO, "subscription_created", account=self.store.namespace,
+            subscription=created["id"], resource=self.resource, expires=created["expirationDateTime"],
+        )
+        return {
+            "id": created["id"],
+            "resource": self.resource,
+            "notificationUrl": self.notification_url,
+            "expirationDateTime": created["expirationDateTime"],
+            "clientState": client_state,
+        }
+
+    async def _renew(self, subscription: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """New expiry for subscription; None if Graph no longer has it."""
+        response = await self.client.request(
+            "PATCH", f"subscriptions/{subscription['id']}", json={"expirationDateTime": self._expiry()}
+        )
+        if response.status_code == 404:
+            log_event(log, logging.WARNING, "subscription_gone", account=self.store.namespace, subscription=subscription["id"])
+            return None
+        if response.status_code >= 400:
+            raise GraphError(response.status_code, response.text)
+        self.renewed += 1
+        return {**subscription, "expirationDateTime": response.json()["expirationDateTime"]}
+
+    async def _loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.ensure()
+                self.last_error = None
+                delay = max(1.0, self.seconds_left() - self.renew_before)
+            except Exception as e:
+                # Polling keeps the mailbox in sync meanwhile
+                log_event(
+                    log, logging.ERROR, "subscription_ensure_failed", account=self.store.namespace,
+                    error=str(e), retry_in=SUBSCRIPTION_RETRY_SECONDS,
+                )
+                self.last_error = str(e)
+                delay = SUBSCRIPTION_RETRY_SECONDS
+            self._set_active(self.active)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _set_active(self, active: bool) -> None:
+        if active != self._active:
+            self._active = active
+            if self.on_active is not None:
+                self.on_active(active)
+
+    # --------------------------
+    # Incoming notifications
+    # --------------------------
+
+    def accepts(self, notification: Dict[str, Any]) -> bool:
+        """True if the notification is for our subscription and carries its clientState."""
+        subscription = self.subscription
+        if subscription is None or subscription["id"] != notification.get("subscriptionId"):
+            # created / recreated by another worker process since we last looked
+            subscription = self._load()
+        if subscription is None or subscription["id"] != notification.get("subscriptionId"):
+            return False
+        return hmac.compare_digest(str(notification.get("clientState", "")), subscription["clientState"])
+
+    def status(self) -> Dict[str, Any]:
+        subscription = self.subscription or {}
+        return {
+            "enabled": True,
+            "active": self.active,
+            "subscription_id": subscription.get("id"),
+            "resource": self.resource,
+            "expires_at": subscription.get("expirationDateTime"),
+            "created": self.created,
+            "renewed": self.renewed,
+            "last_error": self.last_error,
+        }
+
+
+# ==========================
+# Targeted sync of notified messages
+# ==========================
+
+class NotificationProcessor:
+    """
+    Collects message ids from notifications and syncs just those in the background.
+    - the webhook only records ids (Graph wants an answer within a few seconds)
+    - a short debounce groups bursts into one targeted sync
+    - runs hold the sync lock file, so they never overlap a full (polling) sync
+    - a failed run is dropped: the fallback poll picks those changes up
+    """
+
+    def __init__(
+        self,
+        sync_fn: Callable[[List[str], List[str]], Awaitable[Any]],
+        debounce: float = NOTIFICATION_DEBOUNCE_SECONDS,
+        lock_path: str = SYNC_LOCK_PATH,
+    ):
+        self.sync_fn = sync_fn
+        self.debounce = debounce
+        self.lock = ProcessLock(lock_path)
+
+        self.pending: Dict[str, str] = {}  # graph id -> "upsert" | "removed", latest wins
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+        self.received = 0
+        self.runs = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_result: Any = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="notification-sync")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def add(self, graph_id: str, change_type: str) -> None:
+        self.pending[graph_id] = "removed" if change_type == "deleted" else "upsert"
+        self.received += 1
+        self._wakeup.set()
+
+    async def _loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.debounce)
+            self._wakeup.clear()
+            pending, self.pending = self.pending, {}
+            if not pending:
+                continue
+
+            graph_ids = [g for g, change in pending.items() if change == "upsert"]
+            removed = [g for g, change in pending.items() if change == "removed"]
+            await self.lock.acquire()
+            try:
+                self.last_result = await self.sync_fn(graph_ids, removed)
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                log_event(
+                    log, logging.ERROR, "notification_sync_failed", account=current_account(),
+                    messages=len(pending), error=str(e),
+                )
+            finally:
+                self.lock.release()
+                self.runs += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "pending": len(self.pending),
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_result": self.last_result,
+        }
+
+
+def handle_notifications(
+    payload: Dict[str, Any],
+    subscriptions: SubscriptionManager,
+    processor: NotificationProcessor,
+    resync: Callable[[], None],
+) -> int:
+    """
+    Route one webhook POST body ({"value": [...]}) and return how many notifications
+    were accepted. Notifications failing the subscription / clientState check are ignored.
+    - change notifications: queue resourceData.id for a targeted sync
+    - reauthorizationRequired: renew now; subscriptionRemoved: create a new one
+    - missed: some notifications were dropped, so run a full (delta) sync
+    """
+    accepted = 0
+    for notification in payload.get("value") or []:
+        if not isinstance(notification, dict) or not subscriptions.accepts(notification):
+            continue
+        accepted += 1
+
+        event = notification.get("lifecycleEvent")
+        if event == "reauthorizationRequired":
+            subscriptions.request_renewal()
+        elif event == "subscriptionRemoved":
+            subscriptions.request_renewal(recreate=True)
+        elif event == "missed":
+            resync()
+        elif event is None:
+            graph_id = (notification.get("resourceData") or {}).get("id")
+            if graph_id:
+                processor.add(graph_id, notification.get("changeType", "updated"))
+    return accepted
@@ -0,0 +1,20 @@
+# tests/conftest.py
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules are flat under email_processing/ and import each other by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A fresh EmailStore in tmp_path that get_store() returns for the test (attachments go next to it)."""
+    from store import EmailStore, use_store
+
+    email_store = EmailStore(tmp_path / "emails.db")
+    with use_store(email_store):
+        yield email_store
+    email_store.close()
@@ -0,0 +1,29 @@
+# tests/test_analysis_cache.py
+
+from analysis_cache import AnalysisCache
+
+
+def test_other_fingerprints_survive_open(tmp_path):
+    path = tmp_path / "cache.db"
+    old = AnalysisCache("patterns-v1", path=path)
+    old.put_many(["text"], [{"org": "v1"}])
+
+    # a process that already reloaded to v2 opens the same file
+    new = AnalysisCache("patterns-v2", path=path)
+    assert new.get_many(["text"]) == [None]
+    new.put_many(["text"], [{"org": "v2"}])
+
+    assert old.get_many(["text"]) == [{"org": "v1"}]
+    assert AnalysisCache("patterns-v1", path=path, memory_entries=0).get_many(["text"]) == [{"org": "v1"}]
+
+
+def test_stale_fingerprints_leave_through_lru_eviction(tmp_path):
+    path = tmp_path / "cache.db"
+    AnalysisCache("patterns-v1", path=path).put_many(["a", "b"], [{}, {}])
+
+    cache = AnalysisCache("patterns-v2", path=path, max_entries=4, memory_entries=0)
+    cache.put_many(["c", "d", "e", "f"], [{}, {}, {}, {}])
+
+    assert cache.size() <= 4
+    assert cache._conn.execute("SELECT DISTINCT fingerprint FROM entries").fetchall() == [("patterns-v2",)]
+    assert cache.get_many(["c", "d", "e", "f"]) == [{}, {}, {}, {}]
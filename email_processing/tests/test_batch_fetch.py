@@ -0,0 +1,98 @@
+# tests/test_batch_fetch.py
+
+import asyncio
+import json
+
+import httpx
+
+import email_processor
+from benchmarks.fake_graph import BATCH_PATH, FakeGraph
+from benchmarks.mailbox import make_mailbox
+from graph_client import GRAPH_BATCH_SIZE, GraphClient
+
+
+class Batches:
+    """
+    FakeGraph transport that can reorder $batch responses and fail chosen sub-requests
+    (by Graph id) with a status, once each; records the size of every $batch call.
+    """
+
+    def __init__(self, graph: FakeGraph, reverse: bool = False, fail=None):
+        self.graph = graph
+        self.reverse = reverse
+        self.fail = dict(fail or {})  # graph id -> status to answer once
+        self.sizes = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        response = await self.graph.handle(request)
+        if request.url.path != BATCH_PATH:
+            return response
+        self.sizes.append(len(json.loads(request.content)["requests"]))
+        urls = {sub["id"]: sub["url"] for sub in json.loads(request.content)["requests"]}
+        responses = json.loads(response.content)["responses"]
+        for sub in responses:
+            graph_id = urls[sub["id"]].split("?")[0].rsplit("/", 1)[-1]
+            status = self.fail.pop(graph_id, None)
+            if status is not None:
+                sub.update(status=status, headers={"Retry-After": "0"}, body={"error": {"code": "Throttled"}})
+        if self.reverse:
+            responses.reverse()
+        return httpx.Response(200, json={"responses": responses})
+
+
+def fetch_bodies(batches: Batches, graph_ids):
+    async def run():
+        transport = httpx.MockTransport(batches.handle)
+        async with GraphClient(lambda: "test-token", max_retries=3, transport=transport) as client:
+            return await email_processor.fetch_message_bodies(client, graph_ids)
+
+    return asyncio.run(run())
+
+
+def test_out_of_order_responses_land_on_their_messages():
+    graph = FakeGraph(make_mailbox(30))
+    ids = list(graph.messages)
+
+    bodies = fetch_bodies(Batches(graph, reverse=True), ids)
+
+    assert list(bodies) == ids
+    for graph_id in ids:
+        assert bodies[graph_id]["body"] == graph.messages[graph_id]["body"]
+
+
+def test_throttled_and_failed_items_are_retried_without_losing_the_rest():
+    graph = FakeGraph(make_mailbox(10))
+    ids = list(graph.messages)
+    batches = Batches(graph, reverse=True, fail={ids[1]: 429, ids[4]: 503, ids[7]: 500})
+
+    bodies = fetch_bodies(batches, ids)
+
+    assert not batches.fail  # every failure was served
+    assert batches.sizes == [10, 3]  # only the failed three went again
+    assert {g: b["body"] for g, b in bodies.items()} == {g: graph.messages[g]["body"] for g in ids}
+
+
+def test_more_than_twenty_messages_are_split_across_batch_calls():
+    graph = FakeGraph(make_mailbox(45))
+    batches = Batches(graph)
+
+    bodies = fetch_bodies(batches, list(graph.messages))
+
+    assert sorted(batches.sizes) == [5, GRAPH_BATCH_SIZE, GRAPH_BATCH_SIZE]
+    assert len(bodies) == 45
+
+
+def test_two_phase_sync_stores_every_body_despite_throttling(store, monkeypatch):
+    monkeypatch.setattr(email_processor, "analyze_emails", lambda texts, *a, **k: [{"email_type": "Notice"} for _ in texts])
+    monkeypatch.setattr("attachments.ATTACHMENTS_ENABLED", False)  # only the body fetch batches
+    graph = FakeGraph(make_mailbox(25), throttle_batch_items=7)
+
+    async def run():
+        async with GraphClient(lambda: "test-token", transport=graph.transport()) as client:
+            return await email_processor.sync_emails(client)
+
+    result = asyncio.run(run())
+
+    assert (result["new"], result["failed"]) == (25, 0)
+    assert graph.requests_by_path[BATCH_PATH] == 3  # 20 + 5, then the 7 throttled ones again
+    assert store.count_emails() == 25
@@ -0,0 +1,26 @@
+# tests/test_columns.py
+
+from columns import DASHBOARD_CATEGORIES, FlagColumns, dashboard_category
+
+
+def test_stats_count_dashboard_categories():
+    columns = FlagColumns()
+    columns.extend([
+        {"id": 0, "analysis": {"category": "finance", "email_type": "e-statement"}},
+        # stored before categories were mapped: category holds the EMAIL_TYPE string
+        {"id": 1, "analysis": {"category": "bank statement", "isRead": True}},
+        {"id": 2, "analysis": {"category": "Notice of Assessment"}},
+        {"id": 3, "analysis": {"category": "Uncategorized", "org": "IRAS"}},
+        {"id": 4, "analysis": {"category": "Uncategorized"}},
+    ])
+    columns.upsert(5, {"analysis": {"email_type": "utility bill"}})
+
+    categories = {row["category"]: (row["count"], row["unread"]) for row in columns.stats()["categories"]}
+    assert categories == {"finance": (2, 1), "government": (2, 2), "misc": (1, 1), "bills": (1, 1)}
+    assert set(categories) <= set(DASHBOARD_CATEGORIES)
+
+
+def test_subject_and_flags_fill_in_without_an_email_type():
+    assert dashboard_category({}, "Your SP Group bill") == "bills"
+    assert dashboard_category({"has_appointment": True}) == "healthcare"
+    assert dashboard_category({"org": "OCBC Bank"}) == "finance"
@@ -0,0 +1,46 @@
+# tests/test_graph_client.py
+
+import asyncio
+
+import httpx
+
+from graph_client import GraphClient
+
+
+def test_every_retry_gets_a_fresh_token():
+    tokens = iter(["expired", "fresh"])
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["Authorization"])
+        if len(seen) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={})
+
+    async def run():
+        async with GraphClient(lambda: next(tokens), transport=httpx.MockTransport(handler)) as client:
+            return await client.request("GET", "me")
+
+    assert asyncio.run(run()).status_code == 200
+    assert seen == ["Bearer expired", "Bearer fresh"]
+
+
+def test_account_clients_share_the_root_limit():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={})
+
+    async def run():
+        async with GraphClient(lambda: "t", max_concurrency=3, transport=httpx.MockTransport(handler)) as root:
+            accounts = [root.for_account(lambda: "t", max_concurrency=2) for _ in range(3)]
+            await asyncio.gather(*(a.request("GET", "me") for a in accounts for _ in range(4)))
+
+    asyncio.run(run())
+    assert peak == 3
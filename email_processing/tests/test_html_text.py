@@ -0,0 +1,17 @@
+# tests/test_html_text.py
+
+from html_text import html_to_text
+
+
+def test_head_is_dropped():
+    html = "<html><head><title>Statement</title><style>p {}</style></head><body><p>Amount due</p></body></html>"
+    assert html_to_text(html) == "Amount due"
+
+
+def test_unclosed_head_ends_at_body():
+    html = "<html><head><title>Statement</title><style>p {}</style><body><p>Amount due</p> by 20 Jan</body>"
+    assert html_to_text(html) == "Amount due\nby 20 Jan"
+
+
+def test_unclosed_head_ends_at_block_content():
+    assert html_to_text("<head><meta charset='utf-8'><title>Statement</title><div>Amount due</div>") == "Amount due"
@@ -0,0 +1,50 @@
+# tests/test_pattern_entities.py
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+from email_processor import PatternEntities
+from rule_matcher import PhraseIndex
+
+PATTERNS = [
+    {"label": "ORG", "pattern": "UOB"},
+    {"label": "ORG", "pattern": "DBS"},
+    {"label": "ORG", "pattern": "DBS Bank"},
+    {"label": "ORG", "pattern": "Lion Crest Pte Ltd"},
+    {"label": "EMAIL_TYPE", "pattern": "e-statement"},
+]
+
+
+def entities(text):
+    doc = PatternEntities(PhraseIndex(PATTERNS))(spacy.blank("en")(text))
+    return [(ent.text, ent.label_) for ent in doc.ents]
+
+
+def test_marks_pattern_matches_on_token_boundaries():
+    assert entities("Your DBS Bank e-Statement is ready, from Lion Crest Pte Ltd.") == [
+        ("DBS Bank", "ORG"),
+        ("e-Statement", "EMAIL_TYPE"),
+        ("Lion Crest Pte Ltd", "ORG"),
+    ]
+
+
+def test_entities_stop_at_the_match_inside_a_token():
+    doc = PatternEntities(PhraseIndex(PATTERNS))(spacy.blank("en")("Sent by Lion Crest Pte Ltd."))
+    assert [(ent.text, ent.end_char) for ent in doc.ents] == [("Lion Crest Pte Ltd", 26)]
+    assert doc.text == "Sent by Lion Crest Pte Ltd."
+
+
+def test_bank_urls_and_addresses_in_the_footer_are_not_entities():
+    footer = (
+        "Your statement is ready.\n"
+        "Questions? Write to billing@dbs.com or alerts@uob.com.sg.\n"
+        "View it at https://www.uob.com.sg/view-statement or www.dbs.com.sg, or pay at dbs.bank/pay"
+    )
+    assert entities(footer) == []
+
+
+def test_same_addresses_as_rules_mode():
+    text = "DBS: pay at dbs.bank/pay or uob.com.sg/help, or mail UOB at help@uob.com.sg. UOB"
+    rules = [(text[start:end], label) for start, end, label in PhraseIndex(PATTERNS).find(text)]
+    assert entities(text) == rules == [("DBS", "ORG"), ("UOB", "ORG"), ("UOB", "ORG")]
@@ -0,0 +1,36 @@
+# tests/test_rule_matcher.py
+
+from rule_matcher import PhraseIndex
+
+PATTERNS = [
+    {"label": "ORG", "pattern": "UOB"},
+    {"label": "ORG", "pattern": "DBS"},
+    {"label": "ORG", "pattern": "DBS Bank"},
+    {"label": "EMAIL_TYPE", "pattern": "e-statement"},
+]
+
+
+def found(text):
+    return [(text[start:end], label) for start, end, label in PhraseIndex(PATTERNS).find(text)]
+
+
+def test_matches_whole_words_case_insensitively():
+    assert found("Your dbs bank e-Statement is ready. UOB") == [
+        ("dbs bank", "ORG"),
+        ("e-Statement", "EMAIL_TYPE"),
+        ("UOB", "ORG"),
+    ]
+
+
+def test_no_matches_inside_urls_or_email_addresses():
+    footer = (
+        "Questions? Write to alerts@dbs.com or billing@dbs.com.sg.\n"
+        "View it at https://www.uob.com.sg/view-statement or www.uob.com.sg, "
+        "or visit uob.com.sg/help."
+    )
+    assert found(footer) == []
+
+
+def test_addresses_break_phrases_but_not_the_text_around_them():
+    assert found("From DBS (alerts@dbs.com): your e-statement") == [("DBS", "ORG"), ("e-statement", "EMAIL_TYPE")]
+    assert found("DBS https://dbs.com Bank") == [("DBS", "ORG")]
@@ -0,0 +1,154 @@
+# tests/test_subscriptions.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+import api
+import email_processor
+from benchmarks.fake_graph import FakeGraph, make_message
+from graph_client import GraphClient
+from scheduler import SyncScheduler
+from subscriptions import NotificationProcessor, SubscriptionManager
+
+NOTIFICATION_URL = "http://testserver/notifications"
+
+
+@pytest.fixture(autouse=True)
+def offline_sync(store, monkeypatch):
+    """Every test syncs into the tmp store, with stand-in analysis and no attachment downloads."""
+    monkeypatch.setattr(email_processor, "analyze_emails", lambda texts, *a, **k: [{"email_type": "Notice"} for _ in texts])
+    monkeypatch.setattr("attachments.ATTACHMENTS_ENABLED", False)
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+@asynccontextmanager
+async def push_mode(tmp_path, messages: int = 3):
+    """
+    FakeGraph posting to the API's real /notifications route, with a SubscriptionManager,
+    NotificationProcessor and SyncScheduler wired up the way api.lifespan does, all
+    using lock files in tmp_path.
+    """
+    graph = FakeGraph([make_message(i) for i in range(messages)], webhook=httpx.ASGITransport(app=api.app))
+    async with GraphClient(lambda: "test-token", transport=graph.transport()) as client:
+        scheduler = SyncScheduler(
+            lambda: email_processor.sync_emails(client), interval=3600, jitter=0, lock_path=str(tmp_path / "sync.lock")
+        )
+        notifications = NotificationProcessor(
+            lambda ids, removed: email_processor.sync_message_ids(client, ids, removed),
+            debounce=0.0,
+            lock_path=str(tmp_path / "sync.lock"),
+        )
+        subscriptions = SubscriptionManager(
+            client, notification_url=NOTIFICATION_URL, lock_path=str(tmp_path / "subscription.lock")
+        )
+        api.app.state.scheduler = scheduler
+        api.app.state.notifications = notifications
+        api.app.state.subscriptions = subscriptions
+        scheduler.start()
+        notifications.start()
+        try:
+            await wait_until(lambda: scheduler.runs == 1)  # the initial poll
+            yield graph, subscriptions, notifications, scheduler
+        finally:
+            await notifications.stop()
+            await scheduler.stop()
+            api.app.state.subscriptions = None
+
+
+def test_validation_handshake_creates_the_subscription(tmp_path, store):
+    async def scenario():
+        async with push_mode(tmp_path) as (graph, subscriptions, _, _):
+            subscription = await subscriptions.ensure()
+
+            assert list(graph.subscriptions) == [subscription["id"]]
+            assert graph.subscriptions[subscription["id"]]["clientState"] == subscription["clientState"]
+            assert subscriptions.active and subscriptions.created == 1
+            # a second worker process finds it in the store instead of creating another
+            other = SubscriptionManager(
+                subscriptions.client, notification_url=NOTIFICATION_URL, lock_path=str(tmp_path / "subscription.lock")
+            )
+            assert (await other.ensure())["id"] == subscription["id"]
+            assert other.created == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_handshake_creates_nothing(tmp_path, store):
+    async def scenario():
+        async with push_mode(tmp_path) as (graph, subscriptions, _, _):
+            subscriptions.notification_url = "http://testserver/not-the-webhook"
+            with pytest.raises(Exception, match="ValidationError"):
+                await subscriptions.ensure()
+            assert graph.subscriptions == {}
+
+    asyncio.run(scenario())
+
+
+def test_notifications_with_the_wrong_client_state_are_ignored(tmp_path, store):
+    async def scenario():
+        async with push_mode(tmp_path) as (graph, subscriptions, notifications, _):
+            subscription = await subscriptions.ensure()
+
+            graph.subscriptions[subscription["id"]]["clientState"] = "forged"
+            graph.add_message(make_message(10))
+            await graph.emit_notifications()
+            assert notifications.received == 0
+
+            graph.subscriptions[subscription["id"]]["clientState"] = subscription["clientState"]
+            graph.add_message(make_message(11))
+            await graph.emit_notifications()
+            await wait_until(lambda: notifications.runs == 1)
+            assert set(store.get_by_graph_ids(["msg-0000010", "msg-0000011"])) == {"msg-0000011"}
+
+    asyncio.run(scenario())
+
+
+def test_lifecycle_events_renew_and_recreate(tmp_path, store):
+    async def scenario():
+        async with push_mode(tmp_path) as (graph, subscriptions, _, _):
+            subscriptions.start()
+            await wait_until(lambda: subscriptions.active)
+            first = subscriptions.subscription
+            graph.subscriptions[first["id"]]["expirationDateTime"] = "2000-01-01T00:00:00.0000000Z"
+
+            await graph.emit_lifecycle("reauthorizationRequired")
+            await wait_until(lambda: subscriptions.renewed == 1)
+            assert subscriptions.subscription["id"] == first["id"]
+            assert graph.subscriptions[first["id"]]["expirationDateTime"] == subscriptions.subscription["expirationDateTime"]
+
+            await graph.emit_lifecycle("subscriptionRemoved")
+            await wait_until(lambda: subscriptions.created == 2)
+            assert list(graph.subscriptions) == [subscriptions.subscription["id"]] != [first["id"]]
+            await subscriptions.stop()
+
+    asyncio.run(scenario())
+
+
+def test_missed_notifications_fall_back_to_a_delta_sync(tmp_path, store):
+    async def scenario():
+        async with push_mode(tmp_path) as (graph, subscriptions, notifications, scheduler):
+            await subscriptions.ensure()
+            assert store.count_emails() == 3
+
+            # changes whose notifications never arrive
+            graph.add_message(make_message(20))
+            graph.delete_message("msg-0000000")
+            graph.outbox.clear()
+
+            await graph.emit_lifecycle("missed")
+            await wait_until(lambda: scheduler.runs == 2)
+            assert notifications.runs == 0
+            assert scheduler.last_result["fetched"] == 1 and scheduler.last_result["removed"] == 1
+            assert set(store.get_by_graph_ids(["msg-0000000", "msg-0000020"])) == {"msg-0000020"}
+
+    asyncio.run(scenario())
@@ -0,0 +1,97 @@
+# tests/test_sync_retry.py
+
+import asyncio
+
+import email_processor
+from benchmarks.fake_graph import FakeGraph
+from benchmarks.mailbox import make_mailbox
+from graph_client import GraphClient
+
+
+def fake_analysis(monkeypatch, broken: set) -> None:
+    """analyze_emails / analyze_email that fail for any text in broken."""
+
+    def analyze_email(text, *args, **kwargs):
+        if text in broken:
+            raise RuntimeError("no model")
+        return {"email_type": "Notice"}
+
+    def analyze_emails(texts, *args, **kwargs):
+        return [analyze_email(text) for text in texts]
+
+    monkeypatch.setattr(email_processor, "analyze_email", analyze_email)
+    monkeypatch.setattr(email_processor, "analyze_emails", analyze_emails)
+
+
+def sync(graph: FakeGraph):
+    async def run():
+        async with GraphClient(lambda: "test-token", transport=graph.transport()) as client:
+            return await email_processor.sync_emails(client)
+
+    return asyncio.run(run())
+
+
+def test_failed_analysis_is_retried_after_the_delta_link_moves(store, monkeypatch):
+    graph = FakeGraph(make_mailbox(6))
+    broken = {email_processor.clean_html(m["body"]["content"]) for m in list(graph.messages.values())[:2]}
+    fake_analysis(monkeypatch, broken)
+
+    first = sync(graph)
+    assert (first["new"], first["failed"]) == (4, 2)
+    assert store.count_emails() == 4
+    assert len(email_processor.load_analysis_retry()) == 2
+
+    # nothing changed in the mailbox, so only the retry list brings the two back
+    broken.clear()
+    second = sync(graph)
+    assert (second["fetched"], second["retried"], second["new"], second["failed"]) == (0, 2, 2, 0)
+    assert store.count_emails() == 6
+    assert email_processor.load_analysis_retry() == []
+
+
+def test_retry_drops_messages_deleted_meanwhile(store, monkeypatch):
+    graph = FakeGraph(make_mailbox(3))
+    first_id, first = next(iter(graph.messages.items()))
+    fake_analysis(monkeypatch, {email_processor.clean_html(first["body"]["content"])})
+
+    assert sync(graph)["failed"] == 1
+    graph.delete_message(first_id)
+    result = sync(graph)
+    assert (result["retried"], result["new"], result["failed"]) == (0, 0, 0)
+    assert email_processor.load_analysis_retry() == []
+
+
+def test_failed_pool_batch_is_retried(store, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    import analysis_pool
+    from analysis_pool import AnalysisPool
+
+    graph = FakeGraph(make_mailbox(5))
+    fake_analysis(monkeypatch, set())
+    batches = []
+
+    def analyze_batch(labels, texts):
+        batches.append(len(texts))
+        if len(batches) == 1:
+            raise RuntimeError("worker died")
+        return email_processor.analyze_new_messages(labels, texts)
+
+    monkeypatch.setattr(analysis_pool, "_analyze_batch", analyze_batch)
+
+    async def run():
+        # the pool's dispatch path on a thread, so the patched batch function is the one run
+        pool = AnalysisPool(workers=1, batch_size=2)
+        pool._executor = ThreadPoolExecutor(1)
+        pool._queue = asyncio.PriorityQueue(maxsize=pool.queue_size)
+        pool._dispatchers = [asyncio.create_task(pool._dispatch())]
+        try:
+            async with GraphClient(lambda: "test-token", transport=graph.transport()) as client:
+                return [await email_processor.sync_emails(client, pool) for _ in range(2)]
+        finally:
+            await pool.stop()
+
+    first, second = asyncio.run(run())
+    assert (first["new"], first["failed"]) == (3, 2)
+    assert (second["retried"], second["new"], second["failed"]) == (2, 2, 0)
+    assert store.count_emails() == 5
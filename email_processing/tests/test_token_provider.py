@@ -0,0 +1,133 @@
+# tests/test_token_provider.py
+
+import base64
+import itertools
+import json
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+import ms_graph
+from ms_graph import ReauthRequired, TokenProvider
+
+AUTHORITY = "https://login.stub.test/tenant"
+CLIENT_ID = "test-app"
+
+
+def b64(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+class Response:
+    def __init__(self, status_code: int, payload):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.headers = {"Content-Type": "application/json"}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.text)
+
+
+class StubAuthority:
+    """
+    Local stand-in for the authority, handed to MSAL as its http_client:
+    OpenID discovery plus a token endpoint that redeems refresh tokens it issued.
+    """
+
+    def __init__(self, expires_in: int = 3600):
+        self.expires_in = expires_in
+        self.valid_refresh_tokens = {"rt-0"}
+        self.grants = []
+        self._issued = itertools.count(1)
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        assert url == f"{AUTHORITY}/v2.0/.well-known/openid-configuration"
+        return Response(200, {
+            "issuer": AUTHORITY,
+            "authorization_endpoint": f"{AUTHORITY}/oauth2/v2.0/authorize",
+            "token_endpoint": f"{AUTHORITY}/oauth2/v2.0/token",
+        })
+
+    def post(self, url, params=None, data=None, headers=None, **kwargs):
+        form = data if isinstance(data, dict) else {k: v[-1] for k, v in parse_qs(data or "").items()}
+        self.grants.append(form["grant_type"])
+        if form.get("refresh_token") not in self.valid_refresh_tokens:
+            return Response(400, {"error": "invalid_grant", "error_description": "refresh token revoked"})
+        n = next(self._issued)
+        self.valid_refresh_tokens.add(f"rt-{n}")
+        now = int(time.time())
+        return Response(200, {
+            "token_type": "Bearer",
+            "access_token": f"at-{n}",
+            "refresh_token": f"rt-{n}",
+            "expires_in": self.expires_in,
+            "scope": "User.Read Mail.ReadWrite",
+            "client_info": b64({"uid": "user", "utid": "tenant"}),
+            "id_token": ".".join([b64({"alg": "none"}), b64({
+                "iss": AUTHORITY, "aud": CLIENT_ID, "sub": "user", "oid": "user", "tid": "tenant",
+                "preferred_username": "user@example.com", "iat": now, "exp": now + 3600,
+            }), ""]),
+        })
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def no_prompt(monkeypatch):
+    def prompt(*args):
+        raise AssertionError("a non-interactive provider prompted for input")
+
+    monkeypatch.setattr("builtins.input", prompt)
+
+
+def make_provider(tmp_path, authority: StubAuthority) -> TokenProvider:
+    (tmp_path / "refresh_token.txt").write_text("rt-0")
+    return TokenProvider(
+        CLIENT_ID,
+        "secret",
+        ["User.Read", "Mail.ReadWrite"],
+        authority=AUTHORITY,
+        cache_path=str(tmp_path / "token_cache.json"),
+        refresh_token_path=str(tmp_path / "refresh_token.txt"),
+        http_client=authority,
+    )
+
+
+def test_cached_token_is_served_without_the_authority(tmp_path, no_prompt):
+    authority = StubAuthority()
+    provider = make_provider(tmp_path, authority)
+
+    assert provider.get_token() == "at-1"
+    assert provider.get_token() == "at-1"
+    assert authority.grants == ["refresh_token"]
+    assert (tmp_path / "token_cache.json").exists()
+
+    # a new process starts from the persisted cache, not refresh_token.txt
+    (tmp_path / "refresh_token.txt").unlink()
+    assert make_provider(tmp_path, authority).get_token() == "at-1"
+    assert authority.grants == ["refresh_token"]
+
+
+def test_expiring_token_is_refreshed_silently(tmp_path, no_prompt):
+    # shorter-lived than the expiry skew, so every call has to refresh
+    authority = StubAuthority(expires_in=ms_graph.TOKEN_EXPIRY_SKEW_SECONDS // 2)
+    provider = make_provider(tmp_path, authority)
+
+    assert provider.get_token() == "at-1"
+    (tmp_path / "refresh_token.txt").unlink()  # so at-2 can only come from the cached refresh token
+    assert provider.get_token() == "at-2"
+    assert authority.grants == ["refresh_token", "refresh_token"]
+
+
+def test_failed_refresh_asks_for_reauth_instead_of_prompting(tmp_path, no_prompt):
+    authority = StubAuthority(expires_in=ms_graph.TOKEN_EXPIRY_SKEW_SECONDS // 2)
+    provider = make_provider(tmp_path, authority)
+    assert provider.get_token() == "at-1"
+
+    authority.valid_refresh_tokens.clear()  # e.g. the user revoked the app
+    (tmp_path / "refresh_token.txt").unlink()
+    with pytest.raises(ReauthRequired):
+        provider.get_token()
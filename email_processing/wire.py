@@ -0,0 +1,136 @@
+# wire.py
+
+import os
+import gzip
+import hashlib
+from typing import Any, Dict, Optional, Set
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# ==========================
+# Config
+# ==========================
+
+# Smaller bodies are sent as they are (compression wouldn't win back its own overhead)
+WIRE_COMPRESS_MIN_BYTES = int(os.getenv("WIRE_COMPRESS_MIN_BYTES", "1024"))
+WIRE_GZIP_LEVEL = int(os.getenv("WIRE_GZIP_LEVEL", "5"))
+WIRE_BROTLI_QUALITY = int(os.getenv("WIRE_BROTLI_QUALITY", "4"))
+
+# Part of every ETag: bump when the bytes for the same data change (compact_email, encoding)
+WIRE_SCHEMA_VERSION = 1
+
+VIEWS = ("compact", "full")
+# analysis keys the compact view drops: copies of top-level fields, and the bulky
+# raw entity list (fields=analysis.raw_entities or view=full still return it)
+COMPACT_DROPPED_ANALYSIS = frozenset({"subject", "senderEmail", "receivedAt", "raw_entities"})
+
+
+# ==========================
+# Wire schema
+# ==========================
+
+def compact_email(email: Dict[str, Any]) -> Dict[str, Any]:
+    """An email record without the analysis keys in COMPACT_DROPPED_ANALYSIS (a shallow copy)."""
+    analysis = email.get("analysis")
+    if not isinstance(analysis, dict):
+        return email
+    # copy + pop: a few C-level calls, cheaper than filtering every key in Python
+    analysis = analysis.copy()
+    for key in COMPACT_DROPPED_ANALYSIS:
+        analysis.pop(key, None)
+    compact = email.copy()
+    compact["analysis"] = analysis
+    return compact
+
+
+# ==========================
+# Content negotiation
+# ==========================
+
+def _accepted_encodings(request: Request) -> Set[str]:
+    """Codings in Accept-Encoding, minus the ones refused with q=0."""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        refused = False
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    refused = float(value) == 0
+                except ValueError:
+                    pass
+        if coding and not refused:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def content_encoding(request: Request) -> Optional[str]:
+    """The compression this client gets for bodies over WIRE_COMPRESS_MIN_BYTES: br, gzip or None."""
+    accepted = _accepted_encodings(request)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+# ==========================
+# Conditional GETs
+# ==========================
+
+def make_etag(version: int, request: Request) -> str:
+    """
+    Strong ETag for a response built from the store at version: the same version, path,
+    query and encoding always give the same bytes, so it changes only when they can.
+    """
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    encoding = content_encoding(request)
+    level = {"br": WIRE_BROTLI_QUALITY, "gzip": WIRE_GZIP_LEVEL}.get(encoding)
+    variant = f"{WIRE_SCHEMA_VERSION}\0{request.url.path}\0{query}\0{encoding}{level}"
+    return f'"{version}-{hashlib.blake2b(variant.encode("utf-8"), digest_size=8).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match names etag (weak comparison, as RFC 9110 asks for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """304 with no body: the client's copy for etag is still current."""
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+
+# ==========================
+# Responses
+# ==========================
+
+def json_response(request: Request, content: Any, etag: Optional[str] = None) -> Response:
+    """
+    content as JSON via orjson, returned as a ready Response so FastAPI skips its
+    jsonable_encoder walk; compressed when the client accepts it and the body is big enough.
+    """
+    body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag is not None:
+        headers["ETag"] = etag
+    encoding = content_encoding(request) if len(body) >= WIRE_COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=WIRE_BROTLI_QUALITY)
+    elif encoding == "gzip":
+        # mtime=0: the same content always compresses to the same bytes (strong ETag)
+        body = gzip.compress(body, compresslevel=WIRE_GZIP_LEVEL, mtime=0)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)